@@ -2,6 +2,34 @@ from abc import ABC, abstractmethod
 import numpy as np
 
 
+def unit_vectors(angles_deg):
+    """计算一组角度（度）对应的单位向量，返回形状为 (N, 2) 的数组"""
+    angles_rad = np.deg2rad(np.asarray(angles_deg, dtype=np.float64))
+    return np.stack((np.cos(angles_rad), np.sin(angles_rad)), axis=-1)
+
+
+def rotate_unit_vectors(units, rotation_angle):
+    """把预先计算好的单位向量整体旋转rotation_angle度"""
+    if not rotation_angle:
+        return units
+    angle_rad = np.deg2rad(rotation_angle)
+    c, s = np.cos(angle_rad), np.sin(angle_rad)
+    rotation = np.array([[c, s], [-s, c]])
+    return units @ rotation
+
+
+def project(cx, cy, units, radius):
+    """按半径把单位向量投影到以(cx, cy)为中心的点，radius可以是标量或数组"""
+    radius = np.asarray(radius, dtype=np.float64)
+    if radius.ndim:
+        radius = radius[:, np.newaxis]
+    return np.array([cx, cy], dtype=np.float64) + units * radius
+
+
+# 周天360度刻度的单位向量（每度一条）
+DEGREE_UNIT_VECTORS = unit_vectors(np.arange(360))
+
+
 class CompassBase(ABC):
     """罗盘基类"""
     
@@ -11,6 +39,9 @@ class CompassBase(ABC):
         self.initial_offset = None
         self.labels = None
         self.num_sectors = None
+        self._unit_vectors_key = None
+        self._line_units = None
+        self._label_units = None
     
     @abstractmethod
     def get_sector_angle(self):
@@ -47,4 +78,28 @@ class CompassBase(ABC):
         label_angle_rad = np.deg2rad(label_angle_deg)
         label_x = cx + text_distance * np.cos(label_angle_rad)
         label_y = cy + text_distance * np.sin(label_angle_rad)
-        return label_x, label_y
\ No newline at end of file
+        return label_x, label_y
+    
+    def get_unit_vectors(self):
+        """获取未旋转时各扇区分割线和标签方向的单位向量（按罗盘参数缓存）"""
+        key = (self.sector_angle, self.initial_offset, self.num_sectors)
+        if self._unit_vectors_key != key:
+            angles = np.arange(self.num_sectors) * self.sector_angle + self.initial_offset
+            self._line_units = unit_vectors(angles)
+            self._label_units = unit_vectors(angles + self.sector_angle / 2)
+            self._unit_vectors_key = key
+        return self._line_units, self._label_units
+    
+    def calculate_geometry(self, cx, cy, line_length, text_distance, rotation_angle=None):
+        """一次计算所有扇区的分割线终点和标签位置
+        
+        Returns:
+            dict: line_ends 为 (N, 2) 的分割线终点数组，label_positions 为 (N, 2) 的标签位置数组
+        """
+        if rotation_angle is None:
+            rotation_angle = self.rotation_angle
+        line_units, label_units = self.get_unit_vectors()
+        return {
+            'line_ends': project(cx, cy, rotate_unit_vectors(line_units, rotation_angle), line_length),
+            'label_positions': project(cx, cy, rotate_unit_vectors(label_units, rotation_angle), text_distance),
+        }
@@ -1,3 +1,5 @@
+import copy
+
 from .compass_xuankongda import CompassXuankongda
 from .compass12 import Compass12
 from .compass24 import Compass24
@@ -57,4 +59,15 @@ class CompassManager:
     
     def get_compass_type(self):
         """获取当前罗盘类型"""
-        return self.compass_type
\ No newline at end of file
+        return self.compass_type
+    
+    def snapshot(self):
+        """复制当前罗盘状态（类型、旋转角度、附加罗盘开关），之后对本管理器的修改不影响副本
+        
+        后台渲染在主线程提交时取得副本，渲染过程中不读取可能正被主线程修改的罗盘对象。
+        """
+        snapshot = copy.copy(self)
+        snapshot.current_compass = copy.copy(self.current_compass)
+        snapshot.compass28 = copy.copy(self.compass28)
+        snapshot.compass_xuankongda = copy.copy(self.compass_xuankongda)
+        return snapshot
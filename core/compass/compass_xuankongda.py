@@ -1,6 +1,8 @@
 import numpy as np
 import math
 
+from .base import DEGREE_UNIT_VECTORS, project, rotate_unit_vectors, unit_vectors
+
 class CompassXuankongda:
     """玄空大卦罗盘"""
     
@@ -106,6 +108,14 @@ class CompassXuankongda:
             
             self.inner_element_labels.append(element)
             self.inner_element_angles.append(angle)
+        
+        # 卦位和卦间分隔线方向的单位向量，旋转时复用
+        angles = np.array(self.outer_hexagram_angles)
+        # 相邻两卦的中间角度（按角度差计算，跨越0度时也正确）
+        next_angles = np.roll(angles, -1)
+        delta = (next_angles - angles + 180) % 360 - 180
+        self.hexagram_units = unit_vectors(angles)
+        self.divider_units = unit_vectors(angles + delta / 2)
     
     def get_labels(self):
         """获取所有标签（兼容旧接口）"""
@@ -121,4 +131,31 @@ class CompassXuankongda:
     
     def calculate_cumulative_angles(self):
         """计算累积角度（兼容旧接口）"""
-        return self.outer_hexagram_angles + self.middle_fortune_angles + self.inner_element_angles
\ No newline at end of file
+        return self.outer_hexagram_angles + self.middle_fortune_angles + self.inner_element_angles
+    
+    def calculate_ring_geometry(self, cx, cy, tick_radii, label_radii, divider_radii, rotation_angle=None):
+        """一次计算玄空大卦三圈的刻度线、标签位置和卦间分隔线
+        
+        Args:
+            cx, cy: 圆心
+            tick_radii: 各圈刻度线的 (内半径, 外半径) 列表，每圈360条刻度
+            label_radii: 各圈标签的半径列表，每圈64个标签
+            divider_radii: 分隔线的 (内半径, 外半径)
+            rotation_angle: 旋转角度，默认使用罗盘当前角度
+        
+        Returns:
+            dict: tick_starts/tick_ends 为 (圈数, 360, 2)，label_positions 为 (圈数, 64, 2)，
+                  divider_starts/divider_ends 为 (64, 2)
+        """
+        if rotation_angle is None:
+            rotation_angle = self.rotation_angle
+        degree_units = rotate_unit_vectors(DEGREE_UNIT_VECTORS, rotation_angle)
+        hexagram_units = rotate_unit_vectors(self.hexagram_units, rotation_angle)
+        divider_units = rotate_unit_vectors(self.divider_units, rotation_angle)
+        return {
+            'tick_starts': np.array([project(cx, cy, degree_units, inner) for inner, outer in tick_radii]),
+            'tick_ends': np.array([project(cx, cy, degree_units, outer) for inner, outer in tick_radii]),
+            'label_positions': np.array([project(cx, cy, hexagram_units, radius) for radius in label_radii]),
+            'divider_starts': project(cx, cy, divider_units, divider_radii[0]),
+            'divider_ends': project(cx, cy, divider_units, divider_radii[1]),
+        }
@@ -1,4 +1,6 @@
-from .base import CompassBase
+import numpy as np
+
+from .base import CompassBase, project, rotate_unit_vectors, unit_vectors
 
 
 class Compass28(CompassBase):
@@ -35,6 +37,10 @@ class Compass28(CompassBase):
             16, 12, 14, 11, 16, 2, 9,
             33, 4, 15, 7, 18, 18, 17
         ]
+        
+        # 宿分割线（起始角度转换到图像坐标系）和标签方向的单位向量，旋转时复用
+        self.divider_units = unit_vectors(np.array(self.start_angles) - 90)
+        self.label_units = unit_vectors(self.label_angles)
     
     def get_sector_angle(self):
         return self.sector_angle
@@ -58,3 +64,20 @@ class Compass28(CompassBase):
         for degree in self.degrees:
             cumulative.append(cumulative[-1] + degree)
         return cumulative[:-1]
+    
+    def calculate_ring_geometry(self, cx, cy, inner_radius, outer_radius, label_radius, rotation_angle=None):
+        """一次计算28宿圈所有分割线端点和标签位置
+        
+        Returns:
+            dict: divider_starts/divider_ends 为 (28, 2) 的分割线内外端点，
+                  label_positions 为 (28, 2) 的标签位置
+        """
+        if rotation_angle is None:
+            rotation_angle = self.rotation_angle
+        divider_units = rotate_unit_vectors(self.divider_units, rotation_angle)
+        label_units = rotate_unit_vectors(self.label_units, rotation_angle)
+        return {
+            'divider_starts': project(cx, cy, divider_units, inner_radius),
+            'divider_ends': project(cx, cy, divider_units, outer_radius),
+            'label_positions': project(cx, cy, label_units, label_radius),
+        }
@@ -0,0 +1,96 @@
+import os
+import re
+
+# 支持浏览的图像扩展名
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+_DIGITS = re.compile(r'(\d+)')
+
+
+def natural_sort_key(name):
+    """自然排序键：文件名中的数字按数值比较（plan2排在plan10之前），字母不区分大小写"""
+    parts = [(0, int(part), '') if part.isdigit() else (1, 0, part.casefold())
+             for part in _DIGITS.split(name) if part]
+    # 只有大小写或前导零不同的文件名按原文件名排序，保证顺序稳定
+    return parts, name
+
+
+class DirectoryIndex:
+    """一个目录中图像文件的索引
+
+    文件按自然顺序排序并建立文件名到位置的字典，查找上一张、下一张或跳转N张都是O(1)。
+    每次查询前只检查一次目录的修改时间（一次stat），目录内容变化（增删文件会改变目录修改时间）
+    或查询的文件不在索引中时才重新列目录。
+    """
+
+    def __init__(self, dir_path, extensions=IMAGE_EXTENSIONS):
+        self.dir_path = dir_path
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.files = []
+        self.positions = {}
+        self.mtime = None
+        self.scan_count = 0
+
+    def __len__(self):
+        self.refresh()
+        return len(self.files)
+
+    def refresh(self, force=False):
+        """目录修改时间变化（或force为True）时重新列目录，返回是否重新列了目录"""
+        try:
+            mtime = os.stat(self.dir_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if not force and mtime == self.mtime and self.mtime is not None:
+            return False
+
+        try:
+            names = [name for name in os.listdir(self.dir_path) if name.lower().endswith(self.extensions)]
+        except OSError as e:
+            print(f"读取目录失败: {e}")
+            names = []
+        names.sort(key=natural_sort_key)
+        self.files = names
+        self.positions = {name: i for i, name in enumerate(names)}
+        self.mtime = mtime
+        self.scan_count += 1
+        return True
+
+    def index_of(self, path):
+        """文件在目录中的位置，不在目录中时返回None"""
+        name = os.path.basename(path)
+        self.refresh()
+        if name not in self.positions:
+            # 修改时间精度不足时可能错过刚加入的文件，找不到时再强制列一次
+            self.refresh(force=True)
+        return self.positions.get(name)
+
+    def path_at(self, index):
+        """第index个文件的完整路径，越界时返回None"""
+        self.refresh()
+        if 0 <= index < len(self.files):
+            return os.path.join(self.dir_path, self.files[index])
+        return None
+
+    def neighbour(self, path, offset):
+        """相对path跳转offset张（超出范围时停在第一张或最后一张）
+
+        Returns:
+            str: 目标文件路径，path不在目录中或已经在边界上时返回None
+        """
+        index = self.index_of(path)
+        if index is None:
+            return None
+        target = min(max(index + offset, 0), len(self.files) - 1)
+        if target == index:
+            return None
+        return self.path_at(target)
+
+    def first(self):
+        """第一个文件的路径，目录中没有图像时返回None"""
+        return self.path_at(0)
+
+    def last(self):
+        """最后一个文件的路径，目录中没有图像时返回None"""
+        self.refresh()
+        return self.path_at(len(self.files) - 1)
@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+
+# 线段绘制列表的结构化数据类型：起点、终点、颜色（BGRA）和线宽
+SEGMENT_DTYPE = np.dtype([
+    ('x1', np.float64),
+    ('y1', np.float64),
+    ('x2', np.float64),
+    ('y2', np.float64),
+    ('color', np.uint8, (4,)),
+    ('thickness', np.int32),
+])
+
+
+def empty_segments():
+    """创建空的线段列表"""
+    return np.empty(0, dtype=SEGMENT_DTYPE)
+
+
+def make_segments(starts, ends, color, thickness):
+    """用起点和终点数组创建同一样式的线段列表
+
+    Args:
+        starts: 形状为 (N, 2) 的起点数组
+        ends: 形状为 (N, 2) 的终点数组
+        color: 颜色（BGR或BGRA）
+        thickness: 线宽（像素）
+
+    Returns:
+        SEGMENT_DTYPE结构化数组
+    """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    segments = np.empty(len(starts), dtype=SEGMENT_DTYPE)
+    segments['x1'] = starts[:, 0]
+    segments['y1'] = starts[:, 1]
+    segments['x2'] = ends[:, 0]
+    segments['y2'] = ends[:, 1]
+    segments['color'] = tuple(color)[:3] + (255,) if len(color) == 3 else tuple(color)
+    segments['thickness'] = int(thickness)
+    return segments
+
+
+def concat_segments(*segment_lists):
+    """合并多个线段列表（保持顺序）"""
+    segment_lists = [segments for segments in segment_lists if len(segments)]
+    if not segment_lists:
+        return empty_segments()
+    return np.concatenate(segment_lists)
+
+
+def scaled_thickness(thickness, scale):
+    """按缩放比例换算线宽（至少1像素）"""
+    if scale == 1.0:
+        return int(thickness)
+    return max(1, int(round(thickness * scale)))
+
+
+def scale_segments(segments, scale, origin=(0, 0)):
+    """把线段列表换算到缩小或裁剪后的图像上：坐标先减去origin再乘以scale，线宽按比例缩放
+
+    用于在预览图或可见区域上绘制，返回新的线段列表。
+    """
+    if (scale == 1.0 and origin == (0, 0)) or len(segments) == 0:
+        return segments
+    scaled = segments.copy()
+    ox, oy = origin
+    for field, offset in (('x1', ox), ('y1', oy), ('x2', ox), ('y2', oy)):
+        scaled[field] = (scaled[field] - offset) * scale
+    if scale != 1.0:
+        scaled['thickness'] = np.maximum(1, np.round(segments['thickness'] * scale)).astype(np.int32)
+    return scaled
+
+
+def render_segments(img, segments):
+    """按样式分组绘制线段列表，每组样式只调用一次cv2.polylines
+
+    各组按样式首次出现的顺序绘制，以保持后画的样式覆盖先画的样式。
+    坐标按int()的方式截断为整数像素。
+    """
+    if len(segments) == 0:
+        return img
+
+    colors = segments['color'].astype(np.int64)
+    style_keys = ((colors[:, 0] << 24) | (colors[:, 1] << 16) | (colors[:, 2] << 8) | colors[:, 3]) << 16
+    style_keys |= segments['thickness'].astype(np.int64)
+    unique_keys, first_index, inverse = np.unique(style_keys, return_index=True, return_inverse=True)
+
+    points = np.stack(
+        (segments['x1'], segments['y1'], segments['x2'], segments['y2']), axis=-1
+    ).astype(np.int32).reshape(-1, 2, 2)
+
+    channels = img.shape[2] if img.ndim == 3 else 1
+    for group in np.argsort(first_index):
+        index = first_index[group]
+        color = tuple(int(c) for c in segments['color'][index][:channels])
+        thickness = int(segments['thickness'][index])
+        group_points = points[inverse.reshape(-1) == group]
+        cv2.polylines(img, list(group_points), False, color, thickness)
+    return img
@@ -0,0 +1,177 @@
+import zlib
+
+import numpy as np
+
+# 默认历史记录内存上限（字节）
+DEFAULT_HISTORY_BYTES = 64 * 1024 * 1024
+
+
+def union_rect(a, b):
+    """两个矩形 (x0, y0, x1, y1) 的外接矩形，任一为None时返回另一个"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+class Patch:
+    """图像上一个矩形区域的像素（可选zlib压缩）"""
+
+    def __init__(self, pixels, compress_level=None):
+        self.shape = pixels.shape
+        self.dtype = pixels.dtype
+        data = np.ascontiguousarray(pixels)
+        if compress_level is not None:
+            self.data = zlib.compress(data.tobytes(), compress_level)
+        else:
+            self.data = data.copy()
+        self.compressed = compress_level is not None
+
+    @property
+    def nbytes(self):
+        return len(self.data) if self.compressed else self.data.nbytes
+
+    def pixels(self):
+        """解压后的像素数组"""
+        if not self.compressed:
+            return self.data
+        return np.frombuffer(zlib.decompress(self.data), dtype=self.dtype).reshape(self.shape)
+
+
+class EditHistory:
+    """基于脏矩形补丁的撤销/重做历史
+
+    每次编辑（例如一笔画笔）只保存它修改过的各个矩形区域在编辑前后的像素（不合并为外接矩形，
+    斜向或很长的一笔也只保存笔画经过的区域），撤销/重做只写回这些区域，耗时与补丁大小成正比，与图像大小无关。
+    历史记录按字节数而不是条数限制，超出max_bytes时丢弃最早的撤销记录。
+
+    用法：begin()开始一次编辑，每次修改图像前用record(img, rect)保存将被修改区域的原像素，
+    修改完成后用commit(img)把本次编辑的各个补丁提交为一条历史记录。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_HISTORY_BYTES, compress_level=1):
+        """
+        Args:
+            max_bytes: 历史记录（撤销和重做）占用内存的上限（字节）
+            compress_level: zlib压缩级别，None表示不压缩
+        """
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.undo_stack = []
+        self.redo_stack = []
+        self._pending = None
+
+    @property
+    def nbytes(self):
+        """撤销和重做记录占用的字节数"""
+        return sum(entry['nbytes'] for entry in self.undo_stack + self.redo_stack)
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    @property
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    @property
+    def in_edit(self):
+        """是否有尚未提交的编辑"""
+        return self._pending is not None
+
+    def begin(self):
+        """开始一次编辑（已有未提交的编辑时继续使用它）"""
+        if self._pending is None:
+            self._pending = []
+
+    def record(self, img, rect):
+        """在修改img的rect (x0, y0, x1, y1) 区域之前保存该区域的原像素（不在编辑中时什么也不做）"""
+        if self._pending is None or rect is None:
+            return
+        x0, y0, x1, y1 = rect
+        self._pending.append((rect, img[y0:y1, x0:x1].copy()))
+
+    def commit(self, img):
+        """提交本次编辑：每次记录的矩形保存一对编辑前后的补丁
+
+        编辑前的补丁为记录时的原像素，编辑后的补丁为提交时（编辑后）该区域的像素；
+        撤销时按相反顺序写回编辑前的补丁，重做时按顺序写回编辑后的补丁。
+        没有记录任何修改时不产生历史记录。
+
+        Returns:
+            dict: 新的历史记录，没有修改时返回None
+        """
+        pending, self._pending = self._pending, None
+        if not pending:
+            return None
+
+        rect = None
+        patches = []
+        for record_rect, pixels in pending:
+            x0, y0, x1, y1 = record_rect
+            rect = union_rect(rect, record_rect)
+            patches.append((record_rect, Patch(pixels, self.compress_level),
+                            Patch(img[y0:y1, x0:x1], self.compress_level)))
+
+        entry = {'rect': rect, 'patches': patches}
+        entry['nbytes'] = sum(before.nbytes + after.nbytes for _, before, after in patches)
+        self.undo_stack.append(entry)
+        self.redo_stack = []
+        self._enforce_budget()
+        return entry
+
+    def _enforce_budget(self):
+        """超出内存上限时丢弃最早的撤销记录（至少保留最新一条）"""
+        total = self.nbytes
+        while total > self.max_bytes and len(self.undo_stack) > 1:
+            total -= self.undo_stack.pop(0)['nbytes']
+
+    def _apply(self, img, entry, undo):
+        """写回一条历史记录的补丁（撤销时按相反顺序写回编辑前的像素），返回补丁的外接矩形"""
+        patches = reversed(entry['patches']) if undo else entry['patches']
+        for (x0, y0, x1, y1), before, after in patches:
+            img[y0:y1, x0:x1] = (before if undo else after).pixels()
+        return entry['rect']
+
+    def undo(self, img):
+        """把最近一次编辑前的像素写回img
+
+        Returns:
+            tuple: 被恢复的矩形区域，没有可撤销的记录时返回None
+        """
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        self.redo_stack.append(entry)
+        return self._apply(img, entry, undo=True)
+
+    def redo(self, img):
+        """重新应用最近一次被撤销的编辑
+
+        Returns:
+            tuple: 被修改的矩形区域，没有可重做的记录时返回None
+        """
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.undo_stack.append(entry)
+        return self._apply(img, entry, undo=False)
+
+    def undo_all(self, img):
+        """撤销全部编辑并清空历史记录
+
+        Returns:
+            tuple: 被恢复区域的外接矩形，没有编辑时返回None
+        """
+        rect = None
+        while self.undo_stack:
+            rect = union_rect(rect, self.undo(img))
+        self.clear()
+        return rect
+
+    def clear(self):
+        """清空历史记录（图像被整体替换时调用）"""
+        self.undo_stack = []
+        self.redo_stack = []
+        self._pending = None
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# 罗盘文字使用的中文字体
+FONT_PATH = 'C:\\Windows\\Fonts\\simhei.ttf'
+
+
+def load_font(font_size):
+    """加载中文字体，失败时使用默认字体"""
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype(FONT_PATH, font_size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+class GlyphAtlas:
+    """罗盘标签图集
+
+    罗盘的标签集合是固定的（24山、12支、28宿、64卦名、卦运数字、度数），
+    每种（标签、字号、文字颜色、圆形背景样式）只用PIL光栅化一次，
+    得到一个小的预乘BGRA精灵图，之后直接用NumPy切片贴到叠加层上。
+    图集按需填充，超过容量时淘汰最久未使用的精灵图。
+    """
+
+    def __init__(self, max_sprites=1024):
+        self.max_sprites = max_sprites
+        self._sprites = OrderedDict()
+        self._fonts = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._sprites)
+
+    def clear(self):
+        """清空图集"""
+        self._sprites.clear()
+        self._fonts.clear()
+
+    def get_font(self, font_size):
+        """获取指定字号的字体（同一字号只加载一次）"""
+        font = self._fonts.get(font_size)
+        if font is None:
+            font = load_font(font_size)
+            self._fonts[font_size] = font
+        return font
+
+    def get_sprite(self, label, font_size, fill, background=None, outline=None, outline_width=0):
+        """获取标签精灵图
+
+        Args:
+            label: 文字
+            font_size: 字号
+            fill: 文字颜色（BGR）
+            background: 圆形背景颜色（BGR），None表示不画背景
+            outline: 圆形边框颜色（BGR），None表示不画边框
+            outline_width: 圆形边框宽度
+
+        Returns:
+            tuple: (sprite, offset_x, offset_y)，sprite为预乘alpha的BGRA数组，
+                   offset为精灵图左上角相对标签中心的偏移
+        """
+        key = (label, font_size, tuple(fill),
+               tuple(background) if background is not None else None,
+               tuple(outline) if outline is not None else None,
+               outline_width)
+        entry = self._sprites.get(key)
+        if entry is not None:
+            self._sprites.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = self._rasterize(*key)
+        self._sprites[key] = entry
+        if len(self._sprites) > self.max_sprites:
+            self._sprites.popitem(last=False)
+        return entry
+
+    def _rasterize(self, label, font_size, fill, background, outline, outline_width):
+        """用PIL把一个标签光栅化成精灵图"""
+        from PIL import Image as PILImage, ImageDraw
+
+        font = self.get_font(font_size)
+        bbox = font.getbbox(label)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        text_x = -(text_width // 2)
+        text_y = -(text_height // 2)
+
+        # 计算圆形半径（比文字稍大）
+        radius = max(text_width, text_height) // 2 + 5
+
+        # 精灵图覆盖圆形背景和文字的并集
+        x0 = min(-radius, text_x + bbox[0])
+        y0 = min(-radius, text_y + bbox[1])
+        x1 = max(radius, text_x + bbox[2]) + 1
+        y1 = max(radius, text_y + bbox[3]) + 1
+
+        # 圆形背景、边框和文字分别绘制成灰度遮罩，再按顺序合成为预乘alpha的精灵图
+        size = (x1 - x0, y1 - y0)
+        circle = (-radius - x0, -radius - y0, radius - x0, radius - y0)
+        layers = []
+        if background is not None:
+            mask = PILImage.new('L', size, 0)
+            ImageDraw.Draw(mask).ellipse(circle, fill=255)
+            layers.append((mask, background))
+        if outline is not None:
+            mask = PILImage.new('L', size, 0)
+            ImageDraw.Draw(mask).ellipse(circle, outline=255, width=outline_width)
+            layers.append((mask, outline))
+        mask = PILImage.new('L', size, 0)
+        ImageDraw.Draw(mask).text((text_x - x0, text_y - y0), label, font=font, fill=255)
+        layers.append((mask, fill))
+
+        premultiplied = np.zeros((size[1], size[0], 4), dtype=np.float32)
+        for mask, color in layers:
+            coverage = np.asarray(mask, dtype=np.float32)[:, :, np.newaxis] / 255.0
+            ink = np.array(tuple(color) + (255,), dtype=np.float32)
+            premultiplied = ink * coverage + premultiplied * (1.0 - coverage)
+
+        sprite = np.round(premultiplied).astype(np.uint8)
+        sprite.flags.writeable = False
+        return sprite, x0, y0
+
+
+def stamp_sprite(layer, sprite, x, y):
+    """把预乘alpha的BGRA精灵图按alpha叠加到BGRA叠加层的(x, y)处（原地修改）"""
+    layer_height, layer_width = layer.shape[:2]
+    sprite_height, sprite_width = sprite.shape[:2]
+    dx0, dy0 = max(x, 0), max(y, 0)
+    dx1, dy1 = min(x + sprite_width, layer_width), min(y + sprite_height, layer_height)
+    if dx0 >= dx1 or dy0 >= dy1:
+        return
+
+    src = sprite[dy0 - y:dy1 - y, dx0 - x:dx1 - x].astype(np.uint16)
+    dst = layer[dy0:dy1, dx0:dx1]
+    inv_alpha = 255 - src[:, :, 3:4]
+    blended = src + (dst.astype(np.uint16) * inv_alpha + 127) // 255
+    dst[:, :, :] = np.minimum(blended, 255).astype(np.uint8)
+
+
+# 所有罗盘圈共享的标签图集
+_shared_atlas = None
+
+
+def get_glyph_atlas():
+    """获取共享的标签图集"""
+    global _shared_atlas
+    if _shared_atlas is None:
+        _shared_atlas = GlyphAtlas()
+    return _shared_atlas
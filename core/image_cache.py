@@ -0,0 +1,173 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 预处理图像缓存的默认内存上限（字节）
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def image_cache_key(path, *params):
+    """缓存键：绝对路径、文件修改时间和大小，加上影响预处理结果的参数；文件不存在时返回None"""
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_mtime_ns, stat.st_size) + params
+
+
+class ImageCache:
+    """按字节数限制的LRU图像缓存（线程安全）
+
+    条目为预处理结果（dict），大小为其中所有numpy数组的字节数之和，
+    超出max_bytes时丢弃最久未使用的条目。hits/misses记录查询命中情况。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    @property
+    def hit_ratio(self):
+        """命中率（没有查询时为0）"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key):
+        """查询缓存，命中时把条目移到最近使用的位置，未命中返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """加入缓存（单个条目超过上限时不缓存）"""
+        size = sum(value.nbytes for value in entry.values() if hasattr(value, 'nbytes'))
+        if key is None or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old['_nbytes']
+            entry['_nbytes'] = size
+            self._entries[key] = entry
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted['_nbytes']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """缓存统计：条目数、占用字节数、命中数、未命中数和命中率"""
+        return {'entries': len(self._entries), 'bytes': self.nbytes, 'hits': self.hits,
+                'misses': self.misses, 'hit_ratio': self.hit_ratio}
+
+
+class ImagePrefetcher:
+    """在后台线程预先读取并预处理相邻图像，结果放入ImageCache
+
+    prepare_func(path)在工作线程执行，返回预处理结果（dict）或None（读取失败或不适合缓存）；
+    key_func(path)返回缓存键。正在预取的图像被前台请求时等待预取完成，不重复读取；
+    还在排队的预取则被取消，由前台直接读取。其他后台任务（例如写磁盘缓存）在单独的线程执行，
+    不会挡在预取前面。
+    """
+
+    def __init__(self, prepare_func, key_func, cache=None, radius=1):
+        """
+        Args:
+            prepare_func: 预处理函数，参数为图像路径
+            key_func: 缓存键函数，参数为图像路径
+            cache: ImageCache，None表示新建
+            radius: 预取当前图像前后各几张
+        """
+        self.prepare_func = prepare_func
+        self.key_func = key_func
+        self.cache = cache if cache is not None else ImageCache()
+        self.radius = radius
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        self._task_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch-task')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _prepare(self, key, path):
+        try:
+            entry = self.prepare_func(path)
+            if entry is not None:
+                self.cache.put(key, entry)
+            return entry
+        except Exception as e:
+            print(f"预取图像失败: {path}: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def prefetch(self, paths):
+        """在后台预取尚未缓存的图像（按给定顺序），返回提交的数量"""
+        submitted = 0
+        for path in paths:
+            key = self.key_func(path)
+            if key is None or key in self.cache:
+                continue
+            with self._lock:
+                if key in self._pending:
+                    continue
+                self._pending[key] = self._executor.submit(self._prepare, key, path)
+            submitted += 1
+        return submitted
+
+    def get(self, path):
+        """获取预处理结果：缓存命中直接返回，正在预取则等待预取完成，还在排队的预取被取消
+
+        Returns:
+            dict: 预处理结果，未缓存也未在进行预取（或预取失败）时返回None
+        """
+        key = self.key_func(path)
+        if key is None:
+            return None
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            if future.cancel():
+                # 还没开始：不排在其他预取后面等待，由调用方直接读取
+                with self._lock:
+                    if self._pending.get(key) is future:
+                        del self._pending[key]
+            else:
+                # 等待正在进行的预取（比重新读取快），完成后结果已在缓存中
+                future.result()
+        return self.cache.get(key)
+
+    def submit(self, func, *args):
+        """在后台执行其他任务（单独的线程，按提交顺序执行，不占用预取线程），出错时只打印不抛出"""
+        def run():
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"后台任务出错: {e}")
+        return self._task_executor.submit(run)
+
+    def shutdown(self):
+        """丢弃尚未开始的预取和后台任务并关闭工作线程"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._task_executor.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,101 @@
 import cv2
 import numpy as np
 from core.compass.compass_manager import CompassManager
+from core.compass.base import DEGREE_UNIT_VECTORS, project, rotate_unit_vectors
+from core.draw_list import concat_segments, empty_segments, make_segments
+from core.edit_history import EditHistory
+from core.segmentation import (brush_dirty_rect, classify_background, find_outline, find_outline_proxy,
+                               find_outline_pyramid, make_threshold_proxy, update_outline_roi)
+from core.tiled_image import TILE_SIZE, TiledImage
 import os
+import threading
+
+# 降分辨率解码的缩小倍数和对应的OpenCV读取标志
+# （只用于JPEG：解码时直接按DCT缩小，不生成原尺寸图像；其他格式OpenCV仍会先完整解码）
+REDUCED_DECODE_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+# 裁剪空白：灰度大于此值的像素为内容
+CROP_THRESHOLD = 10
+# 快速裁剪时抽样小图的最长边
+CROP_DETECT_SIZE = 1024
+
+
+def probe_image_size(image_path):
+    """只读取图像文件头获取尺寸和格式
+
+    Returns:
+        tuple: ((width, height), 格式名如'JPEG')，无法识别时返回None
+    """
+    from PIL import Image as PILImage
+    try:
+        with PILImage.open(image_path) as img:
+            return img.size, img.format
+    except Exception:
+        return None
+
+
+def content_mask(img):
+    """内容像素（灰度大于CROP_THRESHOLD）的布尔掩码"""
+    if img.size == 0:
+        return np.zeros(img.shape[:2], dtype=bool)
+    if img.ndim == 2:
+        return img > CROP_THRESHOLD
+    return cv2.cvtColor(np.ascontiguousarray(img), cv2.COLOR_BGR2GRAY) > CROP_THRESHOLD
+
+
+def find_content_bbox(img, detect_size=CROP_DETECT_SIZE):
+    """所有内容像素的边界框（快速）
+
+    先在按步长抽样（最长边约detect_size）的小图上用行列投影找出粗略边界框，
+    再只在原分辨率下检查四条边外侧一个步长宽的条带，条带中有内容就把边界扩到那里并继续检查，
+    直到四个条带都没有内容，不对整幅原图做灰度转换和阈值化。
+    与粗略边界框不相连、比步长还细且不在抽样行列上的孤立内容会被忽略。
+
+    Returns:
+        tuple: (x, y, w, h)，没有内容时返回None
+    """
+    height, width = img.shape[:2]
+    step = max(1, max(height, width) // detect_size)
+    if step > 1:
+        # 整数倍最近邻缩小即取第0、step、2*step……行列的像素，比numpy跨步复制快
+        sample = cv2.resize(img[:height // step * step, :width // step * step], (width // step, height // step),
+                            interpolation=cv2.INTER_NEAREST)
+    else:
+        sample = img
+    mask = content_mask(sample)
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return None
+    # 抽样点上已确认有内容的边界（原分辨率坐标，x1、y1不含）
+    y0, y1 = int(rows[0]) * step, int(rows[-1]) * step + 1
+    x0, x1 = int(cols[0]) * step, int(cols[-1]) * step + 1
+    changed = step > 1
+    while changed:
+        changed = False
+        left, right = max(0, x0 - step), min(width, x1 + step)
+        found = np.flatnonzero(content_mask(img[max(0, y0 - step):y0, left:right]).any(axis=1))
+        if len(found):
+            y0, changed = max(0, y0 - step) + int(found[0]), True
+        found = np.flatnonzero(content_mask(img[y1:y1 + step, left:right]).any(axis=1))
+        if len(found):
+            y1, changed = y1 + int(found[-1]) + 1, True
+        top, bottom = max(0, y0 - step), min(height, y1 + step)
+        found = np.flatnonzero(content_mask(img[top:bottom, max(0, x0 - step):x0]).any(axis=0))
+        if len(found):
+            x0, changed = max(0, x0 - step) + int(found[0]), True
+        found = np.flatnonzero(content_mask(img[top:bottom, x1:x1 + step]).any(axis=0))
+        if len(found):
+            x1, changed = x1 + int(found[-1]) + 1, True
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def reduction_factor(size, min_side):
+    """在较短边缩小后仍不小于min_side的前提下，选择最大的降分辨率解码倍数（2、4或8），不能缩小时返回1"""
+    short_side = min(size)
+    for factor in sorted(REDUCED_DECODE_FLAGS, reverse=True):
+        if short_side // factor >= min_side:
+            return factor
+    return 1
 
 
 class ImageProcessor:
@@ -20,22 +114,490 @@ class ImageProcessor:
         self.compass_lines = []
         self.compass_texts = []
         self.target_min_size = 1380  # 图像调整的默认最小尺寸阈值
+        # 原图远大于target_min_size时按1/2、1/4或1/8分辨率解码
+        self.reduced_decode = True
+        self.image_path = None
+        self.decode_reduction = 1  # 当前原图解码时的缩小倍数
+        # 裁剪空白的方式：'bbox'为所有内容像素的边界框（抽样投影，快速），
+        # 'largest_contour'为最大轮廓的边界框（全图轮廓检测，适合有噪点的扫描件）
+        self.crop_mode = 'bbox'
+        # 磁盘处理缓存（ProcessingCache），None表示不使用；命中时原图延迟到get_original_image才读取
+        self.processing_cache = None
+        # 图像版本号：processed_image每次变化（加载、处理、画笔、撤销）都递增，用作缓存键
+        self.image_version = 0
+        self._segmentation_key = None
+        self._segmentation = None
+        # 色调分离实时预览的缩小图，按（图像版本号、背景类型）缓存
+        self._threshold_proxy_key = None
+        self._threshold_proxy = None
+        # 背景分类（黑底/白底）：每张图像只在缩小图上检测一次，None表示尚未检测
+        self._is_black_bg = None
+        # 手动指定背景类型：None为自动检测，True为黑底，False为白底
+        self.background_override = None
+        # 轮廓检测金字塔层数：0为原分辨率检测，2为先在1/4分辨率检测，3为1/8
+        self.segmentation_pyramid_levels = 0
+        # 是否报告金字塔检测与原分辨率检测的质心误差（会额外运行一次原分辨率检测）
+        self.report_pyramid_error = False
+        self.pyramid_centroid_error = None
+        # 保护processed_image和轮廓检测缓存：后台渲染线程读取时，主线程的画笔和图像替换需等待
+        self.lock = threading.RLock()
+        # 分块金字塔后端：像素数超过阈值的原图和处理结果改用分块金字塔存储，None表示不使用
+        self.tiled_threshold_pixels = 40_000_000
+        # 分块金字塔的存储方式：'disk'为临时目录中的内存映射文件，'memory'为内存
+        self.tile_storage = 'disk'
+        self.source_tiles = None     # 加载的原图（超过阈值时）
+        self.processed_tiles = None  # processed_image（处理结果超过阈值时）
+        # 已替换但仍被image/original_image/processed_image引用的分块金字塔，引用它的图像被替换后再关闭
+        self._retired_tiles = []
+        # 画笔编辑的撤销/重做历史（只保存脏矩形补丁）
+        self.edit_history = EditHistory()
     
-    def load_image(self, image_path):
-        """加载图像"""
-        try:
-            nparr = np.fromfile(image_path, np.uint8)
+    def use_tiles(self, shape):
+        """指定尺寸的图像是否使用分块金字塔存储"""
+        return self.tiled_threshold_pixels is not None and shape[0] * shape[1] > self.tiled_threshold_pixels
+    
+    def mark_image_changed(self):
+        """标记processed_image的像素已变化，使依赖它的缓存失效"""
+        self.image_version += 1
+    
+    def set_processed_image(self, img):
+        """替换processed_image并递增图像版本号（背景分类随之重新检测，编辑历史随之清空）"""
+        with self.lock:
+            self.edit_history.clear()
+            if self.processed_tiles is not None and img is not self.processed_tiles.base:
+                self._retired_tiles.append(self.processed_tiles)
+                self.processed_tiles = None
+            self.processed_image = img
+            self._is_black_bg = None
+            self.mark_image_changed()
+            self._close_retired_tiles()
+    
+    def _close_retired_tiles(self):
+        """关闭不再被任何图像引用的已替换分块金字塔（仍被引用时内存映射文件无法删除）"""
+        in_use = [img for img in (self.image, self.original_image, self.processed_image) if img is not None]
+        remaining = []
+        for tiles in self._retired_tiles:
+            if any(np.may_share_memory(img, tiles.base) for img in in_use):
+                remaining.append(tiles)
+            else:
+                tiles.close()
+        self._retired_tiles = remaining
+    
+    def set_background_override(self, is_black_bg):
+        """手动指定背景类型：True为黑底，False为白底，None恢复自动检测"""
+        self.background_override = is_black_bg
+    
+    def is_black_background(self):
+        """获取当前图像是否为黑底图像（手动指定优先，否则使用缓存的检测结果）"""
+        if self.background_override is not None:
+            return self.background_override
+        if self._is_black_bg is None and self.processed_image is not None:
+            self._is_black_bg = classify_background(self.processed_image)
+            print(f"背景分类: {'黑底' if self._is_black_bg else '白底'}")
+        return self._is_black_bg
+    
+    def get_segmentation(self):
+        """获取processed_image的轮廓检测结果
+        
+        结果按（图像版本号、色调分离上下界、背景类型、金字塔层数）缓存，
+        只改变旋转角度、罗盘圈或缩放的重绘不会重新检测。
+        segmentation_pyramid_levels大于0时使用由粗到细的金字塔检测，
+        processed_image为分块金字塔时未指定层数也使用2层金字塔检测。
+        
+        Returns:
+            dict: 见segmentation.find_outline，没有图像时返回None
+        """
+        with self.lock:
+            if self.processed_image is None:
+                return None
+            is_black_bg = self.is_black_background()
+            levels = self._pyramid_levels()
+            key = self._segmentation_cache_key()
+            if self._segmentation_key != key:
+                if levels > 0:
+                    self._segmentation = find_outline_pyramid(
+                        self.processed_image, self.threshold_lower, self.threshold_upper, is_black_bg,
+                        levels=levels, compare_full=self.report_pyramid_error)
+                    self.pyramid_centroid_error = self._segmentation['centroid_error']
+                    if self.pyramid_centroid_error is not None:
+                        print(f"金字塔轮廓检测质心误差: {self.pyramid_centroid_error:.2f}像素（{levels}层）")
+                else:
+                    self._segmentation = find_outline(self.processed_image, self.threshold_lower, self.threshold_upper, is_black_bg)
+                self._segmentation_key = key
+            return self._segmentation
+    
+    def get_threshold_preview(self, lower, upper):
+        """在缓存的缩小图上按给定阈值检测轮廓（拖动色调分离滑块时的实时预览）
+        
+        结果不写入轮廓检测缓存，松开滑块后由get_segmentation按原分辨率完整检测。
+        
+        Returns:
+            dict: 见segmentation.find_outline_proxy，没有图像时返回None
+        """
+        with self.lock:
+            if self.processed_image is None:
+                return None
+            is_black_bg = self.is_black_background()
+            key = (self.image_version, is_black_bg)
+            if self._threshold_proxy_key != key:
+                self._threshold_proxy = make_threshold_proxy(self.processed_image, is_black_bg)
+                self._threshold_proxy_key = key
+            proxy = self._threshold_proxy
+        return find_outline_proxy(proxy, lower, upper)
+    
+    def _segmentation_cache_key(self):
+        """轮廓检测结果的缓存键"""
+        return (self.image_version, self.threshold_lower, self.threshold_upper, self.is_black_background(),
+                self._pyramid_levels(), self.report_pyramid_error)
+    
+    def _pyramid_levels(self):
+        """实际使用的轮廓检测金字塔层数"""
+        if self.segmentation_pyramid_levels == 0 and self.processed_tiles is not None:
+            return 2
+        return self.segmentation_pyramid_levels
+    
+    def apply_brush_stroke(self, start, end, color, brush_size):
+        """在processed_image上画一笔，并只在脏矩形内增量更新缓存的轮廓检测结果
+        
+        Args:
+            start: 起点 (x, y)
+            end: 终点 (x, y)，None表示在起点画一个圆点
+            color: 画笔颜色
+            brush_size: 画笔粗细
+            
+        Returns:
+            tuple: 脏矩形 (x0, y0, x1, y1)，没有图像或笔画在图像外时返回None
+        """
+        with self.lock:
+            img = self.processed_image
+            if img is None:
+                return None
+            
+            rect = brush_dirty_rect(start, end, brush_size, img.shape)
+            self.edit_history.record(img, rect)
+            if end is None:
+                cv2.circle(img, start, brush_size//2, color, -1)
+            else:
+                cv2.line(img, start, end, color, brush_size)
+            
+            if rect is not None and self.processed_tiles is not None:
+                self.processed_tiles.update_region(rect)
+            cached = self._segmentation is not None and self._segmentation_key == self._segmentation_cache_key()
+            self.mark_image_changed()
+            if rect is None or not cached:
+                return rect
+            
+            # 在脏矩形局部坐标中重画同一笔，得到笔画遮罩
+            x0, y0, x1, y1 = rect
+            stroke = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            local_start = (start[0] - x0, start[1] - y0)
+            if end is None:
+                cv2.circle(stroke, local_start, brush_size//2, 255, -1)
+            else:
+                cv2.line(stroke, local_start, (end[0] - x0, end[1] - y0), 255, brush_size)
+            
+            update_outline_roi(self._segmentation, img, rect, stroke, self.threshold_lower, self.threshold_upper)
+            self._segmentation_key = self._segmentation_cache_key()
+            return rect
+    
+    def apply_brush_polyline(self, points, color, brush_size):
+        """把一整笔画笔轨迹一次性画到processed_image上（起点画圆点，轨迹用cv2.polylines）
+        
+        与逐段调用apply_brush_stroke得到的像素完全相同，但只递增一次图像版本号，
+        缓存的轮廓检测结果随之失效，下次显示时完整检测。
+        
+        Args:
+            points: 轨迹点列表 [(x, y), ...]
+            color: 画笔颜色
+            brush_size: 画笔粗细
+            
+        Returns:
+            tuple: 脏矩形 (x0, y0, x1, y1)，没有图像或没有轨迹点时返回None
+        """
+        with self.lock:
+            img = self.processed_image
+            if img is None or not points:
+                return None
+            
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            rect = brush_dirty_rect((min(xs), min(ys)), (max(xs), max(ys)), brush_size, img.shape)
+            # 编辑历史按每一段的脏矩形保存，斜向的长笔画不会保存整块外接矩形
+            self.edit_history.record(img, brush_dirty_rect(points[0], None, brush_size, img.shape))
+            for segment_start, segment_end in zip(points, points[1:]):
+                self.edit_history.record(img, brush_dirty_rect(segment_start, segment_end, brush_size, img.shape))
+            cv2.circle(img, tuple(points[0]), brush_size//2, color, -1)
+            if len(points) > 1:
+                cv2.polylines(img, [np.array(points, dtype=np.int32)], False, color, brush_size)
+            self.mark_image_changed()
+            
+            if rect is not None and self.processed_tiles is not None:
+                self.processed_tiles.update_region(rect)
+            return rect
+    
+    def begin_brush_edits(self):
+        """画笔开始：之后的画笔修改记入同一条编辑历史"""
+        with self.lock:
+            self.edit_history.begin()
+    
+    def finish_brush_edits(self):
+        """画笔结束：提交本笔的编辑历史；如果缓存的轮廓检测结果是增量近似的，使其失效以便下次完整检测"""
+        with self.lock:
+            if self.processed_image is not None:
+                self.edit_history.commit(self.processed_image)
+            if self._segmentation is not None and self._segmentation.get('approximate'):
+                self._segmentation_key = None
+    
+    def undo_edit(self):
+        """撤销最近一次画笔编辑（只写回它修改过的区域）
+        
+        Returns:
+            tuple: 被恢复的区域 (x0, y0, x1, y1)，没有可撤销的编辑时返回None
+        """
+        return self._apply_history(self.edit_history.undo)
+    
+    def redo_edit(self):
+        """重做最近一次被撤销的画笔编辑
+        
+        Returns:
+            tuple: 被修改的区域 (x0, y0, x1, y1)，没有可重做的编辑时返回None
+        """
+        return self._apply_history(self.edit_history.redo)
+    
+    def revert_edits(self):
+        """撤销全部画笔编辑并清空编辑历史
+        
+        Returns:
+            tuple: 被恢复区域的外接矩形，没有编辑时返回None
+        """
+        return self._apply_history(self.edit_history.undo_all)
+    
+    def _apply_history(self, action):
+        """在processed_image上执行撤销/重做操作，并使依赖它的缓存失效"""
+        with self.lock:
+            if self.processed_image is None:
+                return None
+            rect = action(self.processed_image)
+            if rect is not None:
+                if self.processed_tiles is not None:
+                    self.processed_tiles.update_region(rect)
+                self.mark_image_changed()
+            return rect
+    
+    def decode_image(self, image_path, factor=1):
+        """读取图像文件，factor为2、4或8时按该倍数降分辨率解码
+        
+        Returns:
+            tuple: (图像, 缩小倍数)，读取失败时图像为None
+        """
+        nparr = np.fromfile(image_path, np.uint8)
+        img = cv2.imdecode(nparr, REDUCED_DECODE_FLAGS.get(factor, cv2.IMREAD_COLOR))
+        if img is None and factor > 1:
             img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            factor = 1
+        return img, factor
+    
+    def choose_reduction(self, image_path):
+        """为JPEG图像选择降分辨率解码的倍数
+        
+        先从文件头读取尺寸，原图较短边远大于target_min_size时再按1/8解码一张小图找出内容区域（裁剪空白后），
+        选择内容区域较短边仍不小于target_min_size的最大倍数，保证之后resize_image不会放大缩小过的图像。
+        
+        Returns:
+            int: 缩小倍数（1、2、4或8）
+        """
+        if not self.reduced_decode:
+            return 1
+        probe = probe_image_size(image_path)
+        if probe is None or probe[1] != 'JPEG' or reduction_factor(probe[0], self.target_min_size) == 1:
+            return 1
+        thumb, thumb_factor = self.decode_image(image_path, 8)
+        if thumb is None or thumb_factor != 8:
+            return 1
+        rect = self.find_content_rect(thumb)
+        height, width = (rect[3], rect[2]) if rect is not None else thumb.shape[:2]
+        # 1/8小图的内容边界有一个像素以内的误差，换算回原图时扣掉
+        short_side = max(0, min(width, height) - 1) * 8
+        return reduction_factor((short_side, short_side), self.target_min_size)
+    
+    def _refit_reduction(self, img, factor):
+        """检查降分辨率解码图像的内容区域（裁剪空白后）是否仍不小于target_min_size
+        
+        Returns:
+            int: 应使用的缩小倍数（不大于factor），内容区域不足时改用更小的倍数
+        """
+        if factor <= 1:
+            return factor
+        rect = self.find_content_rect(img)
+        height, width = (rect[3], rect[2]) if rect is not None else img.shape[:2]
+        if min(width, height) >= self.target_min_size:
+            return factor
+        short_side = min(width, height) * factor
+        return reduction_factor((short_side, short_side), self.target_min_size)
+    
+    def _decode_for_processing(self, image_path, reduce=True):
+        """读取用于预处理的图像：允许时按choose_reduction降分辨率解码
+        
+        Returns:
+            tuple: (图像, 缩小倍数)，读取失败时图像为None
+        """
+        img, factor = self.decode_image(image_path, self.choose_reduction(image_path) if reduce else 1)
+        if img is not None:
+            refit = self._refit_reduction(img, factor)
+            if refit != factor:
+                img, factor = self.decode_image(image_path, refit)
+        return img, factor
+    
+    def load_image(self, image_path, reduce=True):
+        """加载图像（reduce为True时允许降分辨率解码）"""
+        try:
+            img, factor = self._decode_for_processing(image_path, reduce)
             if img is None:
                 return False
+            if factor > 1:
+                print(f"图像按1/{factor}分辨率解码: {img.shape[1]}x{img.shape[0]}")
+            self.image_path = image_path
+            self.decode_reduction = factor
+            with self.lock:
+                if self.source_tiles is not None:
+                    # 旧图像仍引用它，在set_processed_image替换图像后关闭
+                    self._retired_tiles.append(self.source_tiles)
+                    self.source_tiles = None
+                if self.use_tiles(img.shape):
+                    # 超大图像：原图只保留在分块金字塔中，原图、处理前图像共用金字塔第0层，不再复制
+                    self.source_tiles = TiledImage.from_array(img, storage=self.tile_storage)
+                    img = self.source_tiles.base
+                    print(f"图像较大（{img.shape[1]}x{img.shape[0]}），使用分块金字塔（{len(self.source_tiles.levels)}层）")
+                    self.image = img
+                    self.original_image = img
+                    self.set_processed_image(img)
+                    return True
             self.image = img
             self.original_image = img.copy()
-            self.processed_image = img.copy()
+            self.set_processed_image(img.copy())
             return True
         except Exception as e:
             print(f"加载图像失败: {e}")
             return False
     
+    def prepare_image(self, image_path):
+        """读取并预处理图像（裁剪、缩放、背景分类和当前阈值下的轮廓检测），不修改处理器状态
+        
+        可在后台线程调用，结果用set_prepared_image应用。超过分块阈值的图像不适合缓存，返回None。
+        设置了processing_cache时先查磁盘处理缓存（命中时original为None），未命中时处理后写入。
+        
+        Returns:
+            dict: original 为原图，processed 为预处理后的图像，is_black_bg 为自动背景分类，
+                  segmentation 为轮廓检测结果，segmentation_params 为检测所用的（阈值、背景、金字塔层数）；
+                  读取失败时返回None
+        """
+        cached = self.load_cached_preparation(image_path)
+        if cached is not None:
+            return cached
+        
+        params = self._processing_cache_params()
+        img, factor = self._decode_for_processing(image_path)
+        if img is None or self.use_tiles(img.shape):
+            return None
+        processed = self.process_image(img)
+        return self._finish_preparation(image_path, img, factor, processed, params)
+    
+    def _finish_preparation(self, image_path, original, factor, processed, params):
+        """对预处理后的图像做背景分类和轮廓检测，组成prepare_image的结果并写入磁盘处理缓存
+        
+        Args:
+            params: 处理参数（_processing_cache_params的结果，其中的阈值、背景和金字塔层数用于轮廓检测）
+        """
+        auto_black_bg = classify_background(processed)
+        override = params['background_override']
+        is_black_bg = auto_black_bg if override is None else override
+        lower, upper = params['threshold_lower'], params['threshold_upper']
+        levels = params['pyramid_levels']
+        if levels > 0:
+            segmentation = find_outline_pyramid(processed, lower, upper, is_black_bg, levels=levels)
+        else:
+            segmentation = find_outline(processed, lower, upper, is_black_bg)
+        prepared = {'original': original, 'path': image_path, 'decode_reduction': factor,
+                    'processed': processed, 'is_black_bg': auto_black_bg,
+                    'segmentation': segmentation, 'segmentation_params': (lower, upper, is_black_bg, levels, False)}
+        if self.processing_cache is not None:
+            self.processing_cache.put(image_path, params, prepared)
+        return prepared
+    
+    def load_cached_preparation(self, image_path):
+        """从磁盘处理缓存读取prepare_image的结果（original为None），没有缓存时返回None"""
+        if self.processing_cache is None:
+            return None
+        cached = self.processing_cache.get(image_path, self._processing_cache_params())
+        if cached is not None:
+            cached.update(original=None, path=image_path)
+        return cached
+    
+    def _processing_cache_params(self):
+        """影响prepare_image结果的参数（磁盘处理缓存键的一部分）"""
+        return {'target_min_size': self.target_min_size, 'reduced_decode': self.reduced_decode,
+                'crop_mode': self.crop_mode, 'tiled_threshold_pixels': self.tiled_threshold_pixels,
+                'threshold_lower': self.threshold_lower, 'threshold_upper': self.threshold_upper,
+                'background_override': self.background_override,
+                'pyramid_levels': self.segmentation_pyramid_levels}
+    
+    def processing_cache_snapshot(self):
+        """记录把刚加载的图像写入磁盘处理缓存所需的内容（未经prepare_image、直接读取处理的图像）
+        
+        应在load_image和process_image之后、画笔修改之前在主线程调用，只复制processed_image；
+        轮廓检测、文件哈希和写入由store_processing_cache在后台线程完成。
+        
+        Returns:
+            dict: 交给store_processing_cache的快照，不需要写入缓存时返回None
+        """
+        with self.lock:
+            if (self.processing_cache is None or self.image_path is None or self.processed_image is None
+                    or self.processed_tiles is not None):
+                return None
+            return {'path': self.image_path, 'decode_reduction': self.decode_reduction,
+                    'processed': self.processed_image.copy(), 'params': self._processing_cache_params()}
+    
+    def store_processing_cache(self, snapshot):
+        """把processing_cache_snapshot记录的图像写入磁盘处理缓存（可在后台线程调用）"""
+        self._finish_preparation(snapshot['path'], None, snapshot['decode_reduction'],
+                                 snapshot['processed'], snapshot['params'])
+    
+    def get_original_image(self):
+        """获取原图：从磁盘处理缓存打开的图像在第一次需要原图（如重新处理）时才读取"""
+        with self.lock:
+            if self.original_image is None and self.image_path is not None:
+                img, factor = self._decode_for_processing(self.image_path)
+                if img is not None:
+                    self.image = img
+                    self.original_image = img
+                    self.decode_reduction = factor
+            return self.original_image
+    
+    def set_prepared_image(self, prepared):
+        """应用prepare_image的结果（相当于load_image加process_image）
+        
+        processed_image使用副本，画笔修改不会影响缓存中的结果（也把磁盘缓存的内存映射读入内存）；
+        结果来自磁盘处理缓存时original为None，原图由get_original_image按需读取；
+        检测时的阈值、背景类型和金字塔层数与当前一致时直接采用缓存的轮廓检测结果。
+        """
+        with self.lock:
+            if self.source_tiles is not None:
+                self._retired_tiles.append(self.source_tiles)
+                self.source_tiles = None
+            self.image = prepared['original']
+            self.original_image = prepared['original']
+            self.image_path = prepared['path']
+            self.decode_reduction = prepared['decode_reduction']
+            self.set_processed_image(np.array(prepared['processed']))
+            self._is_black_bg = prepared['is_black_bg']
+            key = self._segmentation_cache_key()
+            if key[1:] == prepared['segmentation_params']:
+                # 增量画笔更新会修改结果中的掩码，使用副本
+                segmentation = dict(prepared['segmentation'])
+                segmentation['mask'] = np.array(segmentation['mask'])
+                self._segmentation = segmentation
+                self._segmentation_key = key
+    
     def calculate_centroid(self, points):
         """计算质心"""
         if not points or len(points) < 3:
@@ -60,15 +622,18 @@ class ImageProcessor:
     
     def draw_compass(self, centroid, line_length, text_distance, image_width, image_height,
                    line_color=(0, 165, 255), text_color=(0, 0, 255), 
-                   linewidth=2.5, fontsize=14):
-        """绘制罗盘"""
-        if not self.compass_manager.current_compass or not centroid:
-            return [], []
+                   linewidth=2.5, fontsize=14, compass_manager=None):
+        """绘制罗盘（compass_manager为罗盘状态的副本，None表示使用当前状态，下同）
+        
+        Returns:
+            tuple: (线段列表, 文字列表)，线段列表为draw_list.SEGMENT_DTYPE结构化数组
+        """
+        compass_manager = compass_manager or self.compass_manager
+        if not compass_manager.current_compass or not centroid:
+            return empty_segments(), []
         
         cx, cy = centroid
-        compass = self.compass_manager.current_compass
-        lines = []
-        texts = []
+        compass = compass_manager.current_compass
         
         # 周天度数环的外圆半径（与draw_zhoutian_ring中的计算一致）
         outer_radius_zhoutian = text_distance - 5
@@ -77,12 +642,13 @@ class ImageProcessor:
         # 将24山和12支的显示半径设置为比周天度数内圈少2个字符，再扩充12像素
         adjusted_text_distance = inner_radius_zhoutian - fontsize * 2 + 12
         
-        for i in range(compass.get_num_sectors()):
-            x_end, y_end = compass.calculate_line_end(cx, cy, line_length, i)
-            lines.append(((cx, cy), (x_end, y_end)))
-            
-            label_x, label_y = compass.calculate_label_position(cx, cy, adjusted_text_distance, i)
-            texts.append((label_x, label_y, compass.get_labels()[i]))
+        # 一次计算所有扇区的分割线终点和标签位置
+        geometry = compass.calculate_geometry(cx, cy, line_length, adjusted_text_distance)
+        line_ends = geometry['line_ends']
+        lines = make_segments(np.broadcast_to((cx, cy), line_ends.shape), line_ends,
+                              line_color, int(linewidth * 2))
+        texts = [(label_x, label_y, label) for (label_x, label_y), label in zip(
+            geometry['label_positions'].tolist(), compass.get_labels())]
         
         return lines, texts
     
@@ -108,19 +674,21 @@ class ImageProcessor:
         """获取旋转角度"""
         return self.compass_manager.get_rotation_angle()
     
-    def draw_compass28(self, centroid, text_distance, line_color=(0, 165, 255), text_color=(0, 0, 255), linewidth=2.5, fontsize=14):
+    def draw_compass28(self, centroid, text_distance, line_color=(0, 165, 255), text_color=(0, 0, 255), linewidth=2.5, fontsize=14,
+                       compass_manager=None):
         """绘制28宿罗盘（附加罗盘）"""
-        if not self.compass_manager.show_compass28 or not centroid:
-            return [], []
+        compass_manager = compass_manager or self.compass_manager
+        if not compass_manager.show_compass28 or not centroid:
+            return empty_segments(), []
         
         cx, cy = centroid
-        compass28 = self.compass_manager.compass28
+        compass28 = compass_manager.compass28
         labels = compass28.get_labels()
         degrees = compass28.get_degrees()
         cumulative_angles = compass28.calculate_cumulative_angles()
         
         # 获取旋转角度
-        rotation_angle = self.compass_manager.get_rotation_angle()
+        rotation_angle = compass_manager.get_rotation_angle()
         
         # 计算周天度数环的半径
         outer_radius_zhoutian = text_distance - 5
@@ -133,35 +701,29 @@ class ImageProcessor:
         outer_radius = compass12_radius - fontsize * 2 + 20
         inner_radius = outer_radius - 30
         
-        texts = []
+        # 将28宿字符显示压在两圆之间（内圆和外圆的中间）
+        label_radius = (inner_radius + outer_radius) / 2
         
-        for i, (label, label_angle) in enumerate(zip(labels, compass28.label_angles)):
-            # 加上旋转角度
-            label_angle_with_rotation = label_angle + rotation_angle
-            label_angle_rad = np.deg2rad(label_angle_with_rotation)
-            
-            # 将28宿字符显示压在两圆之间（内圆和外圆的中间），字号缩小到75%
-            label_radius = (inner_radius + outer_radius) / 2
-            label_fontsize = int(fontsize * 0.75)
-            
-            label_x = cx + label_radius * np.cos(label_angle_rad)
-            label_y = cy + label_radius * np.sin(label_angle_rad)
-            
-            texts.append((label_x, label_y, label))
+        # 一次计算所有宿分割线端点和标签位置（加上旋转角度）
+        geometry = compass28.calculate_ring_geometry(cx, cy, inner_radius, outer_radius, label_radius, rotation_angle)
+        lines = make_segments(geometry['divider_starts'], geometry['divider_ends'], line_color, int(linewidth * 2))
+        texts = [(label_x, label_y, label) for (label_x, label_y), label in zip(geometry['label_positions'].tolist(), labels)]
         
-        return [], texts, inner_radius, outer_radius
+        return lines, texts, inner_radius, outer_radius
     
-    def draw_xuankongda(self, centroid, text_distance, line_color=(0, 165, 255), text_color=(0, 0, 255), linewidth=2.5, fontsize=14):
+    def draw_xuankongda(self, centroid, text_distance, line_color=(0, 165, 255), text_color=(0, 0, 255), linewidth=2.5, fontsize=14,
+                        compass_manager=None):
         """绘制玄空大卦罗盘"""
-        print(f"draw_xuankongda被调用: show_xuankongda={self.compass_manager.show_xuankongda}, centroid={centroid}")
-        if not self.compass_manager.show_xuankongda or not centroid:
-            return [], []
+        compass_manager = compass_manager or self.compass_manager
+        print(f"draw_xuankongda被调用: show_xuankongda={compass_manager.show_xuankongda}, centroid={centroid}")
+        if not compass_manager.show_xuankongda or not centroid:
+            return empty_segments(), []
         
         cx, cy = centroid
-        xuankongda = self.compass_manager.compass_xuankongda
+        xuankongda = compass_manager.compass_xuankongda
         
         # 获取旋转角度
-        rotation_angle = self.compass_manager.get_rotation_angle()
+        rotation_angle = compass_manager.get_rotation_angle()
         
         # 计算周天度数环的半径
         outer_radius_zhoutian = text_distance - 5
@@ -180,9 +742,6 @@ class ImageProcessor:
         middle_radius = outer_radius * 0.93
         inner_radius = outer_radius * 0.86
         
-        # 绘制三圈之间的环线
-        lines = []
-        
         # 为每圈定义不同的颜色（BGR格式）
         inner_color = (255, 0, 0)      # 蓝色
         middle_color = (0, 255, 255)    # 黄色
@@ -196,151 +755,109 @@ class ImageProcessor:
         inner_circle_inner = inner_radius * 0.98
         inner_circle_outer = inner_radius * 1.01
         
-        # 生成精细刻度线（360条，与周天度数盘一致）
-        for angle in range(360):
-            angle_deg = angle + rotation_angle
-            angle_rad = np.deg2rad(angle_deg)
-            
-            # 内圈刻度线（蓝色）
-            start_x = cx + inner_circle_inner * np.cos(angle_rad)
-            start_y = cy + inner_circle_inner * np.sin(angle_rad)
-            end_x = cx + inner_circle_outer * np.cos(angle_rad)
-            end_y = cy + inner_circle_outer * np.sin(angle_rad)
-            lines.append(((start_x, start_y), (end_x, end_y), inner_color))
-            
-            # 中圈刻度线（黄色）
-            start_x = cx + middle_circle_inner * np.cos(angle_rad)
-            start_y = cy + middle_circle_inner * np.sin(angle_rad)
-            end_x = cx + middle_circle_outer * np.cos(angle_rad)
-            end_y = cy + middle_circle_outer * np.sin(angle_rad)
-            lines.append(((start_x, start_y), (end_x, end_y), middle_color))
-            
-            # 外圈刻度线（红色）
-            start_x = cx + outer_circle_inner * np.cos(angle_rad)
-            start_y = cy + outer_circle_inner * np.sin(angle_rad)
-            end_x = cx + outer_circle_outer * np.cos(angle_rad)
-            end_y = cy + outer_circle_outer * np.sin(angle_rad)
-            lines.append(((start_x, start_y), (end_x, end_y), outer_color))
-        
-        # 绘制三圈文字
-        outer_texts = []
-        middle_texts = []
-        inner_texts = []
-        
-        for i in range(64):
-            angle = xuankongda.outer_hexagram_angles[i] + rotation_angle
-            angle_rad = np.deg2rad(angle)
-            
-            # 最外圈：星运
-            label_x = cx + outer_radius * np.cos(angle_rad)
-            label_y = cy + outer_radius * np.sin(angle_rad)
-            outer_texts.append((label_x, label_y, xuankongda.middle_fortune_labels[i]))
-            
-            # 中圈：卦名
-            label_x = cx + middle_radius * np.cos(angle_rad)
-            label_y = cy + middle_radius * np.sin(angle_rad)
-            middle_texts.append((label_x, label_y, xuankongda.outer_hexagram_names[i]))
-            
-            # 内圈：五行
-            label_x = cx + inner_radius * np.cos(angle_rad)
-            label_y = cy + inner_radius * np.sin(angle_rad)
-            inner_texts.append((label_x, label_y, xuankongda.inner_element_labels[i]))
-        
-        # 绘制每两卦之间的分隔线
-        for i in range(64):
-            # 计算当前卦和下一个卦的中间角度
-            current_angle = xuankongda.outer_hexagram_angles[i] + rotation_angle
-            next_index = (i + 1) % 64
-            next_angle = xuankongda.outer_hexagram_angles[next_index] + rotation_angle
-            
-            # 计算中间角度
-            mid_angle = (current_angle + next_angle) / 2
-            mid_angle_rad = np.deg2rad(mid_angle)
-            
-            # 绘制分隔线（在内圈和外圈之间）
-            start_x = cx + inner_circle_outer * np.cos(mid_angle_rad)
-            start_y = cy + inner_circle_outer * np.sin(mid_angle_rad)
-            end_x = cx + outer_circle_inner * np.cos(mid_angle_rad)
-            end_y = cy + outer_circle_inner * np.sin(mid_angle_rad)
-            lines.append(((start_x, start_y), (end_x, end_y)))
-            
-            # 每八卦之间设两倍粗的单分隔线（每8卦一组）
-            if i % 8 == 7:
-                # 绘制一条两倍粗的分隔线
-                start_x = cx + inner_circle_outer * np.cos(mid_angle_rad)
-                start_y = cy + inner_circle_outer * np.sin(mid_angle_rad)
-                end_x = cx + outer_circle_inner * np.cos(mid_angle_rad)
-                end_y = cy + outer_circle_inner * np.sin(mid_angle_rad)
-                lines.append(((start_x, start_y), (end_x, end_y), 2))  # 2倍粗
+        # 一次计算三圈刻度线、三圈文字位置和卦间分隔线
+        geometry = xuankongda.calculate_ring_geometry(
+            cx, cy,
+            tick_radii=[(inner_circle_inner, inner_circle_outer),
+                        (middle_circle_inner, middle_circle_outer),
+                        (outer_circle_inner, outer_circle_outer)],
+            label_radii=[outer_radius, middle_radius, inner_radius],
+            divider_radii=(inner_circle_outer, outer_circle_inner),
+            rotation_angle=rotation_angle,
+        )
+        
+        # 精细刻度线（每圈360条，与周天度数盘一致，细线）
+        tick_lines = [make_segments(starts, ends, color, 2) for color, starts, ends in zip(
+            (inner_color, middle_color, outer_color), geometry['tick_starts'], geometry['tick_ends'])]
+        
+        # 三圈文字：最外圈星运，中圈卦名，内圈五行
+        outer_positions, middle_positions, inner_positions = geometry['label_positions'].tolist()
+        outer_texts = [(x, y, label) for (x, y), label in zip(outer_positions, xuankongda.middle_fortune_labels)]
+        middle_texts = [(x, y, label) for (x, y), label in zip(middle_positions, xuankongda.outer_hexagram_names)]
+        inner_texts = [(x, y, label) for (x, y), label in zip(inner_positions, xuankongda.inner_element_labels)]
+        
+        # 每两卦之间的分隔线（在内圈和外圈之间）
+        divider_lines = make_segments(geometry['divider_starts'], geometry['divider_ends'],
+                                      line_color, int(linewidth * 2))
+        
+        # 每八卦之间设两倍粗的红色单分隔线（每8卦一组），画在普通分隔线之上
+        group_dividers = slice(7, None, 8)
+        group_lines = make_segments(geometry['divider_starts'][group_dividers], geometry['divider_ends'][group_dividers],
+                                    (0, 0, 255), int(2 * linewidth))
+        
+        lines = concat_segments(*tick_lines, divider_lines, group_lines)
         
         print(f"玄空大卦罗盘文字数量: 外圈={len(outer_texts)}, 中圈={len(middle_texts)}, 内圈={len(inner_texts)}")
         return lines, outer_texts + middle_texts + inner_texts, inner_radius, outer_radius
     
-    def draw_zhoutian_ring(self, centroid, text_distance):
+    def draw_zhoutian_ring(self, centroid, text_distance, line_color=(255, 0, 0), thickness=2, compass_manager=None):
         """绘制周天环（最外层）"""
+        compass_manager = compass_manager or self.compass_manager
         if not centroid:
-            return [], []
+            return empty_segments(), []
         
         cx, cy = centroid
         texts = []
         
         # 获取旋转角度
-        rotation_angle = self.compass_manager.get_rotation_angle()
+        rotation_angle = compass_manager.get_rotation_angle()
         
         # 周天环半径（外圆在图像边缘向内5像素，内圆在外圆向内30像素）
         outer_radius = text_distance - 5
         inner_radius = outer_radius - 30
         
-        # 生成360个刻度线
-        lines = []
-        for i in range(360):
-            angle_deg = i + rotation_angle
-            angle_rad = np.deg2rad(angle_deg)
-            x1 = cx + inner_radius * np.cos(angle_rad)
-            y1 = cy + inner_radius * np.sin(angle_rad)
-            x2 = cx + outer_radius * np.cos(angle_rad)
-            y2 = cy + outer_radius * np.sin(angle_rad)
-            lines.append(((x1, y1), (x2, y2)))
-        
-        # 生成每隔10度的度数标签
-        for i in range(0, 360, 10):
-            angle_deg = (i + 270 + rotation_angle) % 360
-            angle_rad = np.deg2rad(angle_deg)
-            
-            # 标签半径放在内外圆中间
-            label_radius = (inner_radius + outer_radius) / 2
-            label_x = cx + label_radius * np.cos(angle_rad)
-            label_y = cy + label_radius * np.sin(angle_rad)
-            
-            degree_num = int(i) % 360
+        # 360个刻度线（复用每度的单位向量）
+        degree_units = rotate_unit_vectors(DEGREE_UNIT_VECTORS, rotation_angle)
+        lines = make_segments(project(cx, cy, degree_units, inner_radius),
+                              project(cx, cy, degree_units, outer_radius), line_color, thickness)
+        
+        # 每隔10度的度数标签，标签半径放在内外圆中间
+        label_radius = (inner_radius + outer_radius) / 2
+        degree_nums = np.arange(0, 360, 10)
+        label_positions = project(cx, cy, degree_units[(degree_nums + 270) % 360], label_radius).tolist()
+        for (label_x, label_y), degree_num in zip(label_positions, degree_nums.tolist()):
             texts.append((label_x, label_y, str(degree_num)))
         
         return lines, texts, inner_radius, outer_radius
     
     def crop_blank_area(self, img):
         """自动裁剪空白区域"""
+        rect = self.find_content_rect(img)
+        if rect is None:
+            return img
+        
+        # 裁剪图像
+        x, y, w, h = rect
+        cropped_img = img[y:y+h, x:x+w]
+        
+        return cropped_img
+    
+    def find_content_rect(self, img):
+        """查找内容区域的边界框（crop_mode为'bbox'时为所有内容像素，为'largest_contour'时为最大轮廓）
+        
+        Returns:
+            tuple: (x, y, w, h)，没有内容时返回None
+        """
+        if self.crop_mode == 'bbox':
+            return find_content_bbox(img)
+        
         # 转换为灰度图
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
         # 阈值化处理，将空白区域变为黑色，内容区域变为白色
-        _, thresh = cv2.threshold(gray, 10, 255, cv2.THRESH_BINARY)
+        _, thresh = cv2.threshold(gray, CROP_THRESHOLD, 255, cv2.THRESH_BINARY)
         
         # 查找轮廓
         contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
         if not contours:
-            return img
+            return None
         
         # 找到最大的轮廓
         max_contour = max(contours, key=cv2.contourArea)
         
         # 计算边界框
-        x, y, w, h = cv2.boundingRect(max_contour)
-        
-        # 裁剪图像
-        cropped_img = img[y:y+h, x:x+w]
-        
-        return cropped_img
+        return cv2.boundingRect(max_contour)
     
     def resize_image(self, img, target_min_size=1380):
         """调整图像大小：
@@ -348,46 +865,102 @@ class ImageProcessor:
         - 如果两个维度都大于target_min_size，则将小一点的维度降为target_min_size，另一维度等比缩小
         """
         height, width = img.shape[:2]
-        
-        # 计算当前宽高比
-        aspect_ratio = width / height
+        new_width, new_height = self.resized_size(width, height, target_min_size)
         
         # 情况1：至少有一个维度小于target_min_size
         if width < target_min_size or height < target_min_size:
-            # 计算需要缩放的维度
-            if width < height:
-                new_width = target_min_size
-                new_height = int(new_width / aspect_ratio)
-            else:
-                new_height = target_min_size
-                new_width = int(new_height * aspect_ratio)
-            
             # 使用插值方法保持清晰度（默认使用INTER_CUBIC）
             resized_img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
         # 情况2：两个维度都大于target_min_size
         else:
-            # 计算需要缩小的维度
-            if width < height:
-                new_width = target_min_size
-                new_height = int(new_width / aspect_ratio)
-            else:
-                new_height = target_min_size
-                new_width = int(new_height * aspect_ratio)
-            
             # 使用插值方法保持清晰度（默认使用INTER_AREA，适合缩小图像）
             resized_img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
         
         return resized_img
     
+    def resized_size(self, width, height, target_min_size=1380):
+        """计算resize_image的目标尺寸：较小的维度调整为target_min_size，另一维度等比缩放
+        
+        Returns:
+            tuple: (new_width, new_height)
+        """
+        # 计算当前宽高比
+        aspect_ratio = width / height
+        
+        # 计算需要缩放的维度
+        if width < height:
+            new_width = target_min_size
+            new_height = int(new_width / aspect_ratio)
+        else:
+            new_height = target_min_size
+            new_width = int(new_height * aspect_ratio)
+        return new_width, new_height
+    
     def process_image(self, img):
         """处理图像：
         1. 裁剪空白区域
         2. 调整图像大小
+        
+        img为分块金字塔中的原图时，在金字塔上裁剪和缩放，不读取整幅原图。
         """
+        if self.source_tiles is not None and img is self.source_tiles.base:
+            return self._process_tiled_image(self.source_tiles)
+        
+        # 原图是降分辨率解码的，而target_min_size已调大到超过其内容区域：按原分辨率重新读取
+        if (img is self.original_image and self.image_path is not None
+                and self._refit_reduction(img, self.decode_reduction) != self.decode_reduction):
+            print("降分辨率解码的图像不足target_min_size，按原分辨率重新读取")
+            if self.load_image(self.image_path, reduce=False):
+                img = self.original_image
+                if self.source_tiles is not None and img is self.source_tiles.base:
+                    return self._process_tiled_image(self.source_tiles)
+        
         # 第一步：裁剪空白区域
         cropped_img = self.crop_blank_area(img)
         
         # 第二步：调整图像大小，使用实例变量target_min_size作为最小尺寸
         processed_img = self.resize_image(cropped_img, target_min_size=self.target_min_size)
         
-        return processed_img
\ No newline at end of file
+        return processed_img
+    
+    def _process_tiled_image(self, tiles, max_detect_side=2048):
+        """在分块金字塔上处理图像（结果与process_image一致，允许1像素以内的裁剪误差）
+        
+        裁剪框在最长边不超过max_detect_side的金字塔层上检测，缩放从分辨率最接近的层按条带读取。
+        处理结果仍超过分块阈值时写入新的分块金字塔，processed_image为其第0层。
+        """
+        level = 0
+        while level + 1 < len(tiles.levels) and max(tiles.levels[level].shape[:2]) > max_detect_side:
+            level += 1
+        factor = 2 ** level
+        height, width = tiles.shape[:2]
+        rect = self.find_content_rect(np.asarray(tiles.levels[level]))
+        if rect is None:
+            x0, y0, x1, y1 = 0, 0, width, height
+        else:
+            x, y, w, h = rect
+            x0, y0 = x * factor, y * factor
+            x1, y1 = min(width, (x + w) * factor), min(height, (y + h) * factor)
+        
+        new_width, new_height = self.resized_size(x1 - x0, y1 - y0, self.target_min_size)
+        scale = new_width / (x1 - x0)
+        if not self.use_tiles((new_height, new_width)):
+            return tiles.read_region((x0, y0, x1, y1), scale, size=(new_width, new_height))
+        
+        # 处理结果仍然很大：按条带缩放写入新的分块金字塔
+        with self.lock:
+            if self.processed_tiles is not None:
+                # processed_image可能仍是旧金字塔的第0层，等它被替换后再关闭
+                self._retired_tiles.append(self.processed_tiles)
+                self.processed_tiles = None
+            output = TiledImage(new_height, new_width, storage=self.tile_storage)
+            for out_y0 in range(0, new_height, TILE_SIZE):
+                out_y1 = min(new_height, out_y0 + TILE_SIZE)
+                src_y0 = y0 + int(out_y0 / scale)
+                src_y1 = min(y1, max(src_y0 + 1, y0 + int(np.ceil(out_y1 / scale))))
+                output.base[out_y0:out_y1] = tiles.read_region((x0, src_y0, x1, src_y1), scale,
+                                                               size=(new_width, out_y1 - out_y0))
+            output.build_pyramid()
+            self.processed_tiles = output
+        print(f"处理结果使用分块金字塔: {new_width}x{new_height}（{len(output.levels)}层）")
+        return output.base
\ No newline at end of file
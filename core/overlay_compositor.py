@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+
+
+class OverlayCompositor:
+    """罗盘叠加层合成器
+
+    各罗盘圈（24山/12支、玄空大卦、28宿、周天度数）只渲染一次到一个预乘alpha的BGRA叠加层，
+    叠加层按缓存键（图像尺寸、质心、半径、旋转角度、字号、启用的罗盘圈）保留。
+    缓存键不变时，每次显示只需把叠加层alpha混合到图像上。
+    """
+
+    def __init__(self):
+        self.key = None
+        self.layer = None
+        self.rebuild_count = 0
+        self.composite_count = 0
+        # 叠加层中非透明区域的边界框，以及该区域的颜色和反向alpha
+        self._bbox = None
+        self._color = None
+        self._inv_alpha = None
+
+    def invalidate(self):
+        """丢弃缓存的叠加层"""
+        self.key = None
+        self.layer = None
+        self._bbox = None
+        self._color = None
+        self._inv_alpha = None
+
+    def get_layer(self, key, size, render_func):
+        """获取叠加层，缓存键变化时才重新渲染
+
+        Args:
+            key: 缓存键（可哈希、可比较）
+            size: 叠加层尺寸 (height, width)
+            render_func: 渲染函数，参数为全透明的BGRA叠加层（颜色按预乘alpha存储，
+                         不透明的cv2绘制结果本身就是预乘的）
+
+        Returns:
+            BGRA叠加层
+        """
+        if self.layer is not None and self.key == key:
+            return self.layer
+
+        height, width = size
+        layer = np.zeros((height, width, 4), dtype=np.uint8)
+        render_func(layer)
+
+        self.key = key
+        self.layer = layer
+        self.rebuild_count += 1
+        self._prepare_blend(layer)
+        print(f"罗盘叠加层已重建（第{self.rebuild_count}次）")
+        return layer
+
+    def _prepare_blend(self, layer):
+        """预计算混合所需的数据，只处理叠加层的非透明区域"""
+        alpha = layer[:, :, 3]
+        x, y, w, h = cv2.boundingRect(alpha)
+        if w == 0 or h == 0:
+            self._bbox = None
+            self._color = None
+            self._inv_alpha = None
+            return
+
+        roi = layer[y:y+h, x:x+w]
+        self._bbox = (x, y, w, h)
+        self._color = roi[:, :, :3].astype(np.uint16)
+        self._inv_alpha = 255 - roi[:, :, 3:4].astype(np.uint16)
+
+    def composite(self, img, key, render_func):
+        """把叠加层alpha混合到BGR图像上（原地修改）
+
+        Args:
+            img: BGR图像
+            key: 缓存键
+            render_func: 缓存失效时使用的渲染函数
+        """
+        self.get_layer(key, img.shape[:2], render_func)
+        self.composite_count += 1
+        if self._bbox is None:
+            return img
+
+        x, y, w, h = self._bbox
+        roi = img[y:y+h, x:x+w]
+        blended = self._color + (roi.astype(np.uint16) * self._inv_alpha + 127) // 255
+        roi[:, :, :] = np.minimum(blended, 255).astype(np.uint8)
+        return img
@@ -0,0 +1,350 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+# 默认磁盘处理缓存目录和容量上限（字节）
+DEFAULT_PROCESSING_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.luopan_cache', 'processing')
+DEFAULT_PROCESSING_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+# 缓存格式版本：处理流程改变导致旧结果不再有效时递增
+PROCESSING_CACHE_VERSION = 1
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def _save_npy(path, array):
+    """先写临时文件再替换，其他线程或进程不会读到写了一半的数组"""
+    fd, tmp_path = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _save_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(suffix='.json', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _points_to_json(points):
+    """轮廓点数组转为JSON可保存的形式（保留形状和数据类型）"""
+    if points is None:
+        return None
+    points = np.asarray(points)
+    return {'shape': list(points.shape), 'dtype': points.dtype.str, 'data': points.ravel().tolist()}
+
+
+def _points_from_json(points):
+    if points is None:
+        return None
+    return np.array(points['data'], dtype=points['dtype']).reshape(points['shape'])
+
+
+class ProcessingCache:
+    """磁盘上的预处理结果缓存（按内容寻址）
+
+    键为原图文件内容的SHA-1加上影响预处理结果的参数（target_min_size、阈值等），
+    内容相同的文件（例如复制或改名后重新处理）共用同一个条目，内容改变后自动失效。每个条目包括：
+    <键>.npy 预处理后的图像、<键>.mask.npy 色调分离掩码（均不压缩，读取时内存映射），
+    <键>.json 轮廓、形心、背景分类等元数据（最后写入，存在即表示条目完整）。
+    读取时先按（路径、大小、修改时间）查index目录中记录的内容哈希，没有记录或对应条目不存在时直接视为未命中，
+    不读取原图；只有找到条目时才重新计算哈希确认内容未变。
+    总大小超过max_bytes时按最近使用时间（元数据文件的修改时间）淘汰；总大小在内存中累计，
+    只在第一次写入和超出容量时扫描缓存目录。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_PROCESSING_CACHE_DIR, max_bytes=DEFAULT_PROCESSING_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # 文件内容哈希按（路径、大小、修改时间）缓存在内存中，同一文件只读一遍
+        self._digests = {}
+        # 缓存总字节数（None表示尚未扫描），写入时累加，prune时按扫描结果重置
+        self._total_bytes = None
+        self._lock = threading.Lock()
+
+    def _stat_key(self, image_path):
+        """(绝对路径, 大小, 修改时间)，文件不存在时返回None"""
+        image_path = os.path.abspath(image_path)
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        return (image_path, stat.st_size, stat.st_mtime_ns)
+
+    def file_digest(self, image_path):
+        """原图文件内容的SHA-1，文件无法读取时返回None"""
+        stat_key = self._stat_key(image_path)
+        if stat_key is None:
+            return None
+        with self._lock:
+            digest = self._digests.get(stat_key)
+        if digest is not None:
+            return digest
+        sha1 = hashlib.sha1()
+        try:
+            with open(stat_key[0], 'rb') as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+                    sha1.update(chunk)
+        except OSError:
+            return None
+        digest = sha1.hexdigest()
+        with self._lock:
+            self._digests[stat_key] = digest
+        return digest
+
+    def _index_path(self, stat_key):
+        name = hashlib.sha1(repr(stat_key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, 'index', name + '.digest')
+
+    def indexed_digest(self, image_path):
+        """index中按（路径、大小、修改时间）记录的内容哈希（不读取原图），没有记录时返回None"""
+        stat_key = self._stat_key(image_path)
+        if stat_key is None:
+            return None
+        try:
+            with open(self._index_path(stat_key), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _record_digest(self, image_path, digest):
+        stat_key = self._stat_key(image_path)
+        if stat_key is None:
+            return
+        index_path = self._index_path(stat_key)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.digest', dir=os.path.dirname(index_path))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(digest)
+            os.replace(tmp_path, index_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def key(self, image_path, params):
+        """条目键：文件内容哈希加处理参数（dict）的哈希，文件无法读取时返回None"""
+        digest = self.file_digest(image_path)
+        if digest is None:
+            return None
+        return self._digest_key(digest, params)
+
+    def _digest_key(self, digest, params):
+        params = json.dumps({'version': PROCESSING_CACHE_VERSION, **params}, sort_keys=True)
+        return hashlib.sha1(f"{digest}|{params}".encode('utf-8')).hexdigest()
+
+    def _entry_paths(self, key):
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + '.json', base + '.npy', base + '.mask.npy'
+
+    def get(self, image_path, params):
+        """读取缓存的预处理结果
+
+        Returns:
+            dict: processed 为预处理后的图像（只读内存映射），decode_reduction 为解码时的缩小倍数，
+                  is_black_bg 为自动背景分类，segmentation 为轮廓检测结果（mask为只读内存映射），
+                  segmentation_params 为检测所用的参数；未命中时返回None
+        """
+        # 先按index找条目，没有记录或条目不存在时不读取原图
+        digest = self.indexed_digest(image_path)
+        if digest is None:
+            self.misses += 1
+            return None
+        key = self._digest_key(digest, params)
+        meta_path, image_file, mask_file = self._entry_paths(key)
+        if not os.path.exists(meta_path) or self.file_digest(image_path) != digest:
+            self.misses += 1
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            processed = np.load(image_file, mmap_mode='r')
+            mask = np.load(mask_file, mmap_mode='r')
+            # 更新修改时间，作为淘汰用的最近使用时间
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        segmentation = {'mask': mask, 'contour': _points_from_json(meta['contour']),
+                        'points': _points_from_json(meta['points']),
+                        'centroid': tuple(meta['centroid']) if meta['centroid'] is not None else None,
+                        'is_black_bg': meta['segmentation_is_black_bg']}
+        if 'centroid_error' in meta:
+            segmentation['centroid_error'] = meta['centroid_error']
+        return {'processed': processed, 'decode_reduction': meta['decode_reduction'],
+                'is_black_bg': meta['is_black_bg'], 'segmentation': segmentation,
+                'segmentation_params': tuple(meta['segmentation_params'])}
+
+    def put(self, image_path, params, prepared):
+        """写入预处理结果（prepared的内容同get的返回值），写入后累计的总大小超出容量时淘汰旧条目
+
+        Returns:
+            bool: 是否写入成功
+        """
+        digest = self.file_digest(image_path)
+        if digest is None:
+            return False
+        key = self._digest_key(digest, params)
+        meta_path, image_file, mask_file = self._entry_paths(key)
+        segmentation = prepared['segmentation']
+        meta = {'source': os.path.abspath(image_path), 'decode_reduction': prepared['decode_reduction'],
+                'is_black_bg': bool(prepared['is_black_bg']),
+                'segmentation_params': [value.item() if isinstance(value, np.generic) else value
+                                        for value in prepared['segmentation_params']],
+                'contour': _points_to_json(segmentation['contour']),
+                'points': _points_to_json(segmentation['points']),
+                'centroid': list(segmentation['centroid']) if segmentation['centroid'] else None,
+                'segmentation_is_black_bg': bool(segmentation['is_black_bg'])}
+        if segmentation.get('centroid_error') is not None:
+            meta['centroid_error'] = segmentation['centroid_error']
+        try:
+            os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+            _save_npy(image_file, prepared['processed'])
+            _save_npy(mask_file, segmentation['mask'])
+            _save_json(meta_path, meta)
+            self._record_digest(image_path, digest)
+            size = sum(os.path.getsize(path) for path in (meta_path, image_file, mask_file))
+        except OSError as e:
+            print(f"写入处理缓存失败: {e}")
+            return False
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+            need_prune = self._total_bytes is None or self._total_bytes > self.max_bytes
+        if need_prune:
+            self.prune()
+        return True
+
+    def entries(self):
+        """列出缓存条目
+
+        Returns:
+            list: 按最近使用时间从旧到新排列的 (最近使用时间, 字节数, 键)
+        """
+        result = []
+        if not os.path.isdir(self.cache_dir):
+            return result
+        for sub_dir in os.listdir(self.cache_dir):
+            sub_path = os.path.join(self.cache_dir, sub_dir)
+            if not os.path.isdir(sub_path):
+                continue
+            for name in os.listdir(sub_path):
+                if not name.endswith('.json'):
+                    continue
+                key = name[:-len('.json')]
+                size = 0
+                last_used = None
+                for i, path in enumerate(self._entry_paths(key)):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    size += stat.st_size
+                    if i == 0:
+                        last_used = stat.st_mtime
+                if last_used is not None:
+                    result.append((last_used, size, key))
+        result.sort()
+        return result
+
+    def remove(self, key):
+        """删除一个条目（先删数据文件，最后删元数据）
+
+        文件仍被打开或内存映射时（Windows上）删除会失败：此时保留元数据，
+        条目仍会被entries()列出，留待以后的prune再删。
+
+        Returns:
+            bool: 是否已全部删除
+        """
+        meta_path, image_file, mask_file = self._entry_paths(key)
+        for path in (image_file, mask_file, meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"删除处理缓存条目失败，稍后重试: {path}: {e}")
+                return False
+        return True
+
+    def prune(self, max_bytes=None):
+        """淘汰最久未使用的条目，直到总大小不超过max_bytes（None表示使用self.max_bytes）；
+        暂时无法删除的条目跳过
+
+        Returns:
+            tuple: (删除的条目数, 释放的字节数)
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = freed = 0
+        for _, size, key in entries:
+            if total <= max_bytes:
+                break
+            if not self.remove(key):
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        with self._lock:
+            self._total_bytes = total
+        return removed, freed
+
+    def clear(self):
+        """删除所有条目和index记录"""
+        result = self.prune(0)
+        shutil.rmtree(os.path.join(self.cache_dir, 'index'), ignore_errors=True)
+        return result
+
+    def stats(self):
+        """缓存统计：条目数和占用字节数"""
+        entries = self.entries()
+        return {'entries': len(entries), 'bytes': sum(size for _, size, _ in entries)}
+
+
+def main(argv=None):
+    """命令行：python -m core.processing_cache {stats,prune,clear}"""
+    parser = argparse.ArgumentParser(prog='python -m core.processing_cache', description='管理磁盘处理缓存')
+    parser.add_argument('--dir', default=DEFAULT_PROCESSING_CACHE_DIR, help='缓存目录')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='显示条目数和占用空间')
+    prune_parser = commands.add_parser('prune', help='按最近使用时间淘汰条目')
+    prune_parser.add_argument('--max-mb', type=float, default=DEFAULT_PROCESSING_CACHE_BYTES / (1024 * 1024),
+                              help='保留的最大容量（MB）')
+    commands.add_parser('clear', help='删除所有条目')
+    args = parser.parse_args(argv)
+
+    cache = ProcessingCache(args.dir)
+    if args.command == 'prune':
+        removed, freed = cache.prune(int(args.max_mb * 1024 * 1024))
+        print(f"已删除 {removed} 个条目，释放 {freed / (1024 * 1024):.1f}MB")
+    elif args.command == 'clear':
+        removed, freed = cache.clear()
+        print(f"已删除 {removed} 个条目，释放 {freed / (1024 * 1024):.1f}MB")
+    stats = cache.stats()
+    print(f"处理缓存 {args.dir}: {stats['entries']} 个条目，{stats['bytes'] / (1024 * 1024):.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+# 默认编码参数：format为输出扩展名（None表示沿用目标文件的扩展名）
+DEFAULT_SAVE_OPTIONS = {
+    'format': None,
+    'jpeg_quality': 95,
+    'png_compression': 3,
+    'webp_quality': 95,
+}
+
+
+def encode_image(img, ext, options=None):
+    """按扩展名和编码参数用cv2.imencode编码图像
+
+    Args:
+        img: BGR图像数组
+        ext: 扩展名（如'.png'、'.jpg'）
+        options: 编码参数，见DEFAULT_SAVE_OPTIONS
+
+    Returns:
+        numpy数组形式的编码数据
+
+    Raises:
+        ValueError: 编码失败
+    """
+    options = {**DEFAULT_SAVE_OPTIONS, **(options or {})}
+    ext = ext.lower()
+    if ext in ('.jpg', '.jpeg'):
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(options['jpeg_quality'])]
+    elif ext == '.png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(options['png_compression'])]
+    elif ext == '.webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(options['webp_quality'])]
+    else:
+        params = []
+    ok, encoded = cv2.imencode(ext, img, params)
+    if not ok:
+        raise ValueError(f"无法编码为{ext}格式")
+    return encoded
+
+
+def atomic_write(path, data):
+    """先写入同目录下的临时文件再用os.replace替换目标文件，中途出错不会留下写了一半的文件"""
+    dir_path = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.saving_', suffix=os.path.splitext(path)[1], dir=dir_path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(memoryview(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_image_file(path, img, options=None):
+    """编码并原子地写入图像文件（扩展名决定格式）"""
+    atomic_write(path, encode_image(img, os.path.splitext(path)[1] or '.png', options))
+
+
+class SaveQueue:
+    """后台保存队列
+
+    保存任务在单独的写入线程中执行，界面线程只提交任务。
+    同一目标文件的任务尚未开始时再次提交，只保留最新的一次（合并），coalesced_count记录被合并的次数。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='save')
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.coalesced_count = 0
+
+    @property
+    def pending_count(self):
+        """尚未开始的保存任务数"""
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, path, write_func, done_func=None):
+        """提交保存任务
+
+        Args:
+            path: 目标文件路径（合并任务的依据）
+            write_func: 在写入线程执行的函数，参数为目标路径，负责生成并写入文件
+            done_func: 完成后在写入线程调用的函数，参数为 (目标路径, 错误)，成功时错误为None
+
+        Returns:
+            bool: 是否与尚未开始的同一目标任务合并
+        """
+        key = os.path.abspath(path)
+        with self._lock:
+            coalesced = key in self._pending
+            self._pending[key] = (path, write_func, done_func)
+            if coalesced:
+                self.coalesced_count += 1
+                return True
+        self._executor.submit(self._run, key)
+        return False
+
+    def _run(self, key):
+        with self._lock:
+            path, write_func, done_func = self._pending.pop(key)
+        error = None
+        try:
+            write_func(path)
+        except Exception as e:
+            error = e
+        if done_func is not None:
+            done_func(path, error)
+
+    def wait(self):
+        """等待已提交的保存任务全部完成"""
+        self._executor.submit(lambda: None).result()
+
+    def shutdown(self, wait=True):
+        """关闭写入线程（默认等待尚未完成的保存）"""
+        self._executor.shutdown(wait=wait)
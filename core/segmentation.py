@@ -0,0 +1,495 @@
+import cv2
+import numpy as np
+
+# 背景分类使用的缩小图最长边（像素）
+BACKGROUND_SAMPLE_SIZE = 512
+
+
+def calculate_centroid(pts):
+    """对多边形区域进行质心计算
+    
+    Args:
+        pts: 多边形顶点数组，形状为 (N, 2)
+        
+    Returns:
+        tuple: 质心坐标 (cx, cy)，如果计算失败返回 None
+    """
+    cnt = pts.astype(np.float32).reshape((-1, 1, 2))
+    M = cv2.moments(cnt)
+    if M['m00'] != 0:
+        cx = int(M['m10'] / M['m00'])
+        cy = int(M['m01'] / M['m00'])
+        return (cx, cy)
+    return None
+
+
+def is_black_background(img):
+    """检测图像是否为黑底图像
+    
+    Args:
+        img: RGB图像数组
+        
+    Returns:
+        bool: 如果是黑底图像返回 True，否则返回 False
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    mean_brightness = np.mean(gray)
+    black_pixels = np.sum(gray < 50)
+    total_pixels = gray.shape[0] * gray.shape[1]
+    black_ratio = black_pixels / total_pixels
+    edges = cv2.Canny(gray, 100, 200)
+    edge_density = np.sum(edges > 0) / total_pixels
+    return mean_brightness < 80 and black_ratio > 0.6 and edge_density > 0.001
+
+
+def classify_background(img, max_side=BACKGROUND_SAMPLE_SIZE):
+    """在缩小的图像上检测是否为黑底图像
+    
+    Args:
+        img: RGB图像数组
+        max_side: 缩小图的最长边，None表示使用原图
+        
+    Returns:
+        bool: 如果是黑底图像返回 True，否则返回 False
+    """
+    height, width = img.shape[:2]
+    if max_side and max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return bool(is_black_background(img))
+
+
+def apply_threshold_separation(img, lower, upper, is_black_bg=None):
+    """实现色调分离预处理方法，适应黑底和白底图像
+    
+    Args:
+        img: RGB图像数组
+        lower: 色调分离下界
+        upper: 色调分离上界
+        is_black_bg: 是否黑底图像，None表示自动检测
+        
+    Returns:
+        mask: 处理后的二值掩码
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    
+    if is_black_bg is None:
+        is_black_bg = is_black_background(img)
+    
+    # 黑底图像只需要近白像素，白底图像只需要近黑像素
+    if is_black_bg:
+        extra_mask = np.all(img > 200, axis=2).astype(np.uint8) * 255
+    else:
+        extra_mask = np.all(img < 50, axis=2).astype(np.uint8) * 255
+    
+    return _threshold_planes(gray, extra_mask, lower, upper, is_black_bg)
+
+
+def _threshold_planes(gray, extra_mask, lower, upper, is_black_bg):
+    """由灰度平面和近白/近黑像素掩码得到色调分离掩码（apply_threshold_separation中与阈值有关的部分）"""
+    if is_black_bg:
+        base_mask = cv2.inRange(gray, lower, 255)
+    else:
+        base_mask = cv2.inRange(gray, lower, upper)
+    
+    mask = cv2.bitwise_or(base_mask, extra_mask)
+    
+    kernel = np.ones((2, 2), np.uint8)
+    mask = cv2.dilate(mask, kernel, iterations=1)
+    mask = cv2.erode(mask, kernel, iterations=1)
+    
+    return mask
+
+
+def select_outline(contours, is_black_bg, scale=1.0):
+    """从轮廓列表中选出面积最大的有效轮廓
+    
+    Args:
+        contours: cv2.findContours得到的轮廓列表
+        is_black_bg: 是否黑底图像
+        scale: 轮廓所在图像相对原图的缩放比例，用于换算面积和长度阈值
+        
+    Returns:
+        选中的轮廓，没有轮廓时返回None
+    """
+    if not contours:
+        return None
+    
+    valid_contours = []
+    if is_black_bg:
+        min_area = 500 * scale * scale
+        min_length = 500 * scale
+        for cnt in contours:
+            area = cv2.contourArea(cnt)
+            length = cv2.arcLength(cnt, True)
+            if area >= min_area or length >= min_length:
+                valid_contours.append(cnt)
+    else:
+        min_area = 3000 * scale * scale
+        for cnt in contours:
+            area = cv2.contourArea(cnt)
+            if area >= min_area:
+                valid_contours.append(cnt)
+    
+    if not valid_contours:
+        valid_contours = contours
+    
+    return max(valid_contours, key=cv2.contourArea)
+
+
+def approximate_outline(contour, is_black_bg):
+    """对轮廓做多边形近似并计算质心，返回 (顶点数组, 质心)"""
+    if is_black_bg:
+        epsilon = 0.001 * cv2.arcLength(contour, True)
+    else:
+        epsilon = 0.003 * cv2.arcLength(contour, True)
+    
+    approx = cv2.approxPolyDP(contour, epsilon, True)
+    
+    new_points = approx.reshape(-1, 2)
+    return new_points, calculate_centroid(new_points)
+
+
+def find_outline(img, lower, upper, is_black_bg=None):
+    """检测图像的主轮廓和质心
+    
+    Args:
+        img: 图像数组
+        lower: 色调分离下界
+        upper: 色调分离上界
+        is_black_bg: 是否黑底图像，None表示自动检测
+        
+    Returns:
+        dict: mask 为色调分离掩码，contour 为选中的最大有效轮廓（没有则为None），
+              points 为近似多边形顶点，centroid 为质心（计算失败为None），
+              is_black_bg 为是否黑底图像
+    """
+    if is_black_bg is None:
+        is_black_bg = is_black_background(img)
+    
+    mask = apply_threshold_separation(img, lower, upper, is_black_bg)
+    
+    blurred = cv2.GaussianBlur(mask, (5, 5), 0)
+    
+    contours, hierarchy = cv2.findContours(blurred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1)
+    
+    result = {'mask': mask, 'contour': None, 'points': None, 'centroid': None, 'is_black_bg': is_black_bg}
+    max_cnt = select_outline(contours, is_black_bg)
+    if max_cnt is None:
+        return result
+    
+    result['contour'] = max_cnt
+    result['points'], result['centroid'] = approximate_outline(max_cnt, is_black_bg)
+    return result
+
+
+# 色调分离实时预览所用缩小图的最长边
+THRESHOLD_PROXY_SIZE = 640
+
+
+def make_threshold_proxy(img, is_black_bg, max_side=THRESHOLD_PROXY_SIZE):
+    """生成色调分离实时预览用的缩小图
+    
+    缩小图上预先计算好灰度平面和近白/近黑像素掩码，拖动滑块时只需重新做阈值判断。
+    
+    Args:
+        img: 图像数组
+        is_black_bg: 是否黑底图像
+        max_side: 缩小图的最长边
+        
+    Returns:
+        dict: gray 为灰度平面，extra_mask 为近白（黑底）或近黑（白底）像素掩码，
+              scale 为缩小图相对原图的比例，is_black_bg 为是否黑底图像
+    """
+    height, width = img.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale < 1.0:
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    if is_black_bg:
+        extra_mask = np.all(img > 200, axis=2).astype(np.uint8) * 255
+    else:
+        extra_mask = np.all(img < 50, axis=2).astype(np.uint8) * 255
+    return {'gray': cv2.cvtColor(img, cv2.COLOR_RGB2GRAY), 'extra_mask': extra_mask,
+            'scale': scale, 'is_black_bg': is_black_bg}
+
+
+def find_outline_proxy(proxy, lower, upper):
+    """在缩小图上检测主轮廓和质心（色调分离实时预览用），结果换算回原图坐标
+    
+    Args:
+        proxy: make_threshold_proxy生成的缩小图
+        lower: 色调分离下界
+        upper: 色调分离上界
+        
+    Returns:
+        dict: 字段同find_outline（mask为缩小图上的掩码），另有 approximate 为True
+    """
+    is_black_bg = proxy['is_black_bg']
+    scale = proxy['scale']
+    mask = _threshold_planes(proxy['gray'], proxy['extra_mask'], lower, upper, is_black_bg)
+    blurred = cv2.GaussianBlur(mask, (5, 5), 0)
+    contours, hierarchy = cv2.findContours(blurred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1)
+    
+    result = {'mask': mask, 'contour': None, 'points': None, 'centroid': None,
+              'is_black_bg': is_black_bg, 'approximate': True}
+    max_cnt = select_outline(contours, is_black_bg, scale=scale)
+    if max_cnt is None:
+        return result
+    
+    points, centroid = approximate_outline(max_cnt, is_black_bg)
+    result['contour'] = ((max_cnt + 0.5) / scale).astype(np.int32)
+    result['points'] = ((points + 0.5) / scale).astype(np.int32)
+    if centroid:
+        result['centroid'] = (int((centroid[0] + 0.5) / scale), int((centroid[1] + 0.5) / scale))
+    return result
+
+
+def _threshold_pixels(pixels, lower, upper, is_black_bg):
+    """对一组像素（形状为 (N, 3)）做与apply_threshold_separation相同的逐像素阈值判断"""
+    gray = cv2.cvtColor(pixels.reshape(-1, 1, 3), cv2.COLOR_RGB2GRAY).reshape(-1)
+    if is_black_bg:
+        base = gray >= lower
+        extra = np.all(pixels > 200, axis=1)
+    else:
+        base = (gray >= lower) & (gray <= upper)
+        extra = np.all(pixels < 50, axis=1)
+    return (base | extra).astype(np.uint8) * 255
+
+
+def find_outline_pyramid(img, lower, upper, is_black_bg=None, levels=2, compare_full=False):
+    """由粗到细的轮廓检测
+    
+    先在缩小 2**levels 倍的图像上找到最大有效轮廓，再回到原分辨率，
+    只在该轮廓附近的窄带内重新做阈值判断并细化轮廓和质心。
+    
+    Args:
+        img: 图像数组
+        lower: 色调分离下界
+        upper: 色调分离上界
+        is_black_bg: 是否黑底图像，None表示自动检测
+        levels: 金字塔层数（2为1/4，3为1/8），0表示直接使用原分辨率
+        compare_full: 是否同时运行原分辨率检测并报告质心误差
+        
+    Returns:
+        dict: 字段同find_outline，另有 centroid_error 为与原分辨率结果的质心距离（像素，未比较时为None）
+    """
+    if is_black_bg is None:
+        is_black_bg = is_black_background(img)
+    if levels <= 0:
+        result = find_outline(img, lower, upper, is_black_bg)
+        result['centroid_error'] = 0.0 if compare_full else None
+        return result
+    
+    height, width = img.shape[:2]
+    factor = 2 ** levels
+    small_size = (max(1, width // factor), max(1, height // factor))
+    small = cv2.resize(img, small_size, interpolation=cv2.INTER_AREA)
+    scale_x = width / small_size[0]
+    scale_y = height / small_size[1]
+    
+    # 粗检测：在缩小图上找最大有效轮廓
+    small_mask = apply_threshold_separation(small, lower, upper, is_black_bg)
+    small_blurred = cv2.GaussianBlur(small_mask, (5, 5), 0)
+    contours, hierarchy = cv2.findContours(small_blurred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1)
+    coarse_cnt = select_outline(contours, is_black_bg, scale=1.0 / factor)
+    if coarse_cnt is None:
+        result = find_outline(img, lower, upper, is_black_bg)
+        result['centroid_error'] = 0.0 if compare_full else None
+        return result
+    
+    # 把粗轮廓映射回原分辨率（取缩小像素的中心）
+    coarse_full = coarse_cnt.astype(np.float64)
+    coarse_full[:, :, 0] = (coarse_full[:, :, 0] + 0.5) * scale_x
+    coarse_full[:, :, 1] = (coarse_full[:, :, 1] + 0.5) * scale_y
+    coarse_full = coarse_full.astype(np.int32)
+    
+    # 细化区域：粗轮廓的外接矩形向外扩展一个窄带宽度
+    band_width = 2 * factor + 4
+    x, y, w, h = cv2.boundingRect(coarse_full)
+    x0, y0 = max(x - band_width, 0), max(y - band_width, 0)
+    x1, y1 = min(x + w + band_width, width), min(y + h + band_width, height)
+    local_cnt = coarse_full - np.array([x0, y0], dtype=np.int32)
+    
+    # 窄带内的像素重新按原分辨率做阈值判断，窄带以内视为轮廓内部，窄带以外视为背景
+    band = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    cv2.drawContours(band, [local_cnt], -1, 255, 2 * band_width)
+    refined = np.zeros_like(band)
+    cv2.drawContours(refined, [local_cnt], -1, 255, -1)
+    refined[band > 0] = 0
+    band_y, band_x = np.nonzero(band)
+    refined[band_y, band_x] = _threshold_pixels(img[band_y + y0, band_x + x0], lower, upper, is_black_bg)
+    
+    kernel = np.ones((2, 2), np.uint8)
+    refined = cv2.dilate(refined, kernel, iterations=1)
+    refined = cv2.erode(refined, kernel, iterations=1)
+    
+    blurred = cv2.GaussianBlur(refined, (5, 5), 0)
+    contours, hierarchy = cv2.findContours(blurred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1,
+                                           offset=(x0, y0))
+    
+    mask = np.zeros((height, width), dtype=np.uint8)
+    mask[y0:y1, x0:x1] = refined
+    result = {'mask': mask, 'contour': None, 'points': None, 'centroid': None,
+              'is_black_bg': is_black_bg, 'centroid_error': None}
+    max_cnt = select_outline(contours, is_black_bg)
+    if max_cnt is not None:
+        result['contour'] = max_cnt
+        result['points'], result['centroid'] = approximate_outline(max_cnt, is_black_bg)
+    
+    if compare_full:
+        full_centroid = find_outline(img, lower, upper, is_black_bg)['centroid']
+        if full_centroid and result['centroid']:
+            result['centroid_error'] = float(np.hypot(result['centroid'][0] - full_centroid[0],
+                                                      result['centroid'][1] - full_centroid[1]))
+    return result
+
+
+# 画笔脏矩形四周额外重新计算的边距（覆盖色调分离中2x2形态学运算的邻域）
+BRUSH_ROI_MARGIN = 2
+
+
+def brush_dirty_rect(start, end, brush_size, shape):
+    """计算一笔画笔影响的脏矩形
+    
+    Args:
+        start: 起点 (x, y)
+        end: 终点 (x, y)，None表示只画一个圆点
+        brush_size: 画笔粗细
+        shape: 图像形状
+        
+    Returns:
+        tuple: (x0, y0, x1, y1)，已裁剪到图像范围内，与图像不相交时返回None
+    """
+    height, width = shape[:2]
+    if end is None:
+        end = start
+    pad = brush_size // 2 + 2
+    x0 = max(min(start[0], end[0]) - pad, 0)
+    y0 = max(min(start[1], end[1]) - pad, 0)
+    x1 = min(max(start[0], end[0]) + pad + 1, width)
+    y1 = min(max(start[1], end[1]) + pad + 1, height)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1, y1)
+
+
+# 增量更新时保存轮廓区域的分块大小（像素）
+REGION_TILE_SIZE = 64
+
+
+def init_incremental_outline(result):
+    """为轮廓检测结果准备增量更新所需的面积矩和区域分块
+    
+    面积矩 (m00, m10, m01) 从近似多边形本身计算，这样第一笔之前的质心与完整检测的结果完全一致。
+    轮廓区域（近似多边形的填充）不整图保存：只有被画笔修改过的分块保存在result['region_tiles']中，
+    其余部分需要时从多边形局部填充。
+    """
+    moments = (0.0, 0.0, 0.0)
+    if result['points'] is not None:
+        M = cv2.moments(result['points'].astype(np.float32).reshape((-1, 1, 2)))
+        moments = (M['m00'], M['m10'], M['m01'])
+    result['region_tiles'] = {}
+    result['moments'] = moments
+
+
+def _fill_outline_region(result, rect):
+    """在rect (x0, y0, x1, y1) 大小的遮罩中填充近似多边形"""
+    x0, y0, x1, y1 = rect
+    region = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    if result['points'] is not None:
+        cv2.fillPoly(region, [result['points'].astype(np.int32)], 255, offset=(-x0, -y0))
+    return region
+
+
+def _region_tiles(rect):
+    """与rect相交的分块：(分块键, 分块矩形, 交集矩形)"""
+    x0, y0, x1, y1 = rect
+    for ty in range(y0 // REGION_TILE_SIZE, (y1 - 1) // REGION_TILE_SIZE + 1):
+        for tx in range(x0 // REGION_TILE_SIZE, (x1 - 1) // REGION_TILE_SIZE + 1):
+            tile_rect = (tx * REGION_TILE_SIZE, ty * REGION_TILE_SIZE,
+                         (tx + 1) * REGION_TILE_SIZE, (ty + 1) * REGION_TILE_SIZE)
+            overlap = (max(x0, tile_rect[0]), max(y0, tile_rect[1]), min(x1, tile_rect[2]), min(y1, tile_rect[3]))
+            yield (ty, tx), tile_rect, overlap
+
+
+def _read_outline_region(result, rect):
+    """读取rect内的轮廓区域遮罩：多边形填充，被修改过的分块以分块内容为准"""
+    x0, y0, x1, y1 = rect
+    region = _fill_outline_region(result, rect)
+    for key, tile_rect, (ox0, oy0, ox1, oy1) in _region_tiles(rect):
+        tile = result['region_tiles'].get(key)
+        if tile is not None:
+            region[oy0 - y0:oy1 - y0, ox0 - x0:ox1 - x0] = \
+                tile[oy0 - tile_rect[1]:oy1 - tile_rect[1], ox0 - tile_rect[0]:ox1 - tile_rect[0]]
+    return region
+
+
+def _write_outline_region(result, rect, region):
+    """把rect内的轮廓区域遮罩写入分块（分块第一次修改时先从多边形填充）"""
+    x0, y0, x1, y1 = rect
+    for key, tile_rect, (ox0, oy0, ox1, oy1) in _region_tiles(rect):
+        tile = result['region_tiles'].get(key)
+        if tile is None:
+            tile = result['region_tiles'][key] = _fill_outline_region(result, tile_rect)
+        tile[oy0 - tile_rect[1]:oy1 - tile_rect[1], ox0 - tile_rect[0]:ox1 - tile_rect[0]] = \
+            region[oy0 - y0:oy1 - y0, ox0 - x0:ox1 - x0]
+
+
+def update_outline_roi(result, img, rect, stroke, lower, upper):
+    """画笔修改后只在脏矩形内更新轮廓检测结果（原地修改result）
+    
+    色调分离掩码只在脏矩形（加上形态学边距）内重新计算；笔画与轮廓区域相连时，
+    脏矩形内的轮廓区域按新掩码重新计算：笔画从掩码中擦掉的像素移出轮廓区域，
+    笔画新加到掩码上的像素并入轮廓区域。面积矩减去脏矩形内旧区域的矩、加上新区域的矩，
+    轮廓区域只保存被修改过的分块，因此每一笔的开销和内存只与笔画大小有关。
+    增量结果是近似的（笔画围出的新区域不会被填充），result['approximate']被置为True，
+    应在画笔结束后重新做一次完整检测。
+    
+    Args:
+        result: find_outline/find_outline_pyramid的结果
+        img: 修改后的图像
+        rect: 脏矩形 (x0, y0, x1, y1)
+        stroke: 脏矩形大小的笔画遮罩（非零为笔画覆盖的像素）
+        lower: 色调分离下界
+        upper: 色调分离上界
+        
+    Returns:
+        dict: 更新后的result
+    """
+    if 'moments' not in result:
+        init_incremental_outline(result)
+    
+    x0, y0, x1, y1 = rect
+    height, width = img.shape[:2]
+    ex0, ey0 = max(x0 - BRUSH_ROI_MARGIN, 0), max(y0 - BRUSH_ROI_MARGIN, 0)
+    ex1, ey1 = min(x1 + BRUSH_ROI_MARGIN, width), min(y1 + BRUSH_ROI_MARGIN, height)
+    roi_mask = apply_threshold_separation(img[ey0:ey1, ex0:ex1], lower, upper, result['is_black_bg'])
+    roi_mask = roi_mask[y0 - ey0:y1 - ey0, x0 - ex0:x1 - ex0]
+    old_mask = result['mask'][y0:y1, x0:x1].copy()
+    result['mask'][y0:y1, x0:x1] = roi_mask
+    
+    region = _read_outline_region(result, rect)
+    result['approximate'] = True
+    # 与轮廓区域不相连的笔画不会改变最大轮廓，只更新掩码
+    touching = cv2.bitwise_and(cv2.dilate(stroke, np.ones((3, 3), np.uint8)), region)
+    if not cv2.countNonZero(touching):
+        return result
+    
+    old = cv2.moments(region, binaryImage=True)
+    erased = cv2.bitwise_and(cv2.bitwise_and(stroke, old_mask), cv2.bitwise_not(roi_mask))
+    updated = cv2.bitwise_or(cv2.bitwise_and(region, cv2.bitwise_not(erased)), cv2.bitwise_and(roi_mask, stroke))
+    new = cv2.moments(updated, binaryImage=True)
+    _write_outline_region(result, rect, updated)
+    
+    # 局部矩换算到全图坐标：m10 = m10_local + x0 * m00_local
+    d00 = new['m00'] - old['m00']
+    d10 = (new['m10'] - old['m10']) + x0 * d00
+    d01 = (new['m01'] - old['m01']) + y0 * d00
+    m00, m10, m01 = result['moments']
+    m00, m10, m01 = m00 + d00, m10 + d10, m01 + d01
+    result['moments'] = (m00, m10, m01)
+    if m00 > 0:
+        result['centroid'] = (int(m10 / m00), int(m01 / m00))
+    return result
@@ -0,0 +1,78 @@
+import time
+
+import cv2
+
+from core.glyph_atlas import get_glyph_atlas, stamp_sprite
+
+
+class TextLayer:
+    """统一的文字渲染阶段
+
+    各罗盘圈只登记文字绘制命令，最后由render()一次性贴到BGRA叠加层上。
+    每个标签从共享的标签图集取出预先光栅化的精灵图，用NumPy切片叠加，
+    不再对整帧做BGR和PIL之间的往返转换。颜色均为BGR顺序（与OpenCV一致）。
+    """
+
+    def __init__(self, atlas=None):
+        self.commands = []
+        self.atlas = atlas if atlas is not None else get_glyph_atlas()
+        self.last_render_ms = 0.0
+        # 坐标、字号和边框宽度的缩放比例（在缩小的预览图上绘制时小于1）
+        self.scale = 1.0
+        # 叠加层左上角对应的原图坐标（只绘制可见区域时不为0）
+        self.origin = (0, 0)
+
+    def clear(self):
+        """清空已登记的文字命令"""
+        self.commands = []
+
+    def add_label(self, x, y, label, font_size, fill, background=None, outline=None, outline_width=0):
+        """登记一个文字标签
+
+        Args:
+            x, y: 标签中心坐标
+            label: 文字
+            font_size: 字号
+            fill: 文字颜色（BGR）
+            background: 圆形背景颜色（BGR），None表示不画背景
+            outline: 圆形边框颜色（BGR），None表示不画边框
+            outline_width: 圆形边框宽度
+            
+        坐标按原图给出，登记时按self.origin和self.scale换算到叠加层坐标。
+        """
+        scale = self.scale
+        x, y = x - self.origin[0], y - self.origin[1]
+        if scale != 1.0:
+            x, y = x * scale, y * scale
+            font_size = max(1, int(round(font_size * scale)))
+            if outline_width:
+                outline_width = max(1, int(round(outline_width * scale)))
+        self.commands.append((int(x), int(y), label, font_size, fill, background, outline, outline_width))
+
+    def render(self, layer):
+        """把所有登记的文字贴到BGRA叠加层上，返回耗时（毫秒）"""
+        start_time = time.perf_counter()
+        try:
+            import PIL  # noqa: F401  标签图集依赖PIL
+        except ImportError:
+            self._render_fallback(layer)
+            self.last_render_ms = (time.perf_counter() - start_time) * 1000
+            return self.last_render_ms
+
+        for x, y, label, font_size, fill, background, outline, outline_width in self.commands:
+            sprite, offset_x, offset_y = self.atlas.get_sprite(
+                label, font_size, fill, background, outline, outline_width)
+            stamp_sprite(layer, sprite, x + offset_x, y + offset_y)
+
+        self.last_render_ms = (time.perf_counter() - start_time) * 1000
+        return self.last_render_ms
+
+    def _render_fallback(self, layer):
+        """PIL不可用时使用cv2绘制文字（不支持中文）"""
+        for x, y, label, font_size, fill, background, outline, outline_width in self.commands:
+            try:
+                cv2.putText(layer, label, (x - 10, y + 5),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, tuple(fill) + (255,), 2)
+            except Exception as e:
+                print(f"使用cv2绘制文字时出错: {e}")
+                continue
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import tempfile
+
+# 缩略图最长边（像素）
+THUMBNAIL_SIZE = 160
+# 默认缩略图缓存目录
+DEFAULT_THUMBNAIL_DIR = os.path.join(os.path.expanduser('~'), '.luopan_cache', 'thumbnails')
+
+
+class ThumbnailCache:
+    """磁盘缩略图缓存
+
+    缩略图按（绝对路径、文件大小、修改时间、缩略图尺寸）的哈希命名保存为JPEG，
+    原图被修改后键随之变化，自动重新生成；生成时用PIL的draft模式按JPEG DCT缩小解码，不读取原尺寸图像。
+    get_or_create可在后台线程调用。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_THUMBNAIL_DIR, size=THUMBNAIL_SIZE):
+        self.cache_dir = cache_dir
+        self.size = size
+
+    def thumbnail_path(self, image_path):
+        """缩略图在缓存中的路径，原图不存在时返回None"""
+        image_path = os.path.abspath(image_path)
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        key = f"{image_path}|{stat.st_size}|{stat.st_mtime_ns}|{self.size}"
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.jpg'
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def get(self, image_path):
+        """已缓存的缩略图路径，没有缓存时返回None"""
+        path = self.thumbnail_path(image_path)
+        return path if path is not None and os.path.exists(path) else None
+
+    def get_or_create(self, image_path):
+        """获取缩略图路径，没有缓存时生成并写入缓存
+
+        Returns:
+            str: 缩略图路径，原图无法读取时返回None
+        """
+        path = self.thumbnail_path(image_path)
+        if path is None:
+            return None
+        if os.path.exists(path):
+            return path
+
+        from PIL import Image as PILImage
+        try:
+            with PILImage.open(image_path) as img:
+                img.draft('RGB', (self.size, self.size))
+                img.thumbnail((self.size, self.size))
+                thumb = img.convert('RGB')
+        except Exception as e:
+            print(f"生成缩略图失败: {image_path}: {e}")
+            return None
+
+        # 先写临时文件再替换，其他线程或进程不会读到写了一半的缩略图
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.jpg', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                thumb.save(f, 'JPEG', quality=85)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入缩略图缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        return path
@@ -0,0 +1,255 @@
+import atexit
+import math
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from core.save_queue import atomic_write, encode_image
+
+# 分块边长（像素）
+TILE_SIZE = 512
+
+
+def remove_temp_dir(path):
+    """删除临时目录，失败时（例如Windows上文件仍被内存映射）打印原因并在程序退出时重试
+
+    Returns:
+        bool: 是否删除成功
+    """
+    try:
+        shutil.rmtree(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"删除临时目录失败，将在退出时重试: {path}: {e}")
+        atexit.register(shutil.rmtree, path, True)
+        return False
+    return True
+
+
+class TiledImage:
+    """分块图像金字塔
+
+    第0层为原分辨率，之后每层按2x2平均缩小一半，直到最长边不超过一个分块。
+    各层存放在内存中（storage='memory'）或临时目录下的内存映射文件中（storage='disk'），
+    读取时按分块加载并用LRU缓存最近使用的分块，内存占用只与视口大小有关，与原图大小无关。
+    """
+
+    def __init__(self, height, width, channels=3, tile_size=TILE_SIZE, storage='disk', max_cached_tiles=256):
+        self.tile_size = tile_size
+        self.channels = channels
+        self.storage = storage
+        self.max_cached_tiles = max_cached_tiles
+        self._tiles = OrderedDict()
+        self.tile_hits = 0
+        self.tile_misses = 0
+        self._dir = tempfile.mkdtemp(prefix='luopan_tiles_') if storage == 'disk' else None
+        # 未调用close()就被回收（或程序退出）时也删除内存映射文件
+        self._finalizer = weakref.finalize(self, remove_temp_dir, self._dir) if self._dir else None
+        self.levels = [self._new_level(0, height, width)]
+
+    @classmethod
+    def from_array(cls, img, **kwargs):
+        """从图像数组创建金字塔（按条带复制，不产生第二份整图副本）"""
+        height, width = img.shape[:2]
+        tiled = cls(height, width, img.shape[2] if img.ndim == 3 else 1, **kwargs)
+        strip = tiled.tile_size
+        for y in range(0, height, strip):
+            tiled.base[y:y+strip] = img[y:y+strip]
+        tiled.build_pyramid()
+        return tiled
+
+    @property
+    def base(self):
+        """第0层（原分辨率）数组"""
+        return self.levels[0]
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    def _new_level(self, level, height, width):
+        shape = (height, width, self.channels) if self.channels > 1 else (height, width)
+        if self._dir is None:
+            return np.zeros(shape, dtype=np.uint8)
+        path = os.path.join(self._dir, f'level{level}.dat')
+        return np.memmap(path, dtype=np.uint8, mode='w+', shape=shape)
+
+    def build_pyramid(self):
+        """由第0层逐层生成缩小一半的各层"""
+        del self.levels[1:]
+        self._tiles.clear()
+        level = 0
+        while max(self.levels[level].shape[:2]) > self.tile_size:
+            src = self.levels[level]
+            height, width = max(1, src.shape[0] // 2), max(1, src.shape[1] // 2)
+            self.levels.append(self._new_level(level + 1, height, width))
+            self._downsample(level, (0, 0, width, height))
+            level += 1
+
+    def _downsample(self, level, rect):
+        """用第level层重新计算第level+1层中rect (x0, y0, x1, y1) 的像素（2x2平均，按条带处理）"""
+        src = self.levels[level]
+        dst = self.levels[level + 1]
+        x0, y0, x1, y1 = rect
+        strip = self.tile_size
+        for sy in range(y0, y1, strip):
+            ey = min(sy + strip, y1)
+            block = src[sy*2:ey*2, x0*2:x1*2]
+            if block.shape[0] < (ey - sy) * 2 or block.shape[1] < (x1 - x0) * 2:
+                # 原图只有1像素宽或高时无法2x2平均，直接取最近像素
+                dst[sy:ey, x0:x1] = cv2.resize(np.ascontiguousarray(block), (x1 - x0, ey - sy),
+                                               interpolation=cv2.INTER_NEAREST)
+            else:
+                dst[sy:ey, x0:x1] = cv2.resize(np.ascontiguousarray(block), (x1 - x0, ey - sy),
+                                               interpolation=cv2.INTER_AREA)
+
+    def update_region(self, rect):
+        """第0层在rect (x0, y0, x1, y1) 内被修改后，更新各层对应区域并丢弃受影响的缓存分块"""
+        x0, y0, x1, y1 = rect
+        for level in range(len(self.levels)):
+            self._drop_tiles(level, (x0, y0, x1, y1))
+            if level + 1 >= len(self.levels):
+                break
+            height, width = self.levels[level + 1].shape[:2]
+            x0, y0 = x0 // 2, y0 // 2
+            x1, y1 = min(width, (x1 + 1) // 2), min(height, (y1 + 1) // 2)
+            if x0 >= x1 or y0 >= y1:
+                break
+            self._downsample(level, (x0, y0, x1, y1))
+
+    def _drop_tiles(self, level, rect):
+        x0, y0, x1, y1 = rect
+        size = self.tile_size
+        for key in [key for key in self._tiles if key[0] == level]:
+            tx, ty = key[1], key[2]
+            if tx * size < x1 and (tx + 1) * size > x0 and ty * size < y1 and (ty + 1) * size > y0:
+                del self._tiles[key]
+
+    def get_tile(self, level, tx, ty):
+        """获取一个分块（按需从存储中加载，最近使用的分块保留在缓存中）"""
+        key = (level, tx, ty)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            self.tile_hits += 1
+            return tile
+
+        self.tile_misses += 1
+        size = self.tile_size
+        tile = np.array(self.levels[level][ty*size:(ty+1)*size, tx*size:(tx+1)*size])
+        self._tiles[key] = tile
+        if len(self._tiles) > self.max_cached_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def read_level_region(self, level, rect):
+        """从第level层读取rect (x0, y0, x1, y1) 区域（由分块拼接）"""
+        x0, y0, x1, y1 = rect
+        size = self.tile_size
+        shape = (y1 - y0, x1 - x0) + self.levels[level].shape[2:]
+        out = np.empty(shape, dtype=np.uint8)
+        for ty in range(y0 // size, (y1 - 1) // size + 1):
+            for tx in range(x0 // size, (x1 - 1) // size + 1):
+                tile = self.get_tile(level, tx, ty)
+                tx0, ty0 = tx * size, ty * size
+                ix0, iy0 = max(x0, tx0), max(y0, ty0)
+                ix1, iy1 = min(x1, tx0 + tile.shape[1]), min(y1, ty0 + tile.shape[0])
+                out[iy0-y0:iy1-y0, ix0-x0:ix1-x0] = tile[iy0-ty0:iy1-ty0, ix0-tx0:ix1-tx0]
+        return out
+
+    def level_for_scale(self, scale):
+        """选择分辨率不低于scale的最小一层"""
+        if scale >= 1.0:
+            return 0
+        level = int(math.floor(math.log2(1.0 / scale)))
+        return max(0, min(level, len(self.levels) - 1))
+
+    def read_region(self, rect, scale=1.0, size=None):
+        """读取原图坐标中rect (x0, y0, x1, y1) 区域，缩放scale倍
+
+        从分辨率不低于所需分辨率的最小一层读取分块，再缩放到目标尺寸。
+
+        Args:
+            rect: 原图坐标中的区域
+            scale: 缩放比例
+            size: 输出尺寸 (width, height)，None表示按scale四舍五入
+
+        Returns:
+            缩放后的区域图像
+        """
+        x0, y0, x1, y1 = rect
+        if size is None:
+            size = (max(1, int(round((x1 - x0) * scale))), max(1, int(round((y1 - y0) * scale))))
+        level = self.level_for_scale(scale)
+        factor = 2 ** level
+        height, width = self.levels[level].shape[:2]
+        lx0, ly0 = min(x0 // factor, width - 1), min(y0 // factor, height - 1)
+        lx1 = min(width, max(lx0 + 1, -(-x1 // factor)))
+        ly1 = min(height, max(ly0 + 1, -(-y1 // factor)))
+        region = self.read_level_region(level, (lx0, ly0, lx1, ly1))
+        if (region.shape[1], region.shape[0]) == tuple(size):
+            return region
+        interpolation = cv2.INTER_AREA if size[0] < region.shape[1] else cv2.INTER_CUBIC
+        return cv2.resize(region, tuple(size), interpolation=interpolation)
+
+    def close(self):
+        """释放各层和缓存，删除内存映射文件
+
+        先丢弃对各层内存映射的全部引用（文件随即删除，不需要写回），再删除临时目录；
+        调用方仍持有某一层（或其视图）时文件无法在Windows上删除，应在不再使用各层后再调用。
+        """
+        self._tiles.clear()
+        self.levels = []
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._dir = None
+
+
+def iter_tile_rects(height, width, tile_size=TILE_SIZE):
+    """按行优先顺序生成覆盖整幅图像的分块区域 (x0, y0, x1, y1)"""
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+
+
+def stream_export(path, height, width, render_tile, tile_size=TILE_SIZE, options=None):
+    """逐块渲染并导出图像
+
+    每个分块由render_tile(rect)渲染后写入磁盘上的内存映射缓冲区，渲染过程中内存里只有一个分块，
+    最后由cv2.imencode从内存映射缓冲区编码，再原子地写入目标文件。
+
+    Args:
+        path: 输出文件路径（扩展名决定格式）
+        height, width: 输出图像尺寸
+        render_tile: 渲染函数，参数为分块区域 (x0, y0, x1, y1)，返回该区域的BGR图像
+        tile_size: 分块边长
+        options: 编码参数，见save_queue.DEFAULT_SAVE_OPTIONS
+
+    Returns:
+        bool: 是否写出成功
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='luopan_export_')
+    out = None
+    try:
+        out = np.memmap(os.path.join(tmp_dir, 'export.dat'), dtype=np.uint8, mode='w+', shape=(height, width, 3))
+        for rect in iter_tile_rects(height, width, tile_size):
+            x0, y0, x1, y1 = rect
+            out[y0:y1, x0:x1] = render_tile(rect)
+        try:
+            encoded = encode_image(out, os.path.splitext(path)[1] or '.png', options)
+        except ValueError as e:
+            print(f"分块导出编码失败: {e}")
+            return False
+        atomic_write(path, encoded)
+        return True
+    finally:
+        # 先释放内存映射，临时文件才能在Windows上删除
+        out = None
+        remove_temp_dir(tmp_dir)
@@ -101,16 +101,33 @@ kv_content = """#:kivy 1.11.1
                 size_hint_x: 0.14
                 font_name: 'SimHei'
                 on_press: root.undo()
+            
+            Button:
+                text: '重做'
+                size_hint_x: 0.14
+                font_name: 'SimHei'
+                on_press: root.redo()
+            
+            Label:
+                text: root.history_usage_text
+                size_hint_x: 0.14
+                font_size: '12sp'
+                font_name: 'SimHei'
         
         # 图像显示区域
         BoxLayout:
-            size_hint_y: 0.75
+            size_hint_y: 0.63
             padding: 10
             
             Image:
                 id: image_widget
                 allow_stretch: True
         
+        # 当前目录的缩略图胶片条
+        Filmstrip:
+            id: filmstrip
+            size_hint_y: 0.12
+        
         # 底部控制栏
         BoxLayout:
             size_hint_y: 0.12
@@ -136,6 +153,7 @@ kv_content = """#:kivy 1.11.1
                     max: 255
                     value: 100
                     size_hint_y: 0.425
+                    on_value: root.on_threshold_preview(threshold_lower_slider.value, threshold_upper_slider.value)
                     on_touch_up: root.on_threshold_change(threshold_lower_slider.value, threshold_upper_slider.value)
                 
                 Slider:
@@ -144,6 +162,7 @@ kv_content = """#:kivy 1.11.1
                     max: 255
                     value: 200
                     size_hint_y: 0.425
+                    on_value: root.on_threshold_preview(threshold_lower_slider.value, threshold_upper_slider.value)
                     on_touch_up: root.on_threshold_change(threshold_lower_slider.value, threshold_upper_slider.value)
             
             # 第二列：罗盘类型
@@ -386,11 +405,13 @@ except Exception as e:
 # 导入MainScreen
 print("正在导入MainScreen...")
 from ui.screens.main_screen import MainScreen
+from ui.widgets.filmstrip import Filmstrip
 print("MainScreen导入完成")
 
 # 注册类
 Factory.register('CustomSpinnerOption', cls=CustomSpinnerOption)
 Factory.register('MainScreen', cls=MainScreen)
+Factory.register('Filmstrip', cls=Filmstrip)
 print("类注册完成")
 
 
@@ -422,6 +443,8 @@ class CompassApp(App):
     
     def on_stop(self):
         """应用停止时调用"""
+        # 关闭预取、渲染、缩略图和保存线程
+        self.root.get_screen('main').shutdown()
         print("罗盘控制器已关闭")
     
     def show_threshold_dialog(self):
@@ -0,0 +1,82 @@
+import time
+
+from kivy.clock import Clock
+
+# 脏标记：说明自上一帧以来哪些输入发生了变化
+DIRTY_IMAGE = 'image'            # processed_image像素变化（加载、处理、画笔、撤销）
+DIRTY_THRESHOLDS = 'thresholds'  # 色调分离上下界变化
+DIRTY_ROTATION = 'rotation'      # 旋转角度变化
+DIRTY_RINGS = 'rings'            # 启用的罗盘圈变化
+DIRTY_GRAPHIC = 'graphic'        # 图形罗盘的图像、位置、旋转或缩放变化
+DIRTY_VIEW = 'view'              # 视口的缩放或平移变化
+ALL_DIRTY_FLAGS = frozenset((DIRTY_IMAGE, DIRTY_THRESHOLDS, DIRTY_ROTATION, DIRTY_RINGS, DIRTY_GRAPHIC, DIRTY_VIEW))
+
+
+class RedrawScheduler:
+    """按帧合并重绘请求的调度器
+
+    事件处理函数只调用request()标记变化的内容，调度器用kivy.clock.Clock在下一帧统一重绘一次，
+    两帧之间的多次请求合并为一次，脏标记取并集后传给渲染函数，由渲染函数决定哪些阶段需要重新计算。
+    max_fps限制最高重绘频率，coalesced_count记录被合并掉的请求数。
+    """
+
+    def __init__(self, render_func, max_fps=60):
+        """
+        Args:
+            render_func: 渲染函数，参数为本帧的脏标记集合（frozenset）
+            max_fps: 最高重绘帧率，0或None表示不限制（每帧最多一次）
+        """
+        self.render_func = render_func
+        self.max_fps = max_fps
+        self.dirty = set()
+        self.request_count = 0
+        self.coalesced_count = 0
+        self.frame_count = 0
+        self._event = None
+        self._last_frame_time = None
+
+    @property
+    def pending(self):
+        """是否有尚未执行的重绘"""
+        return self._event is not None
+
+    def request(self, *flags):
+        """请求重绘，flags为脏标记（不传表示全部失效）"""
+        self.request_count += 1
+        self.dirty.update(flags or ALL_DIRTY_FLAGS)
+        if self._event is not None:
+            self.coalesced_count += 1
+            return
+        self._event = Clock.schedule_once(self._on_frame, self._next_frame_delay())
+
+    def _next_frame_delay(self):
+        """距离允许的下一帧还需等待的时间（秒），0表示下一帧即可绘制"""
+        if not self.max_fps or self._last_frame_time is None:
+            return 0
+        interval = 1.0 / self.max_fps
+        elapsed = time.perf_counter() - self._last_frame_time
+        return max(0, interval - elapsed)
+
+    def _on_frame(self, dt):
+        self._event = None
+        self.flush()
+
+    def flush(self):
+        """立即执行尚未执行的重绘（没有待重绘内容时什么也不做）"""
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+        if not self.dirty:
+            return
+        flags = frozenset(self.dirty)
+        self.dirty.clear()
+        self._last_frame_time = time.perf_counter()
+        self.frame_count += 1
+        self.render_func(flags)
+
+    def cancel(self):
+        """丢弃尚未执行的重绘"""
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+        self.dirty.clear()
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import Clock
+
+
+class RenderWorker:
+    """后台渲染线程
+
+    渲染函数在单独的工作线程中执行（OpenCV和大部分NumPy运算会释放GIL），
+    结果通过Clock回到主线程交给完成函数（例如上传纹理）。
+    同一时间最多只有一次渲染在进行：渲染期间的新提交只保留最新的一次（被取代的提交计入dropped_count），
+    当前渲染完成并交付后再开始最新的提交。已完成的渲染总会交付，连续拖动时画面也能持续更新。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='render')
+        self.dropped_count = 0
+        self._future = None
+        self._done_func = None
+        self._pending = None
+
+    def submit(self, render_func, done_func):
+        """提交一次渲染（需在主线程调用）
+
+        Args:
+            render_func: 在工作线程执行的渲染函数（无参数），返回None表示没有可显示的结果
+            done_func: 在主线程执行的完成函数，参数为渲染函数的返回值
+        """
+        if self._future is not None:
+            # 已有渲染在进行：等它完成后只渲染最新的一次
+            if self._pending is not None:
+                self.dropped_count += 1
+            self._pending = (render_func, done_func)
+            return
+        self._start(render_func, done_func)
+
+    def _start(self, render_func, done_func):
+        future = self._executor.submit(render_func)
+        self._future = future
+        self._done_func = done_func
+        future.add_done_callback(lambda f: Clock.schedule_once(lambda dt: self._finish(f)))
+
+    def _finish(self, future):
+        """在主线程交付渲染结果，然后开始等待中的最新提交（已在wait中交付的结果不重复交付）"""
+        if future is not self._future:
+            return
+        done_func = self._done_func
+        self._future = None
+        self._done_func = None
+        if self._pending is not None:
+            render_func, next_done_func = self._pending
+            self._pending = None
+            self._start(render_func, next_done_func)
+
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"后台渲染出错: {e}")
+            import traceback
+            traceback.print_exc()
+            return
+        if result is not None:
+            done_func(result)
+
+    def wait(self):
+        """等待正在进行和等待中的渲染全部完成，并立即在当前线程交付结果（需在主线程调用）"""
+        while self._future is not None:
+            future = self._future
+            try:
+                future.result()
+            except Exception:
+                pass
+            self._finish(future)
+
+    def shutdown(self):
+        """丢弃等待中的渲染并关闭工作线程"""
+        self._pending = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,93 +1,45 @@
 from kivy.uix.screenmanager import Screen
+from kivy.clock import Clock
 from kivy.properties import ObjectProperty, StringProperty
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.image import Image
-from kivy.graphics import Color, Line, Rectangle
+from kivy.graphics import Color, Ellipse, InstructionGroup, Line, Rectangle
 from kivy.core.text import Label as CoreLabel
+from core.directory_index import DirectoryIndex
+from core.image_cache import ImagePrefetcher, image_cache_key
 from core.image_processor import ImageProcessor
+from core.overlay_compositor import OverlayCompositor
+from core.processing_cache import ProcessingCache
+from core.save_queue import DEFAULT_SAVE_OPTIONS, SaveQueue, save_image_file
+from core.text_layer import TextLayer
+from core.tiled_image import stream_export
+from core.draw_list import render_segments, scale_segments, scaled_thickness
+from ui.redraw_scheduler import (RedrawScheduler, DIRTY_GRAPHIC, DIRTY_IMAGE, DIRTY_RINGS, DIRTY_ROTATION,
+                                 DIRTY_THRESHOLDS, DIRTY_VIEW)
+from ui.render_worker import RenderWorker
+from ui.view_transform import ViewTransform
 import cv2
 import numpy as np
 import os
 import sys
+import threading
+import time
 
-# 复制core.py中的函数到main_screen.py中
-def calculate_centroid(pts):
-    """对多边形区域进行质心计算
-    
-    Args:
-        pts: 多边形顶点数组，形状为 (N, 2)
-        
-    Returns:
-        tuple: 质心坐标 (cx, cy)，如果计算失败返回 None
-    """
-    cnt = pts.astype(np.float32).reshape((-1, 1, 2))
-    M = cv2.moments(cnt)
-    if M['m00'] != 0:
-        cx = int(M['m10'] / M['m00'])
-        cy = int(M['m01'] / M['m00'])
-        return (cx, cy)
-    return None
-
-
-def is_black_background(img):
-    """检测图像是否为黑底图像
-    
-    Args:
-        img: RGB图像数组
-        
-    Returns:
-        bool: 如果是黑底图像返回 True，否则返回 False
-    """
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    mean_brightness = np.mean(gray)
-    black_pixels = np.sum(gray < 50)
-    total_pixels = gray.shape[0] * gray.shape[1]
-    black_ratio = black_pixels / total_pixels
-    edges = cv2.Canny(gray, 100, 200)
-    edge_density = np.sum(edges > 0) / total_pixels
-    return mean_brightness < 80 and black_ratio > 0.6 and edge_density > 0.001
-
-
-def apply_threshold_separation(img, lower, upper):
-    """实现色调分离预处理方法，适应黑底和白底图像
-    
-    Args:
-        img: RGB图像数组
-        lower: 色调分离下界
-        upper: 色调分离上界
-        
-    Returns:
-        mask: 处理后的二值掩码
-    """
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    
-    mask = np.zeros_like(gray, dtype=np.uint8)
-    
-    is_black_bg = is_black_background(img)
-    
-    if is_black_bg:
-        base_mask = cv2.inRange(gray, lower, 255)
-    else:
-        base_mask = cv2.inRange(gray, lower, upper)
-    
-    black_mask = np.all(img < 50, axis=2).astype(np.uint8) * 255
-    white_mask = np.all(img > 200, axis=2).astype(np.uint8) * 255
-    
-    if is_black_bg:
-        mask = cv2.bitwise_or(base_mask, white_mask)
-    else:
-        mask = cv2.bitwise_or(base_mask, black_mask)
-    
-    kernel = np.ones((2, 2), np.uint8)
-    mask = cv2.dilate(mask, kernel, iterations=1)
-    mask = cv2.erode(mask, kernel, iterations=1)
-    
-    return mask
-
+# 鼠标滚轮每一格的缩放倍数
+WHEEL_ZOOM_STEP = 1.2
+# 预取当前图像前后各几张
+PREFETCH_RADIUS = 1
+# PageUp/PageDown一次跳转的图像数
+NAVIGATION_JUMP = 10
+# 键盘浏览使用的键码（kivy Window.on_key_down）
+KEY_RIGHT, KEY_LEFT, KEY_HOME, KEY_END, KEY_PAGEUP, KEY_PAGEDOWN = 275, 276, 278, 279, 280, 281
 
 class MainScreen(Screen):
     """主屏幕"""
     
+    # 编辑历史占用内存的显示文字
+    history_usage_text = StringProperty('历史: 0.0MB')
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.image_processor = ImageProcessor()
@@ -102,8 +54,27 @@ class MainScreen(Screen):
         self.brush_color = (0, 0, 0)
         self.brush_size = 10
         self.drawing_mode = False
-        self.history = []
-        self.max_history = 20
+        # 拖动中的色调分离阈值 (lower, upper)，None表示没有在拖动
+        self.threshold_preview = None
+        # 各目录的图像索引（上一张/下一张等浏览用）
+        self.directory_indexes = {}
+        self._filmstrip_bound = False
+        # 后台保存队列和编码参数（format为输出扩展名，None表示与原图相同）
+        self.save_queue = SaveQueue()
+        self.save_options = dict(DEFAULT_SAVE_OPTIONS)
+        # 后台预取相邻图像并缓存预处理结果，浏览时直接命中缓存
+        self.prefetch_enabled = True
+        # 磁盘处理缓存：重新打开处理过的图像时内存映射读取预处理结果
+        self.image_processor.processing_cache = ProcessingCache()
+        self.prefetcher = ImagePrefetcher(self.image_processor.prepare_image, self._image_cache_key,
+                                          radius=PREFETCH_RADIUS)
+        # 画笔预览：按下期间用Kivy画布指令显示笔画，松开时一次性写入processed_image
+        self.gpu_brush_preview = True
+        self._brush_points = []
+        self._brush_line = None
+        self._brush_group = None
+        # 已写入图像、等待包含它的新一帧显示后再移除的画笔预览指令：[(图像版本号, 指令组)]
+        self._committed_brush_groups = []
         
         # 图形罗盘相关变量
         self.graphic_compass_enabled = False
@@ -116,6 +87,37 @@ class MainScreen(Screen):
         # 罗盘缩放因子
         self.compass_scale_factor = 1.0
         
+        # 罗盘叠加层（缓存各罗盘圈的渲染结果）
+        self.overlay_compositor = OverlayCompositor()
+        # 保存时生成全分辨率图像使用的叠加层，不挤掉预览的缓存
+        self.export_compositor = OverlayCompositor()
+        self.text_layer = TextLayer()
+        self.compass_fontsize = 16
+        # 各渲染阶段的耗时（毫秒）
+        self.render_timings = {}
+        # 预览模式：按image_widget的实际像素尺寸合成显示图像，全分辨率图像只在保存时生成
+        self.preview_enabled = True
+        self.displayed_image = None
+        # 图形罗盘叠加前的帧（只有图形罗盘变化时复用，不重新合成轮廓和罗盘各圈）
+        self._base_frame = None
+        self._base_frame_view = None
+        
+        # 视口：缩放和平移processed_image，只渲染可见区域
+        self.view = ViewTransform()
+        # 正在用于平移/双指缩放的触摸点：{uid: 上一次的位置}
+        self._view_touches = {}
+        
+        # 重绘调度器：事件处理函数只标记变化，每帧最多重绘一次
+        self.redraw_scheduler = RedrawScheduler(self.update_image_display, max_fps=60)
+        
+        # 后台渲染：轮廓检测和合成在工作线程执行，只有纹理上传回到主线程
+        self.render_in_background = True
+        self.render_worker = RenderWorker()
+        # 每次提交渲染递增的代号：只有最新一代的帧才作为displayed_image供保存使用
+        self._render_generation = 0
+        # 叠加层缓存、文字层和上一帧在渲染线程与保存（主线程）之间共享
+        self._render_lock = threading.Lock()
+        
         # 罗盘列表（存储用户选择过的罗盘）
         self.compass_list = ['无']
         self.compass_path_map = {}
@@ -128,6 +130,10 @@ class MainScreen(Screen):
         # 初始化图形罗盘复选框
         if 'graphic_compass_file_checkbox' in self.ids:
             self.ids.graphic_compass_file_checkbox.active = False
+        
+        # 开始监听键盘浏览（离开屏幕时在on_leave中解除）
+        from kivy.core.window import Window
+        Window.bind(on_key_down=self._on_keyboard_down)
     
     def open_file(self):
         """打开文件"""
@@ -220,6 +226,7 @@ class MainScreen(Screen):
         try:
             if selection:
                 self.current_image_path = selection[0] if isinstance(selection, list) else selection
+                self.view.reset()
                 print(f"选择的文件路径: {self.current_image_path}")
                 
                 # 重置罗盘倍数到1.0
@@ -228,14 +235,9 @@ class MainScreen(Screen):
                     self.ids.compass_scale_input.text = '1.0'
                     print("重置罗盘倍数到1.0")
                 
-                if self.image_processor.load_image(self.current_image_path):
+                if self._load_and_process(self.current_image_path):
                     print("图像加载成功")
-                    
-                    # 调用新的图像处理功能
-                    processed_img = self.image_processor.process_image(self.image_processor.original_image)
-                    self.image_processor.processed_image = processed_img
-                    
-                    self.update_image_display()
+                    self.request_redraw(DIRTY_IMAGE)
                 else:
                     print("图像加载失败")
         except Exception as e:
@@ -244,14 +246,11 @@ class MainScreen(Screen):
             traceback.print_exc()
     
     def save_image(self):
-        """保存图像"""
+        """保存图像（交给后台保存队列，界面不等待编码和写入）"""
         if not self.current_image_path or self.image_processor.processed_image is None:
             print("没有图像可保存")
             return
         
-        import os
-        import time
-        
         try:
             abs_path = os.path.abspath(self.current_image_path)
             dir_path = os.path.dirname(abs_path)
@@ -262,108 +261,226 @@ class MainScreen(Screen):
             # 获取原始文件名和扩展名
             base_name = os.path.basename(abs_path)
             name_without_ext, ext = os.path.splitext(base_name)
-            # 在文件名前加luopan_，保持扩展名不变
+            # 在文件名前加luopan_，默认保持扩展名不变
+            ext = self.save_options.get('format') or ext
             save_path = os.path.join(dir_path, f"luopan_{name_without_ext}{ext}")
             
-            # 保存包含所有绘制元素的图像（罗盘、形心、轮廓线等）
-            if hasattr(self, 'displayed_image') and self.displayed_image is not None:
-                # displayed_image是BGR格式，cv2.imwrite直接保存BGR格式
-                cv2.imwrite(save_path, self.displayed_image)
-                print(f"图像已保存到: {save_path}")
-            elif self.image_processor.processed_image is not None:
-                # 如果没有displayed_image，使用processed_image作为备选
-                cv2.imwrite(save_path, self.image_processor.processed_image)
-                print(f"图像已保存到: {save_path}")
-                
-                from kivy.uix.popup import Popup
-                from kivy.uix.label import Label
-                from kivy.uix.button import Button
-                from kivy.uix.boxlayout import BoxLayout
-                
-                content = BoxLayout(orientation='vertical', spacing=10, padding=10)
-                label = Label(text=f'图像已保存到:\n{save_path}', font_name='SimHei', size_hint_y=0.7)
-                btn = Button(text='确定', font_name='SimHei', size_hint_y=0.3)
-                content.add_widget(label)
-                content.add_widget(btn)
-                
-                popup = Popup(title='保存成功', content=content, size_hint=(0.8, 0.4), title_font='SimHei')
-                popup.open()
-                
-                def close_popup(instance):
-                    popup.dismiss()
-                
-                btn.bind(on_press=close_popup)
+            # 保存的是点击保存时的罗盘状态
+            state = self._capture_render_state()
+            if self.save_queue.submit(save_path, lambda path: self._write_saved_image(path, state), self._on_image_saved):
+                print(f"保存请求已与尚未开始的保存合并: {save_path}")
             else:
-                print("没有处理过的图像可保存")
+                print(f"图像保存中: {save_path}")
         except Exception as e:
             print(f"保存图像时出错: {e}")
             import traceback
             traceback.print_exc()
     
-    def previous_image(self):
-        """上一张图像"""
-        if not self.current_image_path:
+    def _write_saved_image(self, save_path, state):
+        """生成并写入保存的图像（在保存线程执行）
+        
+        保存包含所有绘制元素的图像（罗盘、形心、轮廓线等），预览模式下此时才生成全分辨率图像；
+        processed_image为分块金字塔时逐块合成并写出。
+        """
+        if self.image_processor.processed_tiles is not None:
+            if not self.export_tiled_image(save_path, state):
+                raise ValueError("分块保存图像失败")
             return
+        img = self.render_displayed_image(state)
+        if img is None:
+            # 如果没有displayed_image，使用processed_image作为备选
+            img = self.image_processor.processed_image
+        # displayed_image是BGR格式，cv2.imencode直接按BGR编码
+        save_image_file(save_path, img, self.save_options)
+    
+    def _on_image_saved(self, save_path, error):
+        """保存完成（在保存线程调用），回到主线程通知界面"""
+        Clock.schedule_once(lambda dt: self._show_save_result(save_path, error))
+    
+    def _show_save_result(self, save_path, error):
+        """在主线程显示保存结果"""
+        from kivy.uix.popup import Popup
+        from kivy.uix.label import Label
+        from kivy.uix.button import Button
+        from kivy.uix.boxlayout import BoxLayout
         
-        import os
-        dir_path = os.path.dirname(self.current_image_path)
-        base_name = os.path.basename(self.current_image_path)
+        if error is None:
+            print(f"图像已保存到: {save_path}")
+            title, text = '保存成功', f'图像已保存到:\n{save_path}'
+        else:
+            print(f"保存图像时出错: {error}")
+            title, text = '保存失败', f'保存图像时出错:\n{error}'
         
-        files = [f for f in os.listdir(dir_path)
-                 if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-        files.sort()
+        content = BoxLayout(orientation='vertical', spacing=10, padding=10)
+        label = Label(text=text, font_name='SimHei', size_hint_y=0.7)
+        btn = Button(text='确定', font_name='SimHei', size_hint_y=0.3)
+        content.add_widget(label)
+        content.add_widget(btn)
         
-        try:
-            current_index = files.index(base_name)
-            if current_index > 0:
-                previous_file = files[current_index - 1]
-                previous_path = os.path.join(dir_path, previous_file)
-                if self.image_processor.load_image(previous_path):
-                    self.current_image_path = previous_path
-                    
-                    # 调用图像处理功能
-                    processed_img = self.image_processor.process_image(self.image_processor.processed_image)
-                    self.image_processor.processed_image = processed_img
-                    
-                    self.update_image_display()
-        except ValueError:
-            pass
+        popup = Popup(title=title, content=content, size_hint=(0.8, 0.4), title_font='SimHei')
+        popup.open()
+        
+        def close_popup(instance):
+            popup.dismiss()
+        
+        btn.bind(on_press=close_popup)
+    
+    def previous_image(self):
+        """上一张图像"""
+        self.jump_images(-1)
     
     def next_image(self):
         """下一张图像"""
+        self.jump_images(1)
+    
+    def jump_images(self, offset):
+        """在当前目录中向后（offset为负时向前）跳转offset张，超出范围时停在第一张或最后一张"""
         if not self.current_image_path:
             return
-        
-        import os
-        dir_path = os.path.dirname(self.current_image_path)
-        base_name = os.path.basename(self.current_image_path)
-        
-        files = [f for f in os.listdir(dir_path)
-                 if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-        files.sort()
-        
-        try:
-            current_index = files.index(base_name)
-            if current_index < len(files) - 1:
-                next_file = files[current_index + 1]
-                next_path = os.path.join(dir_path, next_file)
-                if self.image_processor.load_image(next_path):
-                    self.current_image_path = next_path
-                    
-                    # 调用图像处理功能
-                    processed_img = self.image_processor.process_image(self.image_processor.processed_image)
-                    self.image_processor.processed_image = processed_img
-                    
-                    self.update_image_display()
-        except ValueError:
-            pass
+        index = self._get_directory_index(self.current_image_path)
+        self._open_navigated_image(index.neighbour(self.current_image_path, offset))
+    
+    def first_image(self):
+        """当前目录的第一张图像"""
+        if self.current_image_path:
+            self._open_navigated_image(self._get_directory_index(self.current_image_path).first())
+    
+    def last_image(self):
+        """当前目录的最后一张图像"""
+        if self.current_image_path:
+            self._open_navigated_image(self._get_directory_index(self.current_image_path).last())
+    
+    def _get_directory_index(self, path):
+        """获取path所在目录的索引（每个目录只建立一次，之后按目录修改时间自动更新）"""
+        dir_path = os.path.dirname(os.path.abspath(path))
+        index = self.directory_indexes.get(dir_path)
+        if index is None:
+            index = DirectoryIndex(dir_path)
+            self.directory_indexes[dir_path] = index
+        return index
+    
+    def _open_navigated_image(self, path):
+        """打开浏览到的图像（path为None或与当前图像相同时什么也不做）"""
+        if path is None or path == self.current_image_path:
+            return
+        if self._load_and_process(path):
+            self.current_image_path = path
+            self.view.reset()
+            self.request_redraw(DIRTY_IMAGE)
+    
+    def _image_cache_key(self, path):
+        """预处理缓存键：文件（路径、修改时间、大小）和影响预处理结果的参数"""
+        return image_cache_key(path, self.image_processor.target_min_size, self.image_processor.tiled_threshold_pixels,
+                               self.image_processor.crop_mode, self.image_processor.reduced_decode)
+    
+    def _load_and_process(self, path):
+        """加载并预处理图像：优先使用预取缓存和磁盘处理缓存，都未命中时直接读取（并写入磁盘缓存）；
+        完成后预取相邻图像
+        
+        Returns:
+            bool: 是否加载成功
+        """
+        start_time = time.perf_counter()
+        prepared = self.prefetcher.get(path) if self.prefetch_enabled else None
+        if prepared is None:
+            # 预取缓存未命中：查磁盘处理缓存（内存映射读取，不解码原图）
+            prepared = self.image_processor.load_cached_preparation(path)
+        if prepared is not None:
+            self.image_processor.set_prepared_image(prepared)
+        elif self.image_processor.load_image(path):
+            # 调用图像处理功能
+            processed_img = self.image_processor.process_image(self.image_processor.original_image)
+            self.image_processor.set_processed_image(processed_img)
+            # 轮廓检测、文件哈希和写入磁盘缓存在后台线程进行，不阻塞界面
+            snapshot = self.image_processor.processing_cache_snapshot()
+            if snapshot is not None:
+                self.prefetcher.submit(self.image_processor.store_processing_cache, snapshot)
+        else:
+            return False
+        
+        self._update_filmstrip(path)
+        if self.prefetch_enabled:
+            stats = self.prefetcher.cache.stats()
+            print(f"图像{'缓存命中' if prepared is not None else '直接读取'}，耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms，"
+                  f"缓存命中率 {stats['hit_ratio']:.0%}（命中{stats['hits']}，未命中{stats['misses']}，"
+                  f"{stats['entries']}张，{stats['bytes'] / (1024 * 1024):.1f}MB）")
+            self._prefetch_neighbours(path)
+        return True
+    
+    def shutdown(self):
+        """关闭后台线程（应用退出时调用）：丢弃尚未开始的预取、渲染和缩略图任务，等待尚未完成的保存"""
+        self.prefetcher.shutdown()
+        self.render_worker.shutdown()
+        if 'filmstrip' in self.ids:
+            self.ids.filmstrip.shutdown()
+        self.save_queue.shutdown()
+    
+    def _update_filmstrip(self, path):
+        """让胶片条显示path所在目录并选中path"""
+        if 'filmstrip' not in self.ids:
+            return
+        filmstrip = self.ids.filmstrip
+        if not self._filmstrip_bound:
+            # 点击缩略图与文件选择走同一路径
+            filmstrip.bind(on_select=lambda widget, selected_path: self._file_selected([selected_path]))
+            self._filmstrip_bound = True
+        index = self._get_directory_index(path)
+        index.refresh()
+        filmstrip.show_folder(index.dir_path, index.files, os.path.abspath(path))
+    
+    def _prefetch_neighbours(self, path):
+        """在后台预取path前后各prefetcher.radius张图像（先近后远，先后再前）"""
+        index = self._get_directory_index(path)
+        position = index.index_of(path)
+        if position is None:
+            return
+        paths = []
+        for distance in range(1, self.prefetcher.radius + 1):
+            for offset in (distance, -distance):
+                neighbour = index.path_at(position + offset)
+                if neighbour is not None:
+                    paths.append(neighbour)
+        self.prefetcher.prefetch(paths)
+    
+    def on_leave(self, *args):
+        """离开主屏幕时停止监听键盘浏览"""
+        from kivy.core.window import Window
+        Window.unbind(on_key_down=self._on_keyboard_down)
+    
+    def _on_keyboard_down(self, window, key, scancode, codepoint, modifiers):
+        """键盘浏览：左右方向键上一张/下一张，PageUp/PageDown跳转多张，Home/End第一张/最后一张"""
+        # 输入框获得焦点时不拦截按键
+        if any(getattr(widget, 'focus', False) for widget in self.ids.values()):
+            return False
+        action = {
+            KEY_LEFT: lambda: self.jump_images(-1),
+            KEY_RIGHT: lambda: self.jump_images(1),
+            KEY_PAGEUP: lambda: self.jump_images(-NAVIGATION_JUMP),
+            KEY_PAGEDOWN: lambda: self.jump_images(NAVIGATION_JUMP),
+            KEY_HOME: self.first_image,
+            KEY_END: self.last_image,
+        }.get(key)
+        if action is None:
+            return False
+        action()
+        return True
     
     def on_threshold_change(self, lower, upper):
-        """色调分离滑块变化"""
+        """色调分离滑块松开：按原分辨率完整检测"""
         print(f"色调分离: lower={lower}, upper={upper}")
+        self.threshold_preview = None
         self.image_processor.threshold_lower = int(lower)
         self.image_processor.threshold_upper = int(upper)
-        self.update_image_display()
+        self.request_redraw(DIRTY_THRESHOLDS)
+    
+    def on_threshold_preview(self, lower, upper):
+        """色调分离滑块拖动中：在缩小图上实时预览轮廓和质心"""
+        preview = (int(lower), int(upper))
+        if preview == (self.image_processor.threshold_lower, self.image_processor.threshold_upper):
+            return
+        if preview != self.threshold_preview:
+            self.threshold_preview = preview
+            self.request_redraw(DIRTY_THRESHOLDS)
     
     def on_compass24_toggle(self, active):
         """24山罗盘切换"""
@@ -377,7 +494,7 @@ class MainScreen(Screen):
         else:
             # 取消24山罗盘，设置为None
             self.image_processor.set_compass_type(None)
-        self.update_image_display()
+        self.request_redraw(DIRTY_RINGS)
     
     def on_compass12_toggle(self, active):
         """12地支罗盘切换"""
@@ -391,19 +508,19 @@ class MainScreen(Screen):
         else:
             # 取消12地支罗盘，设置为None
             self.image_processor.set_compass_type(None)
-        self.update_image_display()
+        self.request_redraw(DIRTY_RINGS)
     
     def on_compass28_toggle(self, active):
         """28宿罗盘切换"""
         print(f"28宿罗盘切换: {active}")
         self.image_processor.compass_manager.show_compass28 = active
-        self.update_image_display()
+        self.request_redraw(DIRTY_RINGS)
     
     def on_xuankongda_toggle(self, active):
         """玄空大卦罗盘切换"""
         print(f"玄空大卦罗盘切换: {active}")
         self.image_processor.compass_manager.show_xuankongda = active
-        self.update_image_display()
+        self.request_redraw(DIRTY_RINGS)
     
     def on_rotation_change(self, text_input):
         """旋转角度变化"""
@@ -415,7 +532,7 @@ class MainScreen(Screen):
             self.graphic_compass_rotation = angle
             print(f"图形罗盘旋转角度: {self.graphic_compass_rotation}")
             # 即使processed_image为None，也要更新图形罗盘的旋转角度
-            self.update_image_display()
+            self.request_redraw(DIRTY_ROTATION, DIRTY_GRAPHIC)
         except ValueError:
             print(f"旋转角度输入错误: {text_input}")
             pass
@@ -429,7 +546,7 @@ class MainScreen(Screen):
                 print(f"旋转角度（失去焦点）: {angle}")
                 self.image_processor.set_rotation_angle(angle)
                 self.graphic_compass_rotation = angle
-                self.update_image_display()
+                self.request_redraw(DIRTY_ROTATION, DIRTY_GRAPHIC)
             except ValueError:
                 print(f"旋转角度输入错误: {instance.text}")
                 pass
@@ -442,10 +559,11 @@ class MainScreen(Screen):
             # 更新ImageProcessor的阈值
             self.image_processor.target_min_size = threshold
             # 重新处理当前图像
-            if self.image_processor.original_image is not None:
-                processed_img = self.image_processor.process_image(self.image_processor.original_image)
-                self.image_processor.processed_image = processed_img
-                self.update_image_display()
+            original_image = self.image_processor.get_original_image()
+            if original_image is not None:
+                processed_img = self.image_processor.process_image(original_image)
+                self.image_processor.set_processed_image(processed_img)
+                self.request_redraw(DIRTY_IMAGE)
             print(f"图像阈值已更新为: {threshold}")
         except ValueError:
             print(f"图像阈值输入错误: {text}")
@@ -459,10 +577,11 @@ class MainScreen(Screen):
             # 更新ImageProcessor的阈值
             self.image_processor.target_min_size = threshold
             # 重新处理当前图像
-            if self.image_processor.original_image is not None:
-                processed_img = self.image_processor.process_image(self.image_processor.original_image)
-                self.image_processor.processed_image = processed_img
-                self.update_image_display()
+            original_image = self.image_processor.get_original_image()
+            if original_image is not None:
+                processed_img = self.image_processor.process_image(original_image)
+                self.image_processor.set_processed_image(processed_img)
+                self.request_redraw(DIRTY_IMAGE)
             print(f"图像阈值已应用: {threshold}")
         except ValueError:
             print(f"图像阈值输入错误: {self.ids.threshold_size_input.text}")
@@ -473,14 +592,14 @@ class MainScreen(Screen):
         print("罗盘放大")
         self.compass_scale_factor *= 1.1
         print(f"当前缩放因子: {self.compass_scale_factor:.2f}")
-        self.update_image_display()
+        self.request_redraw(DIRTY_GRAPHIC)
     
     def on_compass_zoom_out(self):
         """罗盘缩小"""
         print("罗盘缩小")
         self.compass_scale_factor *= 0.9
         print(f"当前缩放因子: {self.compass_scale_factor:.2f}")
-        self.update_image_display()
+        self.request_redraw(DIRTY_GRAPHIC)
     
     def on_compass_scale_validate(self, text_input):
         """罗盘倍数验证"""
@@ -491,7 +610,7 @@ class MainScreen(Screen):
             if scale >= 0.01 and scale <= 100:
                 self.compass_scale_factor = scale
                 print(f"罗盘倍数更新: {self.compass_scale_factor}")
-                self.update_image_display()
+                self.request_redraw(DIRTY_GRAPHIC)
             else:
                 print(f"罗盘倍数超出范围: {scale}")
         except ValueError:
@@ -509,7 +628,7 @@ class MainScreen(Screen):
                 if scale >= 0.01 and scale <= 100:
                     self.compass_scale_factor = scale
                     print(f"罗盘倍数更新: {self.compass_scale_factor}")
-                    self.update_image_display()
+                    self.request_redraw(DIRTY_GRAPHIC)
                 else:
                     print(f"罗盘倍数超出范围: {scale}")
             except ValueError:
@@ -527,7 +646,7 @@ class MainScreen(Screen):
                 if scale >= 0.01 and scale <= 100:
                     self.compass_scale_factor = scale
                     print(f"罗盘倍数更新: {self.compass_scale_factor}")
-                    self.update_image_display()
+                    self.request_redraw(DIRTY_GRAPHIC)
                 else:
                     print(f"罗盘倍数超出范围: {scale}")
             except ValueError:
@@ -543,7 +662,7 @@ class MainScreen(Screen):
             if scale >= 0.01 and scale <= 100:
                 self.compass_scale_factor = scale
                 print(f"罗盘倍数更新: {self.compass_scale_factor}")
-                self.update_image_display()
+                self.request_redraw(DIRTY_GRAPHIC)
             else:
                 print(f"罗盘倍数超出范围: {scale}")
         except ValueError:
@@ -569,7 +688,7 @@ class MainScreen(Screen):
             
             # 只在有图像时才更新显示
             if self.image_processor.processed_image is not None:
-                self.update_image_display()
+                self.request_redraw(DIRTY_GRAPHIC)
     
     def open_graphic_compass_file(self):
         """打开图形罗盘文件"""
@@ -632,7 +751,7 @@ class MainScreen(Screen):
                     self.compass_path_map[compass_name] = file_path
                     print(f"添加新罗盘到列表: {compass_name}")
                 
-                self.update_image_display()
+                self.request_redraw(DIRTY_GRAPHIC)
                 print("罗盘图像加载完成")
             else:
                 print("罗盘图像加载失败：cv2.imdecode返回None")
@@ -655,32 +774,58 @@ class MainScreen(Screen):
     
     def end_drawing(self):
         """清空所有画笔"""
-        if self.history:
-            self.image_processor.processed_image = self.history[0].copy()
-            self.history = []
-            self.update_image_display()
+        if self.image_processor.revert_edits() is not None:
+            self.request_redraw(DIRTY_IMAGE)
             print("清空所有画笔")
+        self.update_history_usage()
         self.drawing_mode = False
         self.is_drawing = False
         self.last_x, self.last_y = -1, -1
     
     def undo(self):
         """撤销上一步操作"""
-        if self.history:
-            self.image_processor.processed_image = self.history.pop()
-            self.update_image_display()
+        rect = self.image_processor.undo_edit()
+        if rect is not None:
+            self.request_redraw(DIRTY_IMAGE)
+            self.drawing_mode = False
+            print(f"撤销成功, 区域: {rect}")
+        self.update_history_usage()
+    
+    def redo(self):
+        """重做上一步被撤销的操作"""
+        rect = self.image_processor.redo_edit()
+        if rect is not None:
+            self.request_redraw(DIRTY_IMAGE)
             self.drawing_mode = False
-            print("撤销成功")
+            print(f"重做成功, 区域: {rect}")
+        self.update_history_usage()
     
     def save_history(self):
-        """保存当前图像状态到历史记录"""
+        """开始记录一次编辑的历史（画笔按下时调用，松开时由finish_brush_edits提交）"""
         if self.image_processor.processed_image is not None:
-            self.history.append(self.image_processor.processed_image.copy())
-            if len(self.history) > self.max_history:
-                self.history.pop(0)
+            self.image_processor.begin_brush_edits()
     
-    def update_image_display(self):
-        """更新图像显示"""
+    def update_history_usage(self):
+        """更新编辑历史占用内存的显示"""
+        history = self.image_processor.edit_history
+        self.history_usage_text = f'历史: {history.nbytes / (1024 * 1024):.1f}MB'
+    
+    def request_redraw(self, *flags):
+        """请求重绘，flags为变化内容的脏标记（见ui.redraw_scheduler），实际重绘在下一帧合并执行"""
+        self.redraw_scheduler.request(*flags)
+    
+    def flush_pending(self):
+        """立即执行尚未执行的重绘，并等待后台渲染完成后显示"""
+        self.redraw_scheduler.flush()
+        self.render_worker.wait()
+    
+    def update_image_display(self, dirty=None):
+        """更新图像显示
+        
+        Args:
+            dirty: 本帧的脏标记集合，None表示全部重新合成；
+                   只有图形罗盘变化时复用上一帧的轮廓和罗盘各圈，只重新叠加图形罗盘
+        """
         print(f"update_image_display被调用")
         print(f"processed_image: {self.image_processor.processed_image}")
         
@@ -722,139 +867,378 @@ class MainScreen(Screen):
                         print(f"旋转角度输入错误: {self.ids.rotation_input.text}")
                         pass
                 # 叠加图形罗盘
-                self._overlay_graphic_compass(img)
+                state = self._capture_render_state()
+                self._overlay_graphic_compass(img, state)
+                self.graphic_compass_position = state['graphic_position']
                 # 显示图像
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                img_flipped = cv2.flip(img_rgb, 0)
-                
-                from kivy.core.image import Image as KivyImage
-                from kivy.graphics.texture import Texture
-                
-                height, width, channels = img_flipped.shape
-                print(f"图像尺寸: {width}x{height}")
-                texture = Texture.create(size=(width, height), colorfmt='rgb')
-                texture.blit_buffer(img_flipped.flatten(), colorfmt='rgb', bufferfmt='ubyte')
-                
-                print(f"ids: {self.ids}")
-                if 'image_widget' in self.ids:
-                    self.ids.image_widget.texture = texture
-                    self.ids.image_widget.size = (width, height)
-                    print("图像纹理已设置")
+                self._upload_texture(img)
             return
         
-        img = self.image_processor.processed_image.copy()
-        print(f"图像形状: {img.shape}")
-        
-        # 使用原来的轮廓检测逻辑
-        mask = apply_threshold_separation(img, self.image_processor.threshold_lower, self.image_processor.threshold_upper)
-        
-        blurred = cv2.GaussianBlur(mask, (5, 5), 0)
-        
-        contours, hierarchy = cv2.findContours(blurred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1)
-        
-        if contours:
-            is_black_bg = is_black_background(img)
-            
-            valid_contours = []
-            if is_black_bg:
-                min_area = 500
-                min_length = 500
-                for cnt in contours:
-                    area = cv2.contourArea(cnt)
-                    length = cv2.arcLength(cnt, True)
-                    if area >= min_area or length >= min_length:
-                        valid_contours.append(cnt)
-            else:
-                min_area = 3000
-                for cnt in contours:
-                    area = cv2.contourArea(cnt)
-                    if area >= min_area:
-                        valid_contours.append(cnt)
-            
-            if not valid_contours:
-                valid_contours = contours
+        print(f"图像形状: {self.image_processor.processed_image.shape}")
+        # widget尺寸只能在主线程读取，可见区域和预览缩放比例在提交渲染前确定
+        scale, region = self._get_view_region()
+        threshold_preview = self.threshold_preview
+        # 罗盘和图形罗盘的状态在主线程记录，渲染线程只读取这份快照
+        state = self._capture_render_state()
+        self._render_generation += 1
+        state['generation'] = self._render_generation
+        # 新的一帧尚未显示前，保存时需按当前状态重新生成原分辨率图像
+        self.displayed_image = None
+        if self.render_in_background:
+            self.render_worker.submit(
+                lambda: self._render_frame(dirty, scale, region, state, threshold_preview),
+                self._present_frame)
+        else:
+            self._present_frame(self._render_frame(dirty, scale, region, state, threshold_preview))
+    
+    def _capture_render_state(self):
+        """记录合成一帧所需的罗盘和图形罗盘状态（在主线程调用）
+        
+        后台渲染和保存只读写这份快照，不读取可能正被主线程修改的罗盘状态；
+        渲染得到的质心和图形罗盘位置也写入快照，由_present_frame回到主线程后再更新。
+        
+        Returns:
+            dict: centroid 为质心，compass_manager 为罗盘状态副本，show_compass 为是否显示罗盘，
+                  compass_fontsize 为罗盘字号，graphic_image、graphic_rotation、graphic_scale_factor、
+                  graphic_position 为图形罗盘的图像、旋转角度、用户缩放倍数和放置位置
+        """
+        graphic_enabled = self.graphic_compass_enabled and self.graphic_compass_image is not None
+        return {
+            'centroid': self.image_processor.centroid,
+            'compass_manager': self.image_processor.compass_manager.snapshot(),
+            'show_compass': self.image_processor.show_compass,
+            'compass_fontsize': self.compass_fontsize,
+            'graphic_image': self.graphic_compass_image if graphic_enabled else None,
+            'graphic_rotation': self.graphic_compass_rotation,
+            'graphic_scale_factor': self.compass_scale_factor,
+            'graphic_position': self.graphic_compass_position,
+        }
+    
+    def _apply_segmentation_centroid(self, segmentation, state):
+        """轮廓检测找到轮廓时，用其质心作为本帧的质心"""
+        if segmentation['contour'] is not None and segmentation['centroid']:
+            state['centroid'] = segmentation['centroid']
+    
+    def _render_frame(self, dirty, scale, region, state, threshold_preview=None):
+        """合成一帧显示图像（在后台渲染线程执行）
+        
+        Args:
+            dirty: 本帧的脏标记集合，None表示全部重新合成
+            scale: 预览缩放比例
+            region: 可见区域 (x0, y0, x1, y1)，原图坐标
+            state: 提交时记录的罗盘状态，见_capture_render_state
+            threshold_preview: 拖动滑块中的色调分离阈值 (lower, upper)，在缩小图上检测轮廓；None表示使用缓存的完整检测
             
-            max_cnt = max(valid_contours, key=cv2.contourArea)
+        Returns:
+            dict: img 为合成的BGR图像，scale 为缩放比例，full_frame 为是否原分辨率的整幅图像，
+                  timings 为各阶段耗时，centroid 和 graphic_position 为本帧的质心和图形罗盘位置；
+                  没有图像时返回None
+        """
+        with self._render_lock:
+            self.render_timings = {}
+            # 本帧至少包含这个版本的图像内容（之后复制图像时版本号只会更大）
+            image_version = self.image_processor.image_version
             
-            if is_black_bg:
-                epsilon = 0.001 * cv2.arcLength(max_cnt, True)
+            # 轮廓检测（按图像版本号和色调分离阈值缓存；拖动滑块时在缩小图上实时检测）
+            if threshold_preview is not None:
+                segmentation = self.image_processor.get_threshold_preview(*threshold_preview)
             else:
-                epsilon = 0.003 * cv2.arcLength(max_cnt, True)
-            
-            approx = cv2.approxPolyDP(max_cnt, epsilon, True)
+                segmentation = self.image_processor.get_segmentation()
+            if segmentation is None:
+                return None
+            self._apply_segmentation_centroid(segmentation, state)
+            if segmentation['contour'] is not None and segmentation['centroid']:
+                print(f"质心计算完成: {state['centroid']}")
             
-            new_points = approx.reshape(-1, 2)
+            # 预览模式下按widget尺寸合成，displayed_image留到保存时再按原分辨率生成
+            graphic_enabled = state['graphic_image'] is not None
+            if (dirty is not None and dirty <= {DIRTY_GRAPHIC} and graphic_enabled
+                    and self._base_frame is not None and self._base_frame_view == (scale, region)):
+                print("只有图形罗盘变化，复用上一帧")
+                img = self._base_frame.copy()
+            else:
+                img = self._compose_base_frame(segmentation, scale, self.overlay_compositor, state, region)
+                self._base_frame = img.copy() if graphic_enabled else None
+                self._base_frame_view = (scale, region)
+            if graphic_enabled:
+                self._overlay_graphic_compass(img, state, scale, region[:2])
+            img_height, img_width = self.image_processor.processed_image.shape[:2]
+            # 实时预览的轮廓是近似结果，不作为displayed_image保存
+            full_frame = scale >= 1.0 and region == (0, 0, img_width, img_height) and threshold_preview is None
+            return {'img': img, 'scale': scale, 'full_frame': full_frame,
+                    'timings': dict(self.render_timings), 'image_version': image_version,
+                    'centroid': state['centroid'], 'graphic_position': state['graphic_position'],
+                    'generation': state.get('generation')}
+    
+    def _present_frame(self, frame):
+        """在主线程显示渲染好的一帧：上传纹理，最新一代的完整帧同时记为displayed_image
+        
+        后台渲染期间已有更新的提交时，旧的一帧照常显示（拖动时画面持续更新），
+        但它按旧的状态合成，不能作为displayed_image被保存。
+        """
+        if frame is None:
+            return
+        # 渲染线程得到的质心和图形罗盘位置在主线程写回
+        self.image_processor.centroid = frame['centroid']
+        self.graphic_compass_position = frame['graphic_position']
+        img, scale = frame['img'], frame['scale']
+        if frame['full_frame']:
+            # 保存当前显示的图像（包含所有绘制元素）
+            if frame['generation'] == self._render_generation:
+                self.displayed_image = img.copy()
+        else:
+            print(f"预览缩放比例: {scale:.3f}, 视口缩放: {self.view.zoom:.2f}")
+            self.displayed_image = None
+        
+        timings = frame['timings']
+        stage_start = time.perf_counter()
+        self._upload_texture(img, set_widget_size=frame['full_frame'])
+        self._clear_committed_brush_previews(frame['image_version'])
+        self.update_history_usage()
+        timings['upload'] = (time.perf_counter() - stage_start) * 1000
+        print("渲染耗时(ms): " + ", ".join(f"{name}={ms:.1f}" for name, ms in timings.items()))
+        print(f"已合并的重绘请求: {self.redraw_scheduler.coalesced_count}, "
+              f"已被取代的渲染请求: {self.render_worker.dropped_count}")
+    
+    def _sync_view(self):
+        """用当前图像尺寸和image_widget的位置、尺寸更新视口，返回视口是否可用"""
+        if self.image_processor.processed_image is None or 'image_widget' not in self.ids:
+            return False
+        img_height, img_width = self.image_processor.processed_image.shape[:2]
+        image_widget = self.ids.image_widget
+        self.view.set_image_size(img_width, img_height)
+        self.view.set_widget_rect(image_widget.pos, image_widget.size)
+        return self.view.is_valid
+    
+    def _get_view_region(self):
+        """确定本帧的可见区域和预览缩放比例
+        
+        可见区域来自视口（未缩放时为整幅图像）；预览模式下按可见区域在屏幕上的实际像素尺寸缩小（不放大），
+        不能确定widget尺寸时按原分辨率渲染整幅图像。
+        
+        Returns:
+            tuple: (scale, (x0, y0, x1, y1))
+        """
+        img_height, img_width = self.image_processor.processed_image.shape[:2]
+        if not self._sync_view():
+            return 1.0, (0, 0, img_width, img_height)
+        region = self.view.region
+        scale = min(1.0, self.view.display_scale) if self.preview_enabled else 1.0
+        return scale, region
+    
+    def _touch_to_image(self, touch, clamp=True):
+        """把触摸位置换算为图像坐标，没有图像或widget时返回None"""
+        if not self._sync_view():
+            return None
+        return self.view.widget_to_image(touch.pos[0], touch.pos[1], clamp)
+    
+    def _compose_frame(self, segmentation, scale, compositor, state, region=None):
+        """合成显示图像：轮廓线、质心、十字线、罗盘各圈和图形罗盘（参数同_compose_base_frame）"""
+        img = self._compose_base_frame(segmentation, scale, compositor, state, region)
+        if state['graphic_image'] is not None:
+            origin = region[:2] if region is not None else (0, 0)
+            self._overlay_graphic_compass(img, state, scale, origin)
+        return img
+    
+    def _compose_base_frame(self, segmentation, scale, compositor, state, region=None):
+        """合成图形罗盘以外的显示内容：轮廓线、质心、十字线和罗盘各圈
+        
+        Args:
+            segmentation: 轮廓检测结果（复用缓存，不重新检测）
+            scale: 相对processed_image的缩放比例，1.0为原分辨率
+            compositor: 缓存罗盘叠加层的OverlayCompositor
+            state: 罗盘状态快照，见_capture_render_state
+            region: 只合成的可见区域 (x0, y0, x1, y1)，None表示整幅图像
             
-            # 计算质心
-            centroid = calculate_centroid(new_points)
-            if centroid:
-                cx, cy = centroid
-                self.image_processor.centroid = (cx, cy)
-                print(f"质心计算完成: ({cx}, {cy})")
-                # 绘制轮廓线
-            cv2.drawContours(img, [max_cnt], -1, (0,255, 0), 5)
+        Returns:
+            合成后的BGR图像（可见区域按scale缩放后的大小）
+        """
+        stage_start = time.perf_counter()
+        # 复制（或缩小）processed_image时持有图像锁，避免与主线程的画笔同时读写
+        with self.image_processor.lock:
+            processed = self.image_processor.processed_image
+            tiles = self.image_processor.processed_tiles
+            if tiles is not None and tiles.base is processed:
+                # 分块金字塔：只从分辨率合适的一层读取覆盖可见区域的分块
+                img_height, img_width = processed.shape[:2]
+                img = tiles.read_region(region if region is not None else (0, 0, img_width, img_height), scale)
+            else:
+                if region is not None:
+                    x0, y0, x1, y1 = region
+                    processed = processed[y0:y1, x0:x1]
+                if scale < 1.0:
+                    img_height, img_width = processed.shape[:2]
+                    size = (max(1, int(round(img_width * scale))), max(1, int(round(img_height * scale))))
+                    img = cv2.resize(processed, size, interpolation=cv2.INTER_AREA)
+                else:
+                    img = processed.copy()
+        ox, oy = region[:2] if region is not None else (0, 0)
+        
+        if segmentation['contour'] is not None:
+            contour = segmentation['contour']
+            if scale != 1.0 or (ox, oy) != (0, 0):
+                contour = ((contour - np.array([ox, oy])) * scale).astype(np.int32)
+            # 绘制轮廓线
+            cv2.drawContours(img, [contour], -1, (0,255, 0), scaled_thickness(5, scale))
             # 绘制质心点
-            cv2.circle(img, (cx, cy), 8, (0, 0, 255), -1)
+            if segmentation['centroid']:
+                cx, cy = segmentation['centroid']
+                cv2.circle(img, (int((cx - ox) * scale), int((cy - oy) * scale)), scaled_thickness(8, scale), (0, 0, 255), -1)
         
         # 绘制质心十字线（始终显示）
-        if self.image_processor.centroid:
-            cx, cy = self.image_processor.centroid
+        if state['centroid']:
+            cx, cy = state['centroid']
+            cx, cy = int((cx - ox) * scale), int((cy - oy) * scale)
             img_height, img_width = img.shape[:2]
             # 绘制红色十字线
-            cv2.line(img, (cx, 0), (cx, img_height-1), (0, 0, 255), 5)
-            cv2.line(img, (0, cy), (img_width-1, cy), (0, 0, 255), 5)
-        
-        if self.image_processor.show_compass and self.image_processor.centroid:
-            self._draw_compass_on_image(img)
+            thickness = scaled_thickness(5, scale)
+            cv2.line(img, (cx, 0), (cx, img_height-1), (0, 0, 255), thickness)
+            cv2.line(img, (0, cy), (img_width-1, cy), (0, 0, 255), thickness)
+        self.render_timings['segmentation'] = (time.perf_counter() - stage_start) * 1000
+        
+        # 叠加罗盘各圈（缓存的叠加层，输入不变时只做一次alpha混合）
+        stage_start = time.perf_counter()
+        if state['centroid']:
+            compositor.composite(img, self._get_overlay_key(img, state, scale, (ox, oy)),
+                                 lambda layer: self._render_compass_layer(layer, state, scale, (ox, oy)))
+        self.render_timings['composite'] = (time.perf_counter() - stage_start) * 1000
+        return img
+    
+    def render_displayed_image(self, state=None):
+        """生成原分辨率的displayed_image（复用缓存的轮廓检测结果），预览模式下只在保存时调用
+        
+        可在保存线程调用（此时state须为在主线程记录的罗盘状态快照，None表示在当前线程记录）：
+        返回本次得到的图像，不再读取可能已被主线程清空的displayed_image。
+        
+        Returns:
+            displayed_image，没有图像时返回None
+        """
+        displayed = self.displayed_image
+        if displayed is None and self.image_processor.processed_image is not None:
+            start_time = time.perf_counter()
+            # 只有在主线程按当前状态生成的图像才缓存为displayed_image
+            on_main_thread = state is None
+            state = dict(state) if state is not None else self._capture_render_state()
+            with self._render_lock:
+                segmentation = self.image_processor.get_segmentation()
+                self._apply_segmentation_centroid(segmentation, state)
+                displayed = self._compose_frame(segmentation, 1.0, self.export_compositor, state)
+            if on_main_thread:
+                self.displayed_image = displayed
+            print(f"原分辨率图像已生成，耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+        return displayed
+    
+    def export_tiled_image(self, save_path, state=None):
+        """逐块合成并写出原分辨率图像（processed_image为分块金字塔时使用，可在保存线程调用，state同render_displayed_image）
+        
+        每个分块按_compose_frame的区域合成方式单独绘制轮廓线、罗盘各圈和图形罗盘，
+        内存中只保留一个分块，不生成整幅displayed_image；按save_options编码并原子地写入。
+        
+        Returns:
+            bool: 是否写出成功
+        """
+        start_time = time.perf_counter()
+        state = dict(state) if state is not None else self._capture_render_state()
+        with self._render_lock:
+            segmentation = self.image_processor.get_segmentation()
+            self._apply_segmentation_centroid(segmentation, state)
+            img_height, img_width = self.image_processor.processed_image.shape[:2]
+            ok = stream_export(save_path, img_height, img_width,
+                               lambda rect: self._compose_frame(segmentation, 1.0, self.export_compositor, state, rect),
+                               options=self.save_options)
+        print(f"分块导出耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+        return ok
+    
+    def _upload_texture(self, img, set_widget_size=True):
+        """把BGR图像上传到显示纹理
         
-        # 绘制28宿罗盘（独立显示，不依赖其他罗盘）
-        if self.image_processor.compass_manager.show_compass28 and self.image_processor.centroid:
-            cx, cy = self.image_processor.centroid
-            img_height, img_width = img.shape[:2]
-            # 使用与周天度数环相同的max_radius值
-            max_radius = min(cx, cy, img_width - cx, img_height - cy)
-            self._draw_compass28_on_image(img, cx, cy, max_radius)
+        同一图像尺寸复用同一个纹理：直接以bgr格式上传连续的BGR缓冲区，
+        垂直方向在创建纹理时用flip_vertical翻转纹理坐标处理，不再做颜色转换和翻转的整帧复制。
+        预览图本身按widget尺寸生成，上传时不再改变widget尺寸（set_widget_size=False）。
+        """
+        from kivy.graphics.texture import Texture
         
-        # 绘制周天环（最外层，始终显示）
-        if self.image_processor.centroid:
-            cx, cy = self.image_processor.centroid
-            img_height, img_width = img.shape[:2]
-            
-            # 周天度数盘半径达到图片最大范围
-            max_radius = min(cx, cy, img_width - cx, img_height - cy)
-            self._draw_zhoutian_ring_on_image(img, cx, cy, max_radius)
+        height, width = img.shape[:2]
+        print(f"图像尺寸: {width}x{height}")
+        texture = self.image_texture
+        created = texture is None or tuple(texture.size) != (width, height)
+        if created:
+            texture = Texture.create(size=(width, height), colorfmt='bgr')
+            texture.flip_vertical()
+            self.image_texture = texture
+            print("已创建显示纹理")
+        texture.blit_buffer(np.ascontiguousarray(img).reshape(-1), colorfmt='bgr', bufferfmt='ubyte')
         
-        # 叠加图形罗盘
-        if self.graphic_compass_enabled and self.graphic_compass_image is not None:
-            self._overlay_graphic_compass(img)
+        if 'image_widget' in self.ids:
+            image_widget = self.ids.image_widget
+            if created or image_widget.texture is not texture:
+                image_widget.texture = texture
+            if set_widget_size:
+                image_widget.size = (width, height)
+            # 复用的纹理对象内容变化不会触发属性更新，需要主动请求重绘
+            image_widget.canvas.ask_update()
+            print("图像纹理已设置")
+    
+    def _get_overlay_key(self, img, state, scale=1.0, origin=(0, 0)):
+        """罗盘叠加层的缓存键：叠加层尺寸、缩放比例、可见区域原点、质心、半径、旋转角度、字号和启用的罗盘圈"""
+        cx, cy = state['centroid']
+        img_height, img_width = self.image_processor.processed_image.shape[:2]
+        max_radius = min(cx, cy, img_width - cx, img_height - cy)
+        compass_manager = state['compass_manager']
+        compass_type = compass_manager.get_compass_type() if state['show_compass'] else None
+        return (
+            img.shape[:2],
+            scale,
+            origin,
+            (cx, cy),
+            max_radius,
+            compass_manager.get_rotation_angle(),
+            state['compass_fontsize'],
+            compass_type,
+            compass_manager.show_compass28,
+            compass_manager.show_xuankongda,
+        )
+    
+    def _render_compass_layer(self, layer, state, scale=1.0, origin=(0, 0)):
+        """把所有罗盘圈渲染到BGRA叠加层上
+
+        先绘制各圈的线条并登记文字命令，最后统一光栅化文字。
+        罗盘几何按原图坐标计算，再减去可见区域原点origin并按scale缩放到叠加层（预览图）上。
+        """
+        cx, cy = state['centroid']
+        img_height, img_width = self.image_processor.processed_image.shape[:2]
+        # 周天度数盘半径达到图片最大范围，其他罗盘圈使用相同的max_radius值
+        max_radius = min(cx, cy, img_width - cx, img_height - cy)
         
-        # 保存当前显示的图像（包含所有绘制元素）
-        self.displayed_image = img.copy()
+        start_time = time.perf_counter()
+        text_layer = self.text_layer
+        text_layer.clear()
+        text_layer.scale = scale
+        text_layer.origin = origin
         
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img_flipped = cv2.flip(img_rgb, 0)
+        if state['show_compass']:
+            self._draw_compass_on_image(layer, text_layer, state, scale, origin)
         
-        from kivy.core.image import Image as KivyImage
-        from kivy.graphics.texture import Texture
+        # 绘制28宿罗盘（独立显示，不依赖其他罗盘）
+        if state['compass_manager'].show_compass28:
+            self._draw_compass28_on_image(layer, text_layer, state, cx, cy, max_radius, scale, origin)
         
-        height, width, channels = img_flipped.shape
-        print(f"图像尺寸: {width}x{height}")
-        texture = Texture.create(size=(width, height), colorfmt='rgb')
-        texture.blit_buffer(img_flipped.flatten(), colorfmt='rgb', bufferfmt='ubyte')
+        # 绘制周天环（最外层，始终显示）
+        self._draw_zhoutian_ring_on_image(layer, text_layer, state, cx, cy, max_radius, scale, origin)
+        self.render_timings['overlay_lines'] = (time.perf_counter() - start_time) * 1000
         
-        print(f"ids: {self.ids}")
-        if 'image_widget' in self.ids:
-            self.ids.image_widget.texture = texture
-            self.ids.image_widget.size = (width, height)
-            print("图像纹理已设置")
+        # 一次性光栅化所有罗盘圈的文字
+        self.render_timings['overlay_text'] = text_layer.render(layer)
+        text_layer.clear()
     
-    def _draw_compass_on_image(self, img):
-        """在图像上绘制罗盘"""
-        if not self.image_processor.centroid:
+    def _draw_compass_on_image(self, img, text_layer, state, scale=1.0, origin=(0, 0)):
+        """在BGRA叠加层上绘制罗盘，文字登记到text_layer（几何按原图坐标计算，按origin和scale换算后绘制）"""
+        if not state['centroid']:
             return
         
-        cx, cy = self.image_processor.centroid
-        img_height, img_width = img.shape[:2]
+        cx, cy = state['centroid']
+        compass_manager = state['compass_manager']
+        img_height, img_width = self.image_processor.processed_image.shape[:2]
         line_length = min(img_width, img_height) * 0.6 * 0.75
         
         # 使用与周天度数环相同的max_radius值
@@ -863,215 +1247,67 @@ class MainScreen(Screen):
         lines, texts = self.image_processor.draw_compass(
             (cx, cy), line_length, max_radius, img_width, img_height,
             line_color=(255, 140, 0), text_color=(128, 0, 128),
-            linewidth=2.5, fontsize=16
+            linewidth=2.5, fontsize=state['compass_fontsize'], compass_manager=compass_manager
         )
         
-        for start, end in lines:
-            start = (int(start[0]), int(start[1]))
-            end = (int(end[0]), int(end[1]))
-            cv2.line(img, start, end, (255, 140, 0), 5)
+        # 24山/12支分割线（橙色）
+        render_segments(img, scale_segments(lines, scale, origin))
         
         # 绘制玄空大卦罗盘（附加罗盘）
-        if self.image_processor.compass_manager.show_xuankongda:
+        if compass_manager.show_xuankongda:
             # 使用与周天度数环相同的max_radius值
             max_radius = min(cx, cy, img_width - cx, img_height - cy)
             lines_xuankongda, texts_xuankongda, inner_radius_xuankongda, outer_radius_xuankongda = self.image_processor.draw_xuankongda(
                 (cx, cy), max_radius,
-                line_color=(0, 165, 255), text_color=(0, 0, 255),
-                linewidth=2.5, fontsize=14
+                line_color=(0, 191, 255), text_color=(0, 0, 255),
+                linewidth=2.5, fontsize=14, compass_manager=compass_manager
             )
             
-            # 绘制玄空大卦分隔线和刻度线
-            for line in lines_xuankongda:
-                if len(line) == 2:
-                    # 普通分隔线
-                    start, end = line
-                    thickness = 5
-                    color = (0, 191, 255)  # 亮蓝色 (BGR)
-                elif len(line) == 3:
-                    # 检查第三个元素的类型，判断是颜色还是粗细
-                    if isinstance(line[2], (tuple, list)):
-                        # 带颜色信息的刻度线
-                        start, end, line_color = line
-                        thickness = 2
-                        color = line_color  # 使用线自带的颜色
-                    else:
-                        # 带粗细信息的分隔线
-                        start, end, thickness = line
-                        thickness = int(thickness) * 2.5  # 应用2.5倍粗
-                        color = (0, 0, 255)  # 大红色 (BGR)
-                
-                start = (int(start[0]), int(start[1]))
-                end = (int(end[0]), int(end[1]))
-                cv2.line(img, start, end, color, thickness)
+            # 绘制玄空大卦刻度线（三圈各自的颜色）、卦间分隔线（亮蓝色）和每八卦的分隔线（大红色）
+            render_segments(img, scale_segments(lines_xuankongda, scale, origin))
             
-            # 绘制玄空大卦罗盘文字（使用PIL）
-            try:
-                from PIL import Image as PILImage, ImageDraw, ImageFont
-                
-                # 创建PIL图像
-                img_pil = PILImage.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-                draw = ImageDraw.Draw(img_pil)
-                
-                # 加载中文字体
-                try:
-                    font_outer = ImageFont.truetype('C:\\Windows\\Fonts\\simhei.ttf', 18)
-                    font_middle = ImageFont.truetype('C:\\Windows\\Fonts\\simhei.ttf', 16)
-                    font_inner = ImageFont.truetype('C:\\Windows\\Fonts\\simhei.ttf', 14)
-                except:
-                    font_outer = font_middle = font_inner = ImageFont.load_default()
-                
-                # 绘制玄空大卦罗盘文字
-                # 前64个是最外圈（卦名），中间64个是中圈（卦运），最后64个是内圈（五行）
-                for i, (x, y, label) in enumerate(texts_xuankongda):
-                    if i < 64:
-                        font = font_outer
-                    elif i < 128:
-                        font = font_middle
-                    else:
-                        font = font_inner
-                    
-                    # 计算文字大小
-                    bbox = draw.textbbox((0, 0), label, font=font)
-                    text_width = bbox[2] - bbox[0]
-                    text_height = bbox[3] - bbox[1]
-                    
-                    # 计算圆形半径（比文字稍大）
-                    radius = max(text_width, text_height) // 2 + 5
-                    
-                    # 绘制白色圆形背景
-                    draw.ellipse((int(x)-radius, int(y)-radius, int(x)+radius, int(y)+radius), fill=(255, 255, 255))
-                    
-                    # 绘制文字
-                    draw.text((int(x)-text_width//2, int(y)-text_height//2), label, font=font, fill=(0, 0, 255))
-                
-                # 将PIL图像转换回OpenCV格式
-                img[:, :, :] = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
-            except Exception as e:
-                print(f"绘制玄空大卦文字时出错: {e}")
-                import traceback
-                traceback.print_exc()
-                pass
+            # 玄空大卦罗盘文字：白色圆形背景，蓝色文字
+            # 前64个是最外圈（卦运），中间64个是中圈（卦名），最后64个是内圈（五行）
+            for i, (x, y, label) in enumerate(texts_xuankongda):
+                if i < 64:
+                    font_size = 18
+                elif i < 128:
+                    font_size = 16
+                else:
+                    font_size = 14
+                text_layer.add_label(x, y, label, font_size, (255, 0, 0), background=(255, 255, 255))
         
-        # 使用PIL绘制中文文字
-        try:
-            from PIL import Image as PILImage, ImageDraw, ImageFont
-            
-            # 创建PIL图像
-            img_pil = PILImage.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-            draw = ImageDraw.Draw(img_pil)
-            
-            # 加载中文字体
-            try:
-                font = ImageFont.truetype('C:\Windows\Fonts\simhei.ttf', 22)
-            except:
-                font = ImageFont.load_default()
-            
-            # 绘制文字
-            for x, y, label in texts:
-                try:
-                    # 计算文字大小
-                    bbox = draw.textbbox((0, 0), label, font=font)
-                    text_width = bbox[2] - bbox[0]
-                    text_height = bbox[3] - bbox[1]
-                    
-                    # 计算圆形半径（比文字稍大）
-                    radius = max(text_width, text_height) // 2 + 5
-                    
-                    # 绘制白色圆形背景
-                    draw.ellipse((int(x)-radius, int(y)-radius, int(x)+radius, int(y)+radius), fill=(255, 255, 255))
-                    
-                    # 绘制文字
-                    draw.text((int(x)-text_width//2, int(y)-text_height//2), label, font=font, fill=(128, 0, 128))
-                except Exception as e:
-                    print(f"绘制普通罗盘文字时出错: {e}")
-                    continue
-            
-            # 转换回OpenCV格式
-            img[:, :, :] = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
-        except Exception as e:
-            print(f"使用PIL绘制中文文字时出错: {e}")
-            # 如果PIL不可用或出错，使用英文标签
-            for x, y, label in texts:
-                try:
-                    # 绘制文字
-                    cv2.putText(img, label, (int(x)-10, int(y)+5), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (128, 0, 128), 2)
-                except Exception as e2:
-                    print(f"使用cv2绘制文字时出错: {e2}")
-                    continue
-    
-    def _draw_compass28_on_image(self, img, cx, cy, text_distance):
-        """在图像上绘制28宿罗盘"""
+        # 24山/12支文字：白色圆形背景，紫色文字
+        for x, y, label in texts:
+            text_layer.add_label(x, y, label, 22, (128, 0, 128), background=(255, 255, 255))
+    
+    def _draw_compass28_on_image(self, img, text_layer, state, cx, cy, text_distance, scale=1.0, origin=(0, 0)):
+        """在BGRA叠加层上绘制28宿罗盘，文字登记到text_layer（几何按原图坐标计算，按origin和scale换算后绘制）"""
         lines, texts, inner_radius, outer_radius = self.image_processor.draw_compass28(
             (cx, cy), text_distance,
-            line_color=(255, 140, 0), text_color=(128, 0, 128),
-            linewidth=2.5, fontsize=16
+            line_color=(128, 0, 128), text_color=(128, 0, 128),
+            linewidth=2.5, fontsize=state['compass_fontsize'], compass_manager=state['compass_manager']
         )
         
-        compass28 = self.image_processor.compass_manager.compass28
-        
         # 绘制内圆和外圆（紫色）
-        cv2.circle(img, (int(cx), int(cy)), int(inner_radius), (128, 0, 128), 5)
-        cv2.circle(img, (int(cx), int(cy)), int(outer_radius), (128, 0, 128), 5)
-        
-        # 获取旋转角度
-        rotation_angle = self.image_processor.get_rotation_angle()
+        center = (int((cx - origin[0]) * scale), int((cy - origin[1]) * scale))
+        cv2.circle(img, center, int(inner_radius * scale), (128, 0, 128, 255), scaled_thickness(5, scale))
+        cv2.circle(img, center, int(outer_radius * scale), (128, 0, 128, 255), scaled_thickness(5, scale))
         
         # 根据宿度数绘制分割线（紫色，加粗一倍）
-        for start_angle in compass28.start_angles:
-            angle_deg = start_angle - 90 + rotation_angle
-            angle_rad = np.deg2rad(angle_deg)
-            x1 = cx + inner_radius * np.cos(angle_rad)
-            y1 = cy + inner_radius * np.sin(angle_rad)
-            x2 = cx + outer_radius * np.cos(angle_rad)
-            y2 = cy + outer_radius * np.sin(angle_rad)
-            cv2.line(img, (int(x1), int(y1)), (int(x2), int(y2)), (128, 0, 128), 5)
-        
-        # 使用PIL绘制28宿文字
-        try:
-            from PIL import Image as PILImage, ImageDraw, ImageFont
-            
-            # 创建PIL图像
-            img_pil = PILImage.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-            draw = ImageDraw.Draw(img_pil)
-            
-            # 加载中文字体（稍小一些）
-            try:
-                font = ImageFont.truetype('C:\Windows\Fonts\simhei.ttf', 14)
-            except:
-                font = ImageFont.load_default()
-            
-            # 绘制文字（按照排序后的顺序）
-            for x, y, label in texts:
-                # 计算文字大小（字号缩小到75%）
-                bbox = draw.textbbox((0, 0), label, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                
-                # 计算圆形半径（比文字稍大）
-                radius = max(text_width, text_height) // 2 + 5
-                
-                # 绘制白色圆形背景
-                draw.ellipse((int(x)-radius, int(y)-radius, int(x)+radius, int(y)+radius), fill=(255, 255, 255))
-                
-                # 绘制紫色圈（字套圈）
-                draw.ellipse((int(x)-radius, int(y)-radius, int(x)+radius, int(y)+radius), outline=(128, 0, 128), width=2)
-                
-                # 绘制紫色文字
-                draw.text((int(x)-text_width//2, int(y)-text_height//2), label, font=font, fill=(128, 0, 128))
-            
-            # 转换回OpenCV格式
-            img[:, :, :] = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
-        except Exception as e:
-            print(f"使用PIL绘制28宿文字时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            pass
+        render_segments(img, scale_segments(lines, scale, origin))
+        
+        # 28宿文字：白色圆形背景，紫色字套圈，紫色文字（字号稍小）
+        for x, y, label in texts:
+            text_layer.add_label(x, y, label, 14, (128, 0, 128), background=(255, 255, 255),
+                                 outline=(128, 0, 128), outline_width=2)
     
-    def _overlay_graphic_compass(self, img):
-        """叠加图形罗盘"""
-        if self.graphic_compass_image is None:
+    def _overlay_graphic_compass(self, img, state, scale=1.0, origin=(0, 0)):
+        """叠加图形罗盘（img为原图中以origin为原点的区域按scale缩放后的图像，罗盘大小和位置按原图计算）
+        
+        图形罗盘的图像、旋转角度、缩放倍数和质心来自状态快照state，放置位置写回state['graphic_position']。
+        """
+        if state['graphic_image'] is None:
             print("图形罗盘图像为None，跳过叠加")
             return
         
@@ -1087,28 +1323,30 @@ class MainScreen(Screen):
         #         print(f"罗盘倍数输入错误: {self.ids.compass_scale_input.text}")
         #         pass
         
-        print(f"开始叠加图形罗盘，位置: {self.graphic_compass_position}, 旋转角度: {self.graphic_compass_rotation}")
+        print(f"开始叠加图形罗盘，位置: {state['graphic_position']}, 旋转角度: {state['graphic_rotation']}")
         print(f"背景图像形状: {img.shape}, 数据类型: {img.dtype}")
-        print(f"当前罗盘倍数因子: {self.compass_scale_factor:.2f}")
+        print(f"当前罗盘倍数因子: {state['graphic_scale_factor']:.2f}")
         
-        compass_img = self.graphic_compass_image.copy()
+        compass_img = state['graphic_image'].copy()
         h, w = compass_img.shape[:2]
         
         print(f"罗盘图像原始尺寸: {w}x{h}, 通道数: {compass_img.shape[2]}, 数据类型: {compass_img.dtype}")
         
         # 如果有旋转角度，进行旋转
-        if self.graphic_compass_rotation != 0:
-            print(f"应用旋转角度: {self.graphic_compass_rotation}")
+        if state['graphic_rotation'] != 0:
+            print(f"应用旋转角度: {state['graphic_rotation']}")
             center = (w // 2, h // 2)
-            rotation_matrix = cv2.getRotationMatrix2D(center, -self.graphic_compass_rotation, 1.0)
+            rotation_matrix = cv2.getRotationMatrix2D(center, -state['graphic_rotation'], 1.0)
             compass_img = cv2.warpAffine(compass_img, rotation_matrix, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0, 0))
         
-        # 计算质心位置
+        # 计算质心位置（预览图按原图尺寸计算，最后再缩放）
         img_h, img_w = img.shape[:2]
+        if (scale != 1.0 or origin != (0, 0)) and self.image_processor.processed_image is not None:
+            img_h, img_w = self.image_processor.processed_image.shape[:2]
         
         # 使用质心位置（如果有的话），否则使用背景图像的中心
-        if self.image_processor.centroid:
-            center_x, center_y = self.image_processor.centroid
+        if state['centroid']:
+            center_x, center_y = state['centroid']
             print(f"使用质心位置: ({center_x}, {center_y})")
         else:
             center_x, center_y = img_w // 2, img_h // 2
@@ -1126,7 +1364,7 @@ class MainScreen(Screen):
         print(f"当前图像尺寸: {img_w}x{img_h}, 面积: {current_area}")
         print(f"基准图像尺寸: {base_width}x{base_height}, 面积: {base_area}")
         print(f"面积比率: {area_ratio:.2f}")
-        print(f"用户缩放因子: {self.compass_scale_factor:.2f}")
+        print(f"用户缩放因子: {state['graphic_scale_factor']:.2f}")
         
         # 根据面积比率动态调整缩放因子
         # 面积越大，缩放因子越小；面积越小，缩放因子越大
@@ -1156,17 +1394,24 @@ class MainScreen(Screen):
             print("低分辨率图像，缩放因子: 1.0")
         
         # 应用用户缩放因子
-        scale_factor *= self.compass_scale_factor
+        scale_factor *= state['graphic_scale_factor']
         
         new_w = int(w * scale_factor)
         new_h = int(h * scale_factor)
-        compass_img = cv2.resize(compass_img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        print(f"罗盘图像原始尺寸: {w}x{h}, 缩放后尺寸: {new_w}x{new_h}")
         
         # 计算罗盘图像的放置位置（中心对齐到质心）
         x = center_x - new_w // 2
         y = center_y - new_h // 2
-        self.graphic_compass_position = (x, y)
+        state['graphic_position'] = (x, y)
+        
+        # 预览图或可见区域上按比例换算罗盘图像大小和放置位置
+        if scale != 1.0 or origin != (0, 0):
+            new_w = max(1, int(new_w * scale))
+            new_h = max(1, int(new_h * scale))
+            x = int((center_x - origin[0]) * scale) - new_w // 2
+            y = int((center_y - origin[1]) * scale) - new_h // 2
+        compass_img = cv2.resize(compass_img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        print(f"罗盘图像原始尺寸: {w}x{h}, 缩放后尺寸: {new_w}x{new_h}")
         
         print(f"罗盘图像最终位置: ({x}, {y}), 背景图像尺寸: {img_w}x{img_h}")
         
@@ -1217,194 +1462,181 @@ class MainScreen(Screen):
         
         print("图形罗盘叠加完成")
     
-    def _draw_zhoutian_ring_on_image(self, img, cx, cy, text_distance):
-        """在图像上绘制周天环（最外层）"""
+    def _draw_zhoutian_ring_on_image(self, img, text_layer, state, cx, cy, text_distance, scale=1.0, origin=(0, 0)):
+        """在BGRA叠加层上绘制周天环（最外层），文字登记到text_layer（几何按原图坐标计算，按origin和scale换算后绘制）"""
         lines, texts, inner_radius, outer_radius = self.image_processor.draw_zhoutian_ring(
-            (cx, cy), text_distance
+            (cx, cy), text_distance, compass_manager=state['compass_manager']
         )
         
         # 绘制360个细线刻度（亮红色）
-        for start, end in lines:
-            start = (int(start[0]), int(start[1]))
-            end = (int(end[0]), int(end[1]))
-            cv2.line(img, start, end, (255, 0, 0), 2)
+        render_segments(img, scale_segments(lines, scale, origin))
         
         # 绘制内外圆（亮红色）
-        cv2.circle(img, (int(cx), int(cy)), int(inner_radius), (255, 0, 0), 5)
-        cv2.circle(img, (int(cx), int(cy)), int(outer_radius), (255, 0, 0), 5)
+        center = (int((cx - origin[0]) * scale), int((cy - origin[1]) * scale))
+        cv2.circle(img, center, int(inner_radius * scale), (255, 0, 0, 255), scaled_thickness(5, scale))
+        cv2.circle(img, center, int(outer_radius * scale), (255, 0, 0, 255), scaled_thickness(5, scale))
         
-        # 使用PIL绘制度数标签（亮红色）
-        try:
-            from PIL import Image as PILImage, ImageDraw, ImageFont
-            
-            # 创建PIL图像
-            img_pil = PILImage.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-            draw = ImageDraw.Draw(img_pil)
-            
-            # 加载中文字体（稍小一些）
-            try:
-                font = ImageFont.truetype('C:\\Windows\\Fonts\\simhei.ttf', 16)
-            except:
-                font = ImageFont.load_default()
-            
-            # 绘制度数标签
-            for x, y, label in texts:
-                # 计算文字大小
-                bbox = draw.textbbox((0, 0), label, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                
-                # 绘制亮红色文字
-                draw.text((int(x)-text_width//2, int(y)-text_height//2), label, font=font, fill=(255, 0, 0))
-            
-            # 转换回OpenCV格式
-            img[:, :, :] = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
-        except ImportError:
-            pass
+        # 度数标签（亮红色文字，无背景）
+        for x, y, label in texts:
+            text_layer.add_label(x, y, label, 16, (0, 0, 255))
+    
+    def _begin_brush_preview(self, img_point, widget_point, display_size):
+        """开始一笔画笔预览：在image_widget画布上添加圆点和折线指令，不修改processed_image
+        
+        Args:
+            img_point: 起点的图像坐标
+            widget_point: 起点的widget坐标
+            display_size: 画笔在屏幕上的粗细（像素）
+        """
+        self._brush_points = [img_point]
+        if 'image_widget' not in self.ids:
+            return
+        radius = display_size / 2
+        b, g, r = self.brush_color
+        wx, wy = widget_point
+        group = InstructionGroup()
+        group.add(Color(r / 255, g / 255, b / 255, 1))
+        group.add(Ellipse(pos=(wx - radius, wy - radius), size=(display_size, display_size)))
+        self._brush_line = Line(points=[wx, wy], width=max(1, radius), cap='round', joint='round')
+        group.add(self._brush_line)
+        self.ids.image_widget.canvas.after.add(group)
+        self._brush_group = group
+    
+    def _extend_brush_preview(self, img_point, widget_point):
+        """向当前画笔预览追加一个轨迹点"""
+        self._brush_points.append(img_point)
+        if self._brush_line is not None:
+            self._brush_line.points = self._brush_line.points + list(widget_point)
+    
+    def _commit_brush_stroke(self):
+        """把画笔预览的整条轨迹一次性写入processed_image（历史记录已在按下时保存）"""
+        if self._brush_points:
+            rect = self.image_processor.apply_brush_polyline(self._brush_points, self.brush_color, self.brush_size)
+            print(f"画笔轨迹已写入图像: {len(self._brush_points)}个点, 区域: {rect}")
+        # 预览指令保留到包含这笔的新一帧显示后再移除，避免闪烁
+        if self._brush_group is not None:
+            self._committed_brush_groups.append((self.image_processor.image_version, self._brush_group))
+        self._brush_points = []
+        self._brush_line = None
+        self._brush_group = None
+    
+    def _clear_committed_brush_previews(self, image_version):
+        """移除已包含在显示帧（图像版本号为image_version）中的画笔预览指令"""
+        remaining = []
+        for version, group in self._committed_brush_groups:
+            if version <= image_version:
+                if 'image_widget' in self.ids:
+                    self.ids.image_widget.canvas.after.remove(group)
+            else:
+                remaining.append((version, group))
+        self._committed_brush_groups = remaining
+    
+    def _zoom_view(self, factor, pos):
+        """以窗口坐标pos处为中心缩放视口"""
+        if self._sync_view() and self.view.zoom_at(factor, pos[0], pos[1]):
+            print(f"视口缩放: {self.view.zoom:.2f}, 可见区域: {self.view.region}")
+            self.request_redraw(DIRTY_VIEW)
+    
+    def _begin_view_touch(self, touch):
+        """开始平移/双指缩放视口（双击恢复显示整幅图像）"""
+        if touch.is_double_tap:
+            self.view.reset()
+            self._view_touches.clear()
+            self.request_redraw(DIRTY_VIEW)
+            return
+        self._view_touches[touch.uid] = tuple(touch.pos)
+    
+    def _move_view_touch(self, touch):
+        """单指拖动平移视口，双指捏合缩放视口"""
+        if not self._sync_view():
+            return
+        last_pos = self._view_touches[touch.uid]
+        self._view_touches[touch.uid] = tuple(touch.pos)
+        if len(self._view_touches) == 1:
+            self.view.pan_by(touch.pos[0] - last_pos[0], touch.pos[1] - last_pos[1])
+        else:
+            # 以另一个触摸点为参照，按两点距离的变化缩放，按中点的移动平移
+            other_pos = next(pos for uid, pos in self._view_touches.items() if uid != touch.uid)
+            old_distance = np.hypot(last_pos[0] - other_pos[0], last_pos[1] - other_pos[1])
+            new_distance = np.hypot(touch.pos[0] - other_pos[0], touch.pos[1] - other_pos[1])
+            old_mid = ((last_pos[0] + other_pos[0]) / 2, (last_pos[1] + other_pos[1]) / 2)
+            new_mid = ((touch.pos[0] + other_pos[0]) / 2, (touch.pos[1] + other_pos[1]) / 2)
+            if old_distance > 0 and new_distance > 0:
+                self.view.zoom_at(new_distance / old_distance, old_mid[0], old_mid[1])
+            self.view.pan_by(new_mid[0] - old_mid[0], new_mid[1] - old_mid[1])
+        self.request_redraw(DIRTY_VIEW)
     
     def on_touch_down(self, touch):
         """触摸按下事件处理"""
-        if not self.drawing_mode and not self.graphic_compass_enabled:
-            super().on_touch_down(touch)
-            return
+        image_widget = self.ids.image_widget if 'image_widget' in self.ids else None
+        on_image = (image_widget is not None and image_widget.collide_point(*touch.pos)
+                    and self.image_processor.processed_image is not None)
         
+        # 鼠标滚轮缩放视口
         if touch.is_mouse_scrolling:
+            if on_image and touch.button in ('scrolldown', 'scrollup'):
+                self._zoom_view(WHEEL_ZOOM_STEP if touch.button == 'scrolldown' else 1 / WHEEL_ZOOM_STEP, touch.pos)
+                return True
+            if not self.drawing_mode and not self.graphic_compass_enabled:
+                return super().on_touch_down(touch)
             return
         
         # 检查是否点击了罗盘图像
-        if self.graphic_compass_enabled and self.graphic_compass_image is not None:
-            if 'image_widget' in self.ids:
-                image_widget = self.ids.image_widget
-                if image_widget.collide_point(*touch.pos):
-                    # 转换触摸坐标到图像坐标
-                    widget_pos = image_widget.pos
-                    widget_size = image_widget.size
-                    
-                    if self.image_processor.processed_image is not None:
-                        img_height, img_width = self.image_processor.processed_image.shape[:2]
-                        
-                        # 计算图像在widget中的实际显示区域（考虑保持比例）
-                        widget_width, widget_height = widget_size
-                        img_aspect = img_width / img_height
-                        widget_aspect = widget_width / widget_height
-                        
-                        if widget_aspect > img_aspect:
-                            display_height = widget_height
-                            display_width = display_height * img_aspect
-                        else:
-                            display_width = widget_width
-                            display_height = display_width / img_aspect
-                        
-                        offset_x = (widget_width - display_width) / 2
-                        offset_y = (widget_height - display_height) / 2
-                        
-                        scale_x = img_width / display_width
-                        scale_y = img_height / display_height
-                        
-                        img_x = int((touch.pos[0] - widget_pos[0] - offset_x) * scale_x)
-                        img_y = int(img_height - (touch.pos[1] - widget_pos[1] - offset_y) * scale_y)
-                        
-                        # 检查是否点击在罗盘图像上
-                        compass_x, compass_y = self.graphic_compass_position
-                        compass_h, compass_w = self.graphic_compass_image.shape[:2]
-                        
-                        if compass_x <= img_x <= compass_x + compass_w and compass_y <= img_y <= compass_y + compass_h:
-                            self.is_dragging_compass = True
-                            self.compass_drag_offset = (img_x - compass_x, img_y - compass_y)
-                            return
+        if self.graphic_compass_enabled and self.graphic_compass_image is not None and on_image:
+            img_x, img_y = self._touch_to_image(touch, clamp=False)
+            
+            # 检查是否点击在罗盘图像上
+            compass_x, compass_y = self.graphic_compass_position
+            compass_h, compass_w = self.graphic_compass_image.shape[:2]
+            
+            if compass_x <= img_x <= compass_x + compass_w and compass_y <= img_y <= compass_y + compass_h:
+                self.is_dragging_compass = True
+                self.compass_drag_offset = (img_x - compass_x, img_y - compass_y)
+                return
         
-        # 画笔模式
+        # 非画笔模式下在图像上拖动为平移视口
         if not self.drawing_mode:
+            if on_image:
+                self._begin_view_touch(touch)
+                return True
             super().on_touch_down(touch)
             return
         
-        if 'image_widget' in self.ids:
-            image_widget = self.ids.image_widget
-            if image_widget.collide_point(*touch.pos):
-                self.is_drawing = True
-                self.save_history()
-                
-                # 转换触摸坐标到图像坐标
-                widget_pos = image_widget.pos
-                widget_size = image_widget.size
-                
-                if self.image_processor.processed_image is not None:
-                    img_height, img_width = self.image_processor.processed_image.shape[:2]
-                    
-                    # 计算图像在widget中的实际显示区域（考虑保持比例）
-                    widget_width, widget_height = widget_size
-                    img_aspect = img_width / img_height
-                    widget_aspect = widget_width / widget_height
-                    
-                    if widget_aspect > img_aspect:
-                        # widget更宽，图像高度适配widget高度
-                        display_height = widget_height
-                        display_width = display_height * img_aspect
-                    else:
-                        # widget更高，图像宽度适配widget宽度
-                        display_width = widget_width
-                        display_height = display_width / img_aspect
-                    
-                    # 计算图像在widget中的偏移量
-                    offset_x = (widget_width - display_width) / 2
-                    offset_y = (widget_height - display_height) / 2
-                    
-                    # 计算缩放比例
-                    scale_x = img_width / display_width
-                    scale_y = img_height / display_height
-                    
-                    # 计算图像坐标（考虑Y轴翻转）
-                    img_x = int((touch.pos[0] - widget_pos[0] - offset_x) * scale_x)
-                    img_y = int(img_height - (touch.pos[1] - widget_pos[1] - offset_y) * scale_y)
-                    
-                    # 限制坐标在图像范围内
-                    img_x = max(0, min(img_width - 1, img_x))
-                    img_y = max(0, min(img_height - 1, img_y))
-                    
-                    self.last_x, self.last_y = img_x, img_y
-                    cv2.circle(self.image_processor.processed_image, (img_x, img_y), self.brush_size//2, self.brush_color, -1)
-                    self.update_image_display()
-            else:
-                super().on_touch_down(touch)
+        # 画笔模式
+        if image_widget is not None and image_widget.collide_point(*touch.pos):
+            self.is_drawing = True
+            self.save_history()
+            
+            # 转换触摸坐标到图像坐标（限制在图像范围内）
+            point = self._touch_to_image(touch)
+            if point is not None:
+                img_x, img_y = point
+                self.last_x, self.last_y = img_x, img_y
+                if self.gpu_brush_preview:
+                    self._begin_brush_preview((img_x, img_y), self.view.image_to_widget(img_x, img_y),
+                                              self.brush_size * self.view.display_scale)
+                else:
+                    self.image_processor.apply_brush_stroke((img_x, img_y), None, self.brush_color, self.brush_size)
+                    self.request_redraw(DIRTY_IMAGE)
+        else:
+            super().on_touch_down(touch)
     
     def on_touch_move(self, touch):
         """触摸移动事件处理"""
+        # 平移/缩放视口
+        if touch.uid in self._view_touches:
+            self._move_view_touch(touch)
+            return True
+        
         # 拖拽罗盘图像
         if self.is_dragging_compass and self.graphic_compass_image is not None:
-            if 'image_widget' in self.ids:
-                image_widget = self.ids.image_widget
-                if image_widget.collide_point(*touch.pos):
-                    # 转换触摸坐标到图像坐标
-                    widget_pos = image_widget.pos
-                    widget_size = image_widget.size
-                    
-                    if self.image_processor.processed_image is not None:
-                        img_height, img_width = self.image_processor.processed_image.shape[:2]
-                        
-                        # 计算图像在widget中的实际显示区域（考虑保持比例）
-                        widget_width, widget_height = widget_size
-                        img_aspect = img_width / img_height
-                        widget_aspect = widget_width / widget_height
-                        
-                        if widget_aspect > img_aspect:
-                            display_height = widget_height
-                            display_width = display_height * img_aspect
-                        else:
-                            display_width = widget_width
-                            display_height = display_width / img_aspect
-                        
-                        offset_x = (widget_width - display_width) / 2
-                        offset_y = (widget_height - display_height) / 2
-                        
-                        scale_x = img_width / display_width
-                        scale_y = img_height / display_height
-                        
-                        img_x = int((touch.pos[0] - widget_pos[0] - offset_x) * scale_x)
-                        img_y = int(img_height - (touch.pos[1] - widget_pos[1] - offset_y) * scale_y)
-                        
-                        # 更新罗盘图像位置
-                        self.graphic_compass_position = (img_x - self.compass_drag_offset[0], img_y - self.compass_drag_offset[1])
-                        self.update_image_display()
+            if 'image_widget' in self.ids and self.ids.image_widget.collide_point(*touch.pos):
+                point = self._touch_to_image(touch, clamp=False)
+                if point is not None:
+                    img_x, img_y = point
+                    # 更新罗盘图像位置
+                    self.graphic_compass_position = (img_x - self.compass_drag_offset[0], img_y - self.compass_drag_offset[1])
+                    self.request_redraw(DIRTY_GRAPHIC)
             return
         
         # 画笔模式
@@ -1412,54 +1644,28 @@ class MainScreen(Screen):
             super().on_touch_move(touch)
             return
         
-        if 'image_widget' in self.ids:
-            image_widget = self.ids.image_widget
-            if image_widget.collide_point(*touch.pos):
-                # 转换触摸坐标到图像坐标
-                widget_pos = image_widget.pos
-                widget_size = image_widget.size
-                
-                if self.image_processor.processed_image is not None:
-                    img_height, img_width = self.image_processor.processed_image.shape[:2]
-                    
-                    # 计算图像在widget中的实际显示区域（考虑保持比例）
-                    widget_width, widget_height = widget_size
-                    img_aspect = img_width / img_height
-                    widget_aspect = widget_width / widget_height
-                    
-                    if widget_aspect > img_aspect:
-                        # widget更宽，图像高度适配widget高度
-                        display_height = widget_height
-                        display_width = display_height * img_aspect
+        if 'image_widget' in self.ids and self.ids.image_widget.collide_point(*touch.pos):
+            # 转换触摸坐标到图像坐标（限制在图像范围内）
+            point = self._touch_to_image(touch)
+            if point is not None:
+                img_x, img_y = point
+                if self.last_x != -1 and self.last_y != -1:
+                    if self.gpu_brush_preview:
+                        self._extend_brush_preview((img_x, img_y), self.view.image_to_widget(img_x, img_y))
                     else:
-                        # widget更高，图像宽度适配widget宽度
-                        display_width = widget_width
-                        display_height = display_width / img_aspect
-                    
-                    # 计算图像在widget中的偏移量
-                    offset_x = (widget_width - display_width) / 2
-                    offset_y = (widget_height - display_height) / 2
-                    
-                    # 计算缩放比例
-                    scale_x = img_width / display_width
-                    scale_y = img_height / display_height
-                    
-                    # 计算图像坐标（考虑Y轴翻转）
-                    img_x = int((touch.pos[0] - widget_pos[0] - offset_x) * scale_x)
-                    img_y = int(img_height - (touch.pos[1] - widget_pos[1] - offset_y) * scale_y)
-                    
-                    # 限制坐标在图像范围内
-                    img_x = max(0, min(img_width - 1, img_x))
-                    img_y = max(0, min(img_height - 1, img_y))
-                    
-                    if self.last_x != -1 and self.last_y != -1:
-                        cv2.line(self.image_processor.processed_image, (self.last_x, self.last_y), (img_x, img_y), self.brush_color, self.brush_size)
-                        self.update_image_display()
-                    
-                    self.last_x, self.last_y = img_x, img_y
+                        self.image_processor.apply_brush_stroke((self.last_x, self.last_y), (img_x, img_y),
+                                                                self.brush_color, self.brush_size)
+                        self.request_redraw(DIRTY_IMAGE)
+                
+                self.last_x, self.last_y = img_x, img_y
     
     def on_touch_up(self, touch):
         """触摸释放事件处理"""
+        # 结束平移/缩放视口
+        if touch.uid in self._view_touches:
+            del self._view_touches[touch.uid]
+            return True
+        
         # 结束拖拽罗盘图像
         if self.is_dragging_compass:
             self.is_dragging_compass = False
@@ -1471,5 +1677,15 @@ class MainScreen(Screen):
             super().on_touch_up(touch)
             return
         
+        was_drawing = self.is_drawing
         self.is_drawing = False
-        self.last_x, self.last_y = -1, -1
\ No newline at end of file
+        self.last_x, self.last_y = -1, -1
+        
+        # 画笔预览的轨迹在松开时一次性写入图像；
+        # 逐段绘制时画笔过程中的轮廓和质心是增量近似结果，松开后完整检测一次
+        if was_drawing:
+            if self.gpu_brush_preview:
+                self._commit_brush_stroke()
+            self.image_processor.finish_brush_edits()
+            self.update_history_usage()
+            self.request_redraw(DIRTY_IMAGE)
\ No newline at end of file
@@ -0,0 +1,143 @@
+import math
+
+
+class ViewTransform:
+    """图像视口变换
+
+    描述processed_image的哪个区域（可见区域）显示在image_widget中，以及widget坐标与图像坐标之间的换算。
+    zoom为1时显示整幅图像（与Image控件保持比例拉伸显示整图一致），放大后可见区域随之缩小，
+    center为可见区域中心的图像坐标。可见区域按整数像素取整，显示时由Image控件按比例居中拉伸，
+    换算参数按（图像尺寸、widget位置和尺寸、zoom、center）缓存，输入不变时不重新计算。
+    """
+
+    MIN_ZOOM = 1.0
+    MAX_ZOOM = 64.0
+
+    def __init__(self):
+        self.image_size = None
+        self.widget_pos = (0, 0)
+        self.widget_size = (1, 1)
+        self.zoom = 1.0
+        self.center = None
+        self._cache_key = None
+        self._region = None
+        self._offset = (0.0, 0.0)
+        self._display_scale = 1.0
+
+    @property
+    def is_valid(self):
+        """是否已知图像尺寸和有效的widget尺寸"""
+        return self.image_size is not None and self.widget_size[0] > 1 and self.widget_size[1] > 1
+
+    def set_image_size(self, width, height):
+        """设置图像尺寸，尺寸变化时恢复为显示整幅图像"""
+        if self.image_size != (width, height):
+            self.image_size = (width, height)
+            self.reset()
+
+    def set_widget_rect(self, pos, size):
+        """设置image_widget的位置和尺寸（窗口坐标）"""
+        self.widget_pos = (pos[0], pos[1])
+        self.widget_size = (size[0], size[1])
+
+    def reset(self):
+        """恢复为显示整幅图像"""
+        self.zoom = 1.0
+        self.center = None
+
+    def _update(self):
+        """按当前输入重新计算可见区域和换算参数（输入不变时直接使用缓存）"""
+        key = (self.image_size, self.widget_pos, self.widget_size, self.zoom, self.center)
+        if key == self._cache_key:
+            return
+
+        img_width, img_height = self.image_size
+        widget_width, widget_height = self.widget_size
+        scale = min(widget_width / img_width, widget_height / img_height) * self.zoom
+        view_width = min(img_width, widget_width / scale)
+        view_height = min(img_height, widget_height / scale)
+
+        # 可见区域中心限制在图像范围内，不显示图像以外的空白
+        cx, cy = self.center if self.center is not None else (img_width / 2, img_height / 2)
+        cx = min(max(cx, view_width / 2), img_width - view_width / 2)
+        cy = min(max(cy, view_height / 2), img_height - view_height / 2)
+        self.center = (cx, cy)
+
+        x0 = max(0, int(math.floor(cx - view_width / 2)))
+        y0 = max(0, int(math.floor(cy - view_height / 2)))
+        x1 = min(img_width, max(x0 + 1, int(math.ceil(cx + view_width / 2))))
+        y1 = min(img_height, max(y0 + 1, int(math.ceil(cy + view_height / 2))))
+        self._region = (x0, y0, x1, y1)
+
+        # 与Image控件一致：可见区域按比例拉伸并在widget中居中
+        region_width, region_height = x1 - x0, y1 - y0
+        self._display_scale = min(widget_width / region_width, widget_height / region_height)
+        self._offset = ((widget_width - region_width * self._display_scale) / 2,
+                        (widget_height - region_height * self._display_scale) / 2)
+        self._cache_key = (self.image_size, self.widget_pos, self.widget_size, self.zoom, self.center)
+
+    @property
+    def region(self):
+        """可见区域 (x0, y0, x1, y1)，图像坐标"""
+        self._update()
+        return self._region
+
+    @property
+    def display_scale(self):
+        """显示比例：每个图像像素在屏幕上占的像素数"""
+        self._update()
+        return self._display_scale
+
+    def widget_to_image(self, x, y, clamp=True):
+        """把窗口坐标换算为图像坐标（Y轴翻转），clamp为True时限制在图像范围内
+
+        Returns:
+            tuple: 整数图像坐标 (img_x, img_y)
+        """
+        self._update()
+        x0, y0, x1, y1 = self._region
+        img_x = int(x0 + (x - self.widget_pos[0] - self._offset[0]) / self._display_scale)
+        img_y = int(y1 - (y - self.widget_pos[1] - self._offset[1]) / self._display_scale)
+        if clamp:
+            img_width, img_height = self.image_size
+            img_x = max(0, min(img_width - 1, img_x))
+            img_y = max(0, min(img_height - 1, img_y))
+        return img_x, img_y
+
+    def image_to_widget(self, img_x, img_y):
+        """把图像像素（取像素中心）换算为窗口坐标"""
+        self._update()
+        x0, y0, x1, y1 = self._region
+        x = self.widget_pos[0] + self._offset[0] + (img_x + 0.5 - x0) * self._display_scale
+        y = self.widget_pos[1] + self._offset[1] + (y1 - img_y - 0.5) * self._display_scale
+        return x, y
+
+    def zoom_at(self, factor, x, y):
+        """以窗口坐标 (x, y) 处的图像点为不动点缩放
+
+        Returns:
+            bool: 缩放比例是否发生变化
+        """
+        self._update()
+        zoom = min(max(self.zoom * factor, self.MIN_ZOOM), self.MAX_ZOOM)
+        if zoom == self.zoom:
+            return False
+
+        x0, y0, x1, y1 = self._region
+        anchor_x = x0 + (x - self.widget_pos[0] - self._offset[0]) / self._display_scale
+        anchor_y = y1 - (y - self.widget_pos[1] - self._offset[1]) / self._display_scale
+
+        img_width, img_height = self.image_size
+        widget_width, widget_height = self.widget_size
+        scale = min(widget_width / img_width, widget_height / img_height) * zoom
+        dx = x - (self.widget_pos[0] + widget_width / 2)
+        dy = y - (self.widget_pos[1] + widget_height / 2)
+        self.zoom = zoom
+        self.center = (anchor_x - dx / scale, anchor_y + dy / scale)
+        return True
+
+    def pan_by(self, dx, dy):
+        """按屏幕像素平移可见区域（与手指移动方向一致）"""
+        self._update()
+        cx, cy = self.center
+        self.center = (cx - dx / self._display_scale, cy + dy / self._display_scale)
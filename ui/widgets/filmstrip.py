@@ -0,0 +1,182 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import Clock
+from kivy.graphics import Color, Line
+from kivy.properties import BooleanProperty, StringProperty
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.image import Image
+from kivy.uix.label import Label
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+
+from core.thumbnail_cache import ThumbnailCache
+
+# 胶片条中每个缩略图的宽度（像素）
+FILMSTRIP_ITEM_WIDTH = 120
+# 生成缩略图的后台线程数
+THUMBNAIL_WORKERS = 2
+
+
+class FilmstripItem(RecycleDataViewBehavior, ButtonBehavior, BoxLayout):
+    """胶片条中的一个缩略图（RecycleView复用的视图）"""
+
+    source = StringProperty('')
+    text = StringProperty('')
+    selected = BooleanProperty(False)
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation='vertical', padding=2, spacing=2, **kwargs)
+        self.index = None
+        self.filmstrip = None
+        self.image = Image(allow_stretch=True, keep_ratio=True)
+        self.label = Label(size_hint_y=None, height=18, font_size='11sp', font_name='SimHei',
+                           shorten=True, shorten_from='center')
+        self.label.bind(size=lambda label, size: setattr(label, 'text_size', size))
+        self.add_widget(self.image)
+        self.add_widget(self.label)
+        with self.canvas.after:
+            self._border_color = Color(1, 0.6, 0, 0)
+            self._border = Line(width=1.5)
+        self.bind(pos=self._update_border, size=self._update_border, selected=self._update_border)
+
+    def _update_border(self, *args):
+        self._border.rectangle = (self.x + 1, self.y + 1, self.width - 2, self.height - 2)
+        self._border_color.a = 1 if self.selected else 0
+
+    def on_source(self, item, source):
+        self.image.source = source
+
+    def on_text(self, item, text):
+        self.label.text = text
+
+    def refresh_view_attrs(self, rv, index, data):
+        """RecycleView把第index条数据绑定到这个视图时调用，没有缩略图时请求生成"""
+        self.index = index
+        self.filmstrip = rv
+        result = super().refresh_view_attrs(rv, index, data)
+        if not data['source']:
+            rv.request_thumbnail(index)
+        return result
+
+    def on_release(self):
+        if self.filmstrip is not None and self.index is not None:
+            self.filmstrip.select_index(self.index)
+
+
+class Filmstrip(RecycleView):
+    """当前目录的缩略图胶片条
+
+    RecycleView只为可见的缩略图创建视图，可见视图绑定数据时才请求缩略图，
+    缩略图由后台线程池查找或生成并保存在ThumbnailCache中，完成后放入队列，
+    由Clock在主线程一次取出队列中所有完成的缩略图并只刷新一次。
+    点击缩略图时派发on_select事件，参数为图像路径。
+    """
+
+    __events__ = ('on_select',)
+
+    def __init__(self, thumbnail_cache=None, **kwargs):
+        super().__init__(**kwargs)
+        self.thumbnail_cache = thumbnail_cache if thumbnail_cache is not None else ThumbnailCache()
+        self.viewclass = FilmstripItem
+        self.do_scroll_y = False
+        self.bar_width = 6
+        self.scroll_type = ['bars', 'content']
+        layout = RecycleBoxLayout(orientation='horizontal', default_size=(FILMSTRIP_ITEM_WIDTH, None),
+                                  default_size_hint=(None, 1), size_hint=(None, 1), spacing=4)
+        layout.bind(minimum_width=layout.setter('width'))
+        self.add_widget(layout)
+        self.dir_path = None
+        self.files = []
+        self.selected_index = None
+        self._executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+        self._requested = set()
+        # 后台完成的缩略图 (目录, 序号, 路径, future)，由_apply_thumbnails在主线程批量更新
+        self._ready = deque()
+        self._apply_trigger = Clock.create_trigger(self._apply_thumbnails)
+
+    def show_folder(self, dir_path, files, current_path=None):
+        """显示目录中的图像（files为按显示顺序排列的文件名），并选中current_path
+
+        目录和文件列表不变时只更新选中项。缩略图一律在可见时由后台线程查找（不在主线程访问磁盘）。
+        """
+        if dir_path != self.dir_path or files != self.files:
+            self.dir_path = dir_path
+            self.files = list(files)
+            self.selected_index = None
+            self._requested.clear()
+            self.data = [{'path': os.path.join(dir_path, name), 'text': name, 'selected': False, 'source': ''}
+                         for name in self.files]
+        index = None
+        if current_path is not None:
+            name = os.path.basename(current_path)
+            index = next((i for i, file_name in enumerate(self.files) if file_name == name), None)
+        self._set_selected(index)
+        if index is not None:
+            self.scroll_to_index(index)
+
+    def _set_selected(self, index):
+        if index == self.selected_index:
+            return
+        for i in (self.selected_index, index):
+            if i is not None and i < len(self.data):
+                self.data[i]['selected'] = i == index
+        self.selected_index = index
+        self.refresh_from_data()
+
+    def scroll_to_index(self, index):
+        """把第index个缩略图滚动到可见范围的中间"""
+        content_width = len(self.data) * (FILMSTRIP_ITEM_WIDTH + 4)
+        if content_width <= self.width:
+            return
+        center = index * (FILMSTRIP_ITEM_WIDTH + 4) + FILMSTRIP_ITEM_WIDTH / 2
+        self.scroll_x = min(1.0, max(0.0, (center - self.width / 2) / (content_width - self.width)))
+
+    def select_index(self, index):
+        """点击第index个缩略图"""
+        if 0 <= index < len(self.data):
+            self._set_selected(index)
+            self.dispatch('on_select', self.data[index]['path'])
+
+    def on_select(self, path):
+        pass
+
+    def request_thumbnail(self, index):
+        """请求在后台获取第index个缩略图：已缓存时直接返回路径，否则生成（已请求过的不重复提交）"""
+        path = self.data[index]['path']
+        if path in self._requested:
+            return
+        self._requested.add(path)
+        dir_path = self.dir_path
+        future = self._executor.submit(self.thumbnail_cache.get_or_create, path)
+        future.add_done_callback(lambda f: self._thumbnail_ready(dir_path, index, path, f))
+
+    def _thumbnail_ready(self, dir_path, index, path, future):
+        """缩略图完成（在工作线程调用）：放入队列，等主线程批量更新"""
+        self._ready.append((dir_path, index, path, future))
+        self._apply_trigger()
+
+    def _apply_thumbnails(self, dt):
+        """在主线程更新队列中所有完成的缩略图（期间切换了目录的丢弃），最后只刷新一次"""
+        changed = False
+        while self._ready:
+            dir_path, index, path, future = self._ready.popleft()
+            if dir_path != self.dir_path or index >= len(self.data) or self.data[index]['path'] != path:
+                continue
+            try:
+                source = future.result()
+            except Exception as e:
+                print(f"生成缩略图出错: {e}")
+                continue
+            if source:
+                self.data[index]['source'] = source
+                changed = True
+        if changed:
+            self.refresh_from_data()
+
+    def shutdown(self):
+        """丢弃尚未开始的缩略图任务并关闭线程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)